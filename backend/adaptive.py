@@ -0,0 +1,272 @@
+"""
+PowerGPT Adaptive Sample-Size Re-estimation
+===========================================
+Conditional power at an interim look and the re-estimated second-stage
+sample size under the Cui-Hung-Wang (CHW) and Mehta-Pocock (promising
+zone) rules.
+
+A trial planned with N subjects per group is analysed after n1 per group
+(information fraction t = n1 / N), giving the interim statistic Z1,
+oriented so that positive values favour the planned effect. With a
+standardized effect e (Cohen's d, or the arcsine difference h for
+proportions), a stage of n subjects per group has Z ~ N(e sqrt(g n), 1),
+where g = 1/2 for two groups and 1 for paired or one-sample designs.
+
+- CHW keeps the planned weights: Z = sqrt(t) Z1 + sqrt(1 - t) Z2, whatever
+  the second-stage size n2. The type I error is preserved for any rule,
+  and the conditional power is
+  Phi(e sqrt(g n2) - (c - sqrt(t) Z1) / sqrt(1 - t)).
+- Mehta-Pocock uses the conventional statistic on all n1 + n2 subjects,
+  and increases n2 only in the promising zone. The zone is where the
+  conditional power at the planned n2 lies between cp_min and the target.
+  The conventional test is valid when its conditional type I error after
+  the increase does not exceed the planned one. By default cp_min is the
+  smallest conditional power for which that holds, found on a fine Z1
+  grid as Mehta and Pocock (2011) do.
+
+In both rules, n2 is the smallest size reaching the target conditional power
+under the observed effect, between the planned n2 and the cap. The
+decision surface evaluates every interim Z1 on a grid against every
+candidate n2 with array operations. c = z_{1 - alpha} with one-sided alpha 0.025,
+matching the two-sided 5% level of the fixed-sample endpoints.
+"""
+
+import math
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+from scipy.special import ndtr, ndtri
+
+ALPHA = 0.025
+
+
+def _arcsine(parameters: Dict[str, float]) -> float:
+    return 2 * math.asin(math.sqrt(parameters["p1"])) - 2 * math.asin(math.sqrt(parameters["p2"]))
+
+
+# Test -> (g, standardized effect from that test's parameters or the interim summaries)
+ADAPTIVE_TESTS = {
+    "two_sample_t_test": (0.5, lambda parameters: parameters["delta"] / parameters["sd"]),
+    "two_proportions_test": (0.5, _arcsine),
+    "paired_T_test": (1.0, lambda parameters: parameters["d"]),
+    "one_mean_T_test": (1.0, lambda parameters: parameters["d"]),
+}
+
+# Interim statistics of the decision surface, and the finer grid used to derive cp_min
+SURFACE_Z = np.linspace(-1.0, 4.0, 51)
+CP_MIN_Z = np.linspace(-1.0, 6.0, 2801)
+
+# Bisection steps on log n2 when solving for the target conditional power
+BISECTIONS = 50
+
+
+class InterimLook:
+    """The planned design and the interim data, on the standardized scale"""
+
+    def __init__(self, planned_n: float, n1: float, z1: float, group_factor: float = 0.5,
+                 planned_effect: Optional[float] = None, max_n: Optional[float] = None):
+        """
+        Args:
+            planned_n: Planned sample size per group
+            n1: Sample size per group at the interim look
+            z1: Interim statistic, positive in the planned direction
+            group_factor: g; 1/2 for two-group designs, 1 for paired / one-sample designs
+            planned_effect: Standardized effect the trial was powered for
+            max_n: Cap on the total sample size per group (default twice the planned one)
+        """
+        if not 0 < n1 < planned_n:
+            raise ValueError("The interim sample size must be positive and below the planned sample size")
+        self.planned_n = planned_n
+        self.n1 = n1
+        self.z1 = z1
+        self.group_factor = group_factor
+        self.planned_effect = planned_effect
+        self.max_n = max_n if max_n is not None else 2 * planned_n
+        if self.max_n < planned_n:
+            raise ValueError("max_n cannot be below the planned sample size")
+        self.critical = float(ndtri(1 - ALPHA))
+
+    @property
+    def fraction(self) -> float:
+        return self.n1 / self.planned_n
+
+    @property
+    def planned_n2(self) -> float:
+        return self.planned_n - self.n1
+
+    @property
+    def max_n2(self) -> float:
+        return self.max_n - self.n1
+
+    def observed_effect(self, z1=None):
+        """Standardized effect estimated from the interim statistic"""
+        z1 = self.z1 if z1 is None else z1
+        return np.asarray(z1) / math.sqrt(self.group_factor * self.n1)
+
+    def weighted_cp(self, n2, effect, z1=None) -> np.ndarray:
+        """Conditional power of the CHW (fixed-weight inverse normal) test, broadcast over n2 / effect / z1"""
+        z1 = self.z1 if z1 is None else np.asarray(z1)
+        t = self.fraction
+        needed = (self.critical - math.sqrt(t) * z1) / math.sqrt(1 - t)
+        return ndtr(effect * np.sqrt(self.group_factor * np.asarray(n2)) - needed)
+
+    def conventional_cp(self, n2, effect, z1=None) -> np.ndarray:
+        """Conditional power of the conventional test on all n1 + n2 subjects per group"""
+        z1 = self.z1 if z1 is None else np.asarray(z1)
+        n2 = np.asarray(n2, dtype=float)
+        needed = (self.critical * np.sqrt(self.n1 + n2) - math.sqrt(self.n1) * z1) / np.sqrt(n2)
+        return ndtr(effect * np.sqrt(self.group_factor * n2) - needed)
+
+    def planned_error(self, z1=None) -> np.ndarray:
+        """Conditional type I error of the planned design (equal for both statistics at the planned n2)"""
+        return self.weighted_cp(self.planned_n2, 0.0, z1)
+
+    def solve_n2(self, cp, target: float, effect, z1) -> np.ndarray:
+        """Smallest n2 in [planned n2, max n2] with ``cp(n2, effect, z1) >= target``; max n2 when out of reach"""
+        effect, z1 = np.broadcast_arrays(np.asarray(effect, dtype=float), np.asarray(z1, dtype=float))
+        low = np.full(effect.shape, math.log(self.planned_n2))
+        high = np.full(effect.shape, math.log(self.max_n2)) if self.max_n2 > self.planned_n2 else low.copy()
+        reached_planned = cp(self.planned_n2, effect, z1) >= target
+        for _ in range(BISECTIONS):
+            middle = (low + high) / 2
+            short = cp(np.exp(middle), effect, z1) < target
+            low = np.where(short, middle, low)
+            high = np.where(short, high, middle)
+        n2 = np.ceil(np.exp(high) - 1e-9)
+        return np.where(reached_planned, self.planned_n2, np.minimum(n2, self.max_n2))
+
+
+def promising_zone_minimum(look: InterimLook, target: float) -> float:
+    """
+    Smallest conditional power at the planned n2 from which the Mehta-Pocock increase keeps the
+    conventional test valid (its conditional error after the increase at most the planned one)
+    """
+    z1 = CP_MIN_Z
+    effect = look.observed_effect(z1)
+    cp_planned = look.conventional_cp(look.planned_n2, effect, z1)
+    n2 = look.solve_n2(look.conventional_cp, target, effect, z1)
+    valid = look.conventional_cp(n2, 0.0, z1) <= look.planned_error(z1) * (1 + 1e-9)
+    # Only interims below the target need an increase; the zone must be valid up to the target
+    below = cp_planned < target
+    invalid = below & ~valid
+    if not invalid.any():
+        return float(cp_planned[below].min()) if below.any() else target
+    start = np.flatnonzero(invalid).max() + 1
+    rest = below[start:]
+    return float(cp_planned[start:][rest].min()) if rest.any() else target
+
+
+def _decision(look: InterimLook, z1, target: float, cp_min: float) -> Dict[str, np.ndarray]:
+    """Both rules' second-stage sizes and the quantities behind them, for arrays of interim statistics"""
+    z1 = np.asarray(z1, dtype=float)
+    effect = look.observed_effect(z1)
+    cp_planned = look.conventional_cp(look.planned_n2, effect, z1)
+    chw_n2 = look.solve_n2(look.weighted_cp, target, effect, z1)
+    zone = np.where(cp_planned < cp_min, "unfavourable", np.where(cp_planned < target, "promising", "favourable"))
+    mp_n2 = np.where(zone == "promising", look.solve_n2(look.conventional_cp, target, effect, z1),
+                     look.planned_n2)
+    return {
+        "z1": z1,
+        "effect": effect,
+        "cp_planned_n": cp_planned,
+        "cp_planned_effect": (look.weighted_cp(look.planned_n2, look.planned_effect, z1)
+                              if look.planned_effect is not None else np.full(z1.shape, np.nan)),
+        "zone": zone,
+        "chw_n2": chw_n2,
+        "chw_cp": look.weighted_cp(chw_n2, effect, z1),
+        "mehta_pocock_n2": mp_n2,
+        "mehta_pocock_cp": look.conventional_cp(mp_n2, effect, z1),
+        "conventional_test_valid": look.conventional_cp(mp_n2, 0.0, z1) <= look.planned_error(z1) * (1 + 1e-9),
+    }
+
+
+def _rows(decision: Dict[str, np.ndarray], n1: float) -> list:
+    rows = []
+    for i in range(decision["z1"].size):
+        row = {}
+        for name, values in decision.items():
+            value = values[i]
+            if isinstance(value, (np.bool_, bool)):
+                row[name] = bool(value)
+            elif isinstance(value, str):
+                row[name] = str(value)
+            else:
+                row[name] = None if np.isnan(value) else float(value)
+        row["chw_n"] = n1 + row["chw_n2"]
+        row["mehta_pocock_n"] = n1 + row["mehta_pocock_n2"]
+        rows.append(row)
+    return rows
+
+
+def interim_look(test: str, planned: Dict[str, Any], planned_n: float, interim: Dict[str, Any],
+                 max_n: Optional[float] = None) -> InterimLook:
+    """
+    The interim look of a fixed-sample design of one of ADAPTIVE_TESTS
+
+    Args:
+        test: The test the trial was planned with
+        planned: That test's parameters (the planned effect)
+        planned_n: Planned sample size per group (pairs, subjects)
+        interim: n1 and either z (signed like the effect) or the observed effect in the test's own
+            parameters: delta and sd, p1 and p2, or d
+        max_n: Cap on the total sample size per group
+    """
+    if test not in ADAPTIVE_TESTS:
+        raise ValueError(f"Sample-size re-estimation is available for: {', '.join(ADAPTIVE_TESTS)}")
+    group_factor, effect = ADAPTIVE_TESTS[test]
+    planned_effect = effect(planned)
+    if planned_effect == 0:
+        raise ValueError("The planned effect must be non-zero")
+    direction = 1.0 if planned_effect > 0 else -1.0
+    n1 = interim["n1"]
+    if interim.get("z") is not None:
+        z1 = direction * interim["z"]
+    else:
+        try:
+            z1 = direction * effect(interim) * math.sqrt(group_factor * n1)
+        except (KeyError, TypeError):
+            raise ValueError(f"The interim data needs z or the observed effect in {test}'s parameters")
+    return InterimLook(planned_n, n1, z1, group_factor, abs(planned_effect), max_n)
+
+
+def reestimate(look: InterimLook, target: float, cp_min: Optional[float] = None,
+               second_stage_sizes: Optional[Sequence[float]] = None) -> Dict[str, Any]:
+    """
+    Conditional power, both rules' re-estimated sample sizes and the decision surface
+
+    Args:
+        look: Planned design and interim data
+        target: Target conditional power
+        cp_min: Lower end of the Mehta-Pocock promising zone (default: the smallest valid one)
+        second_stage_sizes: Candidate n2 of the conditional power surface (default: 25 sizes from the
+            planned n2 to the cap)
+    """
+    if cp_min is None:
+        cp_min = promising_zone_minimum(look, target)
+    if second_stage_sizes is None:
+        second_stage_sizes = np.unique(np.ceil(np.linspace(look.planned_n2, look.max_n2, 25)))
+    sizes = np.asarray(second_stage_sizes, dtype=float)
+    if sizes.size == 0 or np.any(sizes <= 0):
+        raise ValueError("second_stage_sizes must be positive")
+
+    interim = _rows(_decision(look, np.array([look.z1]), target, cp_min), look.n1)[0]
+    surface_z = SURFACE_Z[:, None]
+    surface_effect = look.observed_effect(surface_z)
+    return {
+        "planned_n": look.planned_n,
+        "n1": look.n1,
+        "information_fraction": look.fraction,
+        "max_n": look.max_n,
+        "target_conditional_power": target,
+        "promising_zone": [cp_min, target],
+        "critical_value": look.critical,
+        "interim": interim,
+        "decision_surface": _rows(_decision(look, SURFACE_Z, target, cp_min), look.n1),
+        "conditional_power_surface": {
+            "z1": SURFACE_Z.tolist(),
+            "n2": sizes.tolist(),
+            # rows: interim statistic; columns: second-stage size; observed effect
+            "chw": look.weighted_cp(sizes[None, :], surface_effect, surface_z).tolist(),
+            "conventional": look.conventional_cp(sizes[None, :], surface_effect, surface_z).tolist(),
+        },
+    }
@@ -0,0 +1,188 @@
+"""
+PowerGPT Admission Control
+==========================
+Per-lane concurrency limits, bounded wait queues and load shedding.
+
+Expensive routes are assigned to lanes. Each lane admits a fixed number of
+concurrent requests and queues a bounded number of others. A request is
+shed with 429 and a Retry-After header when the queue is full, when the
+queue delay predicted from the lane's measured service time exceeds the
+lane's budget, or when it actually waits longer than that budget.
+
+R-backed computations and /ai/query use separate lanes, so a flood of AI
+queries only ever fills the AI lane and cannot delay the statistical
+endpoints. Routes outside every lane are never queued.
+"""
+
+import asyncio
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+
+
+class LoadShedError(Exception):
+    """Raised when a lane refuses a request"""
+
+    def __init__(self, lane: str, reason: str, retry_after: float):
+        super().__init__(f"{lane} lane overloaded: {reason}")
+        self.lane = lane
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Lane:
+    """A concurrency limit with a bounded, delay-aware wait queue"""
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, max_wait: float, ewma_alpha: float = 0.2):
+        """
+        Args:
+            name: Lane name used in responses and metrics
+            max_concurrency: Requests processed at the same time
+            max_queue: Requests allowed to wait for a slot
+            max_wait: Longest queue delay (seconds) a request may be expected to, or actually, wait
+            ewma_alpha: Smoothing factor for the measured wait and service times
+        """
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.ewma_alpha = ewma_alpha
+        self.active = 0
+        self.waiting = 0
+        self.ewma_wait = 0.0
+        self.ewma_service = 0.0
+        self.admitted = 0
+        self.shed = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @classmethod
+    def from_env(cls, name: str, max_concurrency: int, max_queue: int, max_wait: float) -> "Lane":
+        """Build a lane whose defaults can be overridden with POWERGPT_<NAME>_* variables"""
+        prefix = f"POWERGPT_{name.upper()}_"
+        return cls(
+            name,
+            max_concurrency=int(os.getenv(prefix + "CONCURRENCY", str(max_concurrency))),
+            max_queue=int(os.getenv(prefix + "QUEUE", str(max_queue))),
+            max_wait=float(os.getenv(prefix + "MAX_WAIT", str(max_wait))),
+        )
+
+    def _smooth(self, previous: float, sample: float) -> float:
+        return sample if previous == 0.0 else previous + self.ewma_alpha * (sample - previous)
+
+    def estimated_wait(self) -> float:
+        """Expected queue delay for a request arriving now"""
+        if self.active < self.max_concurrency:
+            return 0.0
+        return (self.waiting + 1) * self.ewma_service / self.max_concurrency
+
+    def _retry_after(self) -> float:
+        return max(1.0, self.estimated_wait())
+
+    def _reject(self, reason: str):
+        self.shed += 1
+        raise LoadShedError(self.name, reason, self._retry_after())
+
+    async def acquire(self):
+        """Wait for a slot or raise LoadShedError"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self.waiting == 0 and not self._semaphore.locked():
+            await self._semaphore.acquire()
+        else:
+            if self.waiting >= self.max_queue:
+                self._reject("queue full")
+            if self.estimated_wait() > self.max_wait:
+                self._reject("expected queue delay too long")
+            self.waiting += 1
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                self.ewma_wait = self._smooth(self.ewma_wait, time.monotonic() - started)
+                self._reject("timed out waiting in queue")
+            finally:
+                self.waiting -= 1
+            self.ewma_wait = self._smooth(self.ewma_wait, time.monotonic() - started)
+        self.active += 1
+        self.admitted += 1
+
+    def release(self, service_time: float):
+        self.active -= 1
+        self.ewma_service = self._smooth(self.ewma_service, service_time)
+        self._semaphore.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "max_wait_s": self.max_wait,
+            "active": self.active,
+            "waiting": self.waiting,
+            "avg_queue_wait_ms": round(self.ewma_wait * 1000, 1),
+            "avg_service_ms": round(self.ewma_service * 1000, 1),
+            "estimated_wait_ms": round(self.estimated_wait() * 1000, 1),
+            "admitted": self.admitted,
+            "shed": self.shed,
+        }
+
+
+# R computations share one interpreter per worker, so by default they run one at a time
+r_lane = Lane.from_env("r", max_concurrency=1, max_queue=32, max_wait=5.0)
+# Endpoints that can run for much longer than one R call (exact searches, multi-stage designs) get their
+# own slots, so they never hold the quick R tests' slot
+heavy_lane = Lane.from_env("heavy", max_concurrency=2, max_queue=8, max_wait=10.0)
+# AI queries mostly wait on OpenAI; they get their own slots and queue
+ai_lane = Lane.from_env("ai", max_concurrency=8, max_queue=16, max_wait=15.0)
+# Designs computed with numpy/scipy alone need no R interpreter, so they do not queue behind it
+compute_lane = Lane.from_env("compute", max_concurrency=4, max_queue=16, max_wait=5.0)
+# Pilot-data uploads stream large bodies without R; a few at a time so they cannot starve the R lane
+upload_lane = Lane.from_env("upload", max_concurrency=2, max_queue=4, max_wait=30.0)
+
+
+class AdmissionMiddleware:
+    """ASGI middleware that routes requests through lanes by method and path prefix"""
+
+    def __init__(self, app, routes: List[Tuple[str, str, Lane]]):
+        """
+        Args:
+            app: The ASGI application
+            routes: (method, path prefix, lane) rules; the first match wins
+        """
+        self.app = app
+        self.routes = routes
+
+    def lane_for(self, method: str, path: str) -> Optional[Lane]:
+        for route_method, prefix, lane in self.routes:
+            if method == route_method and path.startswith(prefix):
+                return lane
+        return None
+
+    async def __call__(self, scope, receive, send):
+        lane = self.lane_for(scope.get("method", ""), scope.get("path", "")) if scope["type"] == "http" else None
+        if lane is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await lane.acquire()
+        except LoadShedError as error:
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": str(error), "lane": error.lane, "retry_after": math.ceil(error.retry_after)},
+                headers={"Retry-After": str(math.ceil(error.retry_after))},
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            lane.release(time.monotonic() - started)
+
+
+def admission_status(*lanes: Lane) -> Dict[str, Any]:
+    return {lane.name: lane.snapshot() for lane in lanes}
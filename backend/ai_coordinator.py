@@ -14,9 +14,16 @@ import requests
 from typing import Dict, Any, Optional, List
 from pydantic import BaseModel, Field
 from fastapi import HTTPException
-import openai
+from fastapi.exceptions import RequestValidationError
 from datetime import datetime
 from dotenv import load_dotenv
+from openai_transport import OpenAITransport, TransportError
+from single_flight import SingleFlight, canonical_key, normalize_query
+from mock_openai import RecordingClient, mock_from_env
+from model_router import ModelRouter
+from parameter_domains import validate_parameters
+from r_session import PRIORITY_AI, RTimeoutError, RUnavailableError, call_priority
+from session_store import ResultCache, SessionState, SessionStore, resolve_follow_up
 
 # Load environment variables from .env file
 load_dotenv()
@@ -25,12 +32,67 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Parameter schema for each supported test, as shown to the extraction model
+TEST_PARAMETER_SCHEMAS = {
+    "two_sample_t_test": '{"delta": float, "sd": float, "power": float}',
+    "paired_T_test": '{"d": float, "power": float, "alternative": "two.sided"}',
+    "one_mean_T_test": '{"d": float, "power": float, "alternative": "two.sided"}',
+    "one_way_ANOVA": '{"k": int, "f": float, "power": float}',
+    "log_rank_test": '{"power": float, "k": float, "pE": float, "pC": float, "RR": float}',
+    "chi_squared_test": '{"w": float, "df": int, "power": float}',
+    "two_proportions_test": '{"p1": float, "p2": float, "power": float, "alternative": "two.sided"}',
+    "single_proportion_test": '{"p0": float, "p1": float, "power": float, "alternative": "two.sided"}',
+    "cox_ph": '{"power": float, "theta": float, "p": float, "psi": float}',
+    "correlation": '{"r": float, "power": float}',
+    "kruskal-wallace": '{"k": int, "f": float, "power": float}',
+    "simple_linear_regression": '{"u": int, "f2": float, "power": float}',
+    "multiple_linear_regression": '{"u": int, "f2": float, "power": float}',
+    "one_mean_wilcoxon": '{"d": float, "power": float, "alternative": "two.sided"}',
+    "mann_whitney_test": '{"d": float, "power": float}',
+    "paired_wilcoxon_test": '{"d": float, "power": float, "alternative": "two.sided"}',
+    "equivalence_means": '{"hypothesis": "equivalence" | "non_inferiority", "design": "two_sample" | "one_sample" | '
+                         '"paired", "delta": float, "sd": float, "lower": float, "upper": float, "margin": float, '
+                         '"power": float}',
+    "equivalence_proportions": '{"hypothesis": "equivalence" | "non_inferiority", "design": "two_sample" | '
+                               '"one_sample", "p1": float, "p2": float, "p0": float, "lower": float, "upper": float, '
+                               '"margin": float, "power": float}',
+}
+
+# System prompts are built once and never change between calls, so the provider's
+# prompt cache can reuse them; per-request content goes only in the user message.
+EXTRACTION_SYSTEM_PROMPT = (
+    "You are an expert statistical consultant specializing in power analysis. "
+    "Identify the statistical test the user needs and extract its parameters.\n"
+    "Reply with a JSON object: "
+    '{"test_type": <one of the tests below>, "parameters": {...}, '
+    '"confidence": <0-1>, "explanation": <one sentence>}.\n'
+    "Tests and their parameters:\n"
+    + "\n".join(f"- {test}: {schema}" for test, schema in TEST_PARAMETER_SCHEMAS.items())
+    + "\nExtract every required parameter; if one is missing, use a reasonable default."
+)
+
+EXPLANATION_SYSTEM_PROMPT = (
+    "You are PowerGPT, an AI statistical consultant specializing in power analysis. "
+    "Given a user's question, the test used, its parameters and the computed result, "
+    "write a clear, conversational, educational answer for researchers: explain the test "
+    "and its purpose, interpret the sample size, list the assumptions that must hold, give "
+    "practical study design advice and explain the relevant power analysis concepts.\n"
+    "Reply with a JSON object: "
+    '{"sample_size": <number>, "interpretation": <string>, "assumptions": [<string>], '
+    '"recommendations": [<string>], "educational_context": <string>}.'
+)
+
+# Extractions below this confidence are retried once with the stage's other model
+EXTRACTION_ESCALATION_CONFIDENCE = float(os.getenv("POWERGPT_EXTRACTION_MIN_CONFIDENCE", "0.5"))
+
 class StatisticalQuery(BaseModel):
     """Model for statistical query processing"""
     user_query: str = Field(..., description="Natural language query from user")
     test_type: Optional[str] = Field(None, description="Identified statistical test type")
     parameters: Optional[Dict[str, Any]] = Field(None, description="Extracted parameters")
     confidence: Optional[float] = Field(None, description="Confidence in parameter extraction")
+    model: Optional[str] = Field(None, description="Model that performed the extraction")
+    source: Optional[str] = Field(None, description="'extraction' (model) or 'follow_up' (resolved from the session)")
 
 class AIResponse(BaseModel):
     """Model for AI-generated responses"""
@@ -45,16 +107,22 @@ class PowerGPTCoordinator:
     AI Coordinator for PowerGPT - Integrates OpenAI GPT with statistical APIs
     """
     
-    def __init__(self, openai_api_key: Optional[str] = None, powergpt_base_url: str = "http://localhost:5001"):
+    def __init__(
+        self,
+        openai_api_key: Optional[str] = None,
+        powergpt_base_url: str = "http://localhost:5001",
+        interactive: bool = False
+    ):
         """
         Initialize the AI Coordinator
         
         Args:
             openai_api_key: OpenAI API key (if None, will try to get from environment)
             powergpt_base_url: Base URL for PowerGPT API
+            interactive: Prompt on the terminal for a missing API key (never used in server mode)
         """
-        # Get OpenAI API key from parameter, environment, or prompt user
-        self.openai_api_key = self._get_openai_api_key(openai_api_key)
+        # Get OpenAI API key from parameter, environment, or (interactively) the user
+        self.openai_api_key = self._get_openai_api_key(openai_api_key, interactive=interactive)
         self.powergpt_base_url = powergpt_base_url
         self.available_tests = [
             "two_sample_t_test", "paired_T_test", "one_mean_T_test",
@@ -62,20 +130,51 @@ class PowerGPTCoordinator:
             "two_proportions_test", "single_proportion_test", "cox_ph",
             "correlation", "kruskal-wallace", "simple_linear_regression",
             "multiple_linear_regression", "one_mean_wilcoxon",
-            "mann_whitney_test", "paired_wilcoxon_test"
+            "mann_whitney_test", "paired_wilcoxon_test", "equivalence_means",
+            "equivalence_proportions"
         ]
         
-        # Initialize OpenAI client
-        self.openai_client = openai.OpenAI(api_key=self.openai_api_key)
+        # Offline stand-in (POWERGPT_OPENAI_MOCK / POWERGPT_OPENAI_REPLAY) for load tests and development
+        self.mock_client = mock_client = mock_from_env()
+        if mock_client is not None and not self.openai_api_key:
+            self.openai_api_key = "mock"
+        record_path = os.getenv("POWERGPT_OPENAI_RECORD")
+        
+        # Pooled, retrying transport; the openai package is loaded on first use
+        self.transport = OpenAITransport.from_env(
+            self.openai_api_key,
+            client=mock_client,
+            client_wrapper=(lambda client: RecordingClient(client, record_path)) if record_path else None
+        )
+        
+        # Per-stage model selection with token, latency and cost accounting
+        self.router = ModelRouter(self.transport)
+        
+        # Identical queries in flight at the same time share one pipeline run
+        self.query_flights = SingleFlight("ai_query")
+        
+        # Per-chat state for follow-up queries, and results shared across chats
+        self.sessions = SessionStore.from_env()
+        self.result_cache = ResultCache(int(os.getenv("POWERGPT_RESULT_CACHE_SIZE", "1024")))
         
         logger.info("PowerGPT AI Coordinator initialized")
     
-    def _get_openai_api_key(self, api_key: Optional[str] = None) -> str:
+    @property
+    def openai_client(self):
+        """OpenAI client, created on first access"""
+        return self.transport.client
+    
+    def load_openai_client(self):
+        """Import openai and build the client (called lazily or during startup)"""
+        return self.transport.client
+    
+    def _get_openai_api_key(self, api_key: Optional[str] = None, interactive: bool = False) -> str:
         """
         Get OpenAI API key from various sources
         
         Args:
             api_key: Directly provided API key
+            interactive: Whether to fall back to prompting on the terminal
             
         Returns:
             OpenAI API key string
@@ -96,8 +195,12 @@ class PowerGPTCoordinator:
             logger.info("Using OpenAI API key from .env file")
             return env_file_key
         
-        # Finally, prompt user for API key
         logger.warning("OpenAI API key not found in environment or .env file")
+        if not interactive:
+            logger.warning("No OpenAI API key provided - AI features will be disabled")
+            return ""
+        
+        # Finally, prompt user for API key
         print("\n" + "="*60)
         print("🤖 PowerGPT AI Integration Setup")
         print("="*60)
@@ -121,12 +224,13 @@ class PowerGPTCoordinator:
         """Check if AI features are enabled"""
         return bool(self.openai_api_key)
     
-    def extract_parameters(self, user_query: str) -> StatisticalQuery:
+    def extract_parameters(self, user_query: str, previous: Optional[SessionState] = None) -> StatisticalQuery:
         """
         Extract statistical parameters from natural language query using GPT
         
         Args:
             user_query: Natural language query from user
+            previous: Session state of the chat, sent as context for follow-up questions
             
         Returns:
             StatisticalQuery with extracted parameters
@@ -138,67 +242,62 @@ class PowerGPTCoordinator:
             )
         
         try:
-            # Create system prompt for parameter extraction
-            system_prompt = f"""
-            You are an expert statistical consultant specializing in power analysis.
-            
-            Extract statistical parameters from user queries and identify the appropriate test type.
-            
-            Available statistical tests: {', '.join(self.available_tests)}
-            
-            Return a JSON object with:
-            - test_type: the appropriate statistical test from the available list
-            - parameters: object with required parameters for the test
-            - confidence: confidence score (0-1) in your extraction
-            - explanation: brief explanation of what the user wants
-            
-            Parameter requirements for each test:
-            - two_sample_t_test: {{"delta": float, "sd": float, "power": float}}
-            - paired_T_test: {{"d": float, "power": float, "alternative": "two.sided"}}
-            - one_mean_T_test: {{"d": float, "power": float, "alternative": "two.sided"}}
-            - one_way_ANOVA: {{"k": int, "f": float, "power": float}}
-            - log_rank_test: {{"power": float, "k": float, "pE": float, "pC": float, "RR": float}}
-            - chi_squared_test: {{"w": float, "df": int, "power": float}}
-            - two_proportions_test: {{"p1": float, "p2": float, "power": float, "alternative": "two.sided"}}
-            - single_proportion_test: {{"p0": float, "p1": float, "power": float, "alternative": "two.sided"}}
-            - cox_ph: {{"power": float, "theta": float, "p": float, "psi": float}}
-            - correlation: {{"r": float, "power": float}}
-            - kruskal-wallace: {{"k": int, "f": float, "power": float}}
-            - simple_linear_regression: {{"u": int, "f2": float, "power": float}}
-            - multiple_linear_regression: {{"u": int, "f2": float, "power": float}}
-            - one_mean_wilcoxon: {{"d": float, "power": float, "alternative": "two.sided"}}
-            - mann_whitney_test: {{"d": float, "power": float}}
-            - paired_wilcoxon_test: {{"d": float, "power": float, "alternative": "two.sided"}}
-            
-            Be precise and extract all required parameters. If parameters are missing, estimate reasonable defaults.
-            """
-            
-            # Call OpenAI for parameter extraction
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_query}
-                ],
-                temperature=0.1,  # Low temperature for consistent extraction
-                max_tokens=500
-            )
-            
-            # Parse the response
-            content = response.choices[0].message.content
-            extracted_data = json.loads(content)
+            user_content = user_query
+            if previous is not None and previous.test_type:
+                # Context goes in the user message so the system prompt stays cacheable
+                user_content = (
+                    f"Previous request: {json.dumps({'test_type': previous.test_type, 'parameters': previous.parameters})}\n"
+                    f"Follow-up (keep previous values unless changed): {user_query}"
+                )
+            messages = [
+                {"role": "system", "content": EXTRACTION_SYSTEM_PROMPT},
+                {"role": "user", "content": user_content}
+            ]
+            completion = self.router.complete("extraction", messages)
+            extracted_data = self._parse_extraction(completion.content)
+            
+            # Retry once with the stage's other model when the result is unusable or unsure
+            if extracted_data is None or extracted_data.get("confidence", 0.0) < EXTRACTION_ESCALATION_CONFIDENCE:
+                escalation_model = self.router.escalation_model("extraction", completion.model)
+                if escalation_model:
+                    self.router.record_outcome("extraction", completion.model, False)
+                    logger.info(f"Escalating extraction from {completion.model} to {escalation_model}")
+                    completion = self.router.complete("extraction", messages, model=escalation_model)
+                    extracted_data = self._parse_extraction(completion.content)
+            
+            if extracted_data is None:
+                self.router.record_outcome("extraction", completion.model, False)
+                raise ValueError(f"Model returned unparseable output: {completion.content[:200]}")
             
             return StatisticalQuery(
                 user_query=user_query,
                 test_type=extracted_data.get("test_type"),
                 parameters=extracted_data.get("parameters"),
-                confidence=extracted_data.get("confidence", 0.0)
+                confidence=extracted_data.get("confidence", 0.0),
+                model=completion.model,
+                source="extraction"
             )
             
+        except TransportError as e:
+            logger.error(f"OpenAI unavailable for parameter extraction: {str(e)}")
+            raise HTTPException(status_code=503, detail=f"AI service temporarily unavailable: {str(e)}")
         except Exception as e:
             logger.error(f"Error extracting parameters: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Parameter extraction failed: {str(e)}")
     
+    @staticmethod
+    def _parse_extraction(content: str) -> Optional[Dict[str, Any]]:
+        """Parse the extraction JSON, or None when it is not usable"""
+        try:
+            data = json.loads(content)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get("test_type") not in TEST_PARAMETER_SCHEMAS:
+            return None
+        if not isinstance(data.get("parameters"), dict):
+            return None
+        return data
+    
     def call_statistical_api(self, test_type: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """
         Call the PowerGPT statistical functions directly
@@ -214,60 +313,32 @@ class PowerGPTCoordinator:
             # Import the app module to access statistical functions
             import app
             
-            # Map test types to function names
-            test_function_map = {
-                "two_sample_t_test": app.two_sample_t_test,
-                "paired_T_test": app.paired_t_test,
-                "one_mean_T_test": app.one_mean_T_test,
-                "one_way_ANOVA": app.one_way_ANOVA,
-                "log_rank_test": app.log_rank_test,
-                "chi_squared_test": app.chi_squared_test,
-                "two_proportions_test": app.two_proportions_test,
-                "single_proportion_test": app.single_proportion_test,
-                "cox_ph": app.cox_ph,
-                "correlation": app.correlation,
-                "kruskal-wallace": app.kruskal_wallace,
-                "simple_linear_regression": app.simple_linear_regression,
-                "multiple_linear_regression": app.multiple_linear_regression,
-                "one_mean_wilcoxon": app.one_mean_wilcoxon,
-                "mann_whitney_test": app.mann_whitney_test_n,
-                "paired_wilcoxon_test": app.paired_wilcoxon_test
-            }
-            
-            if test_type not in test_function_map:
+            if test_type not in app.STATISTICAL_TESTS:
                 raise HTTPException(
                     status_code=400,
                     detail=f"Unknown test type: {test_type}"
                 )
             
             # Create the appropriate model instance
-            model_class_map = {
-                "two_sample_t_test": app.TwoSampleTTest,
-                "paired_T_test": app.PairedTTest,
-                "one_mean_T_test": app.OneMeanTTestParams,
-                "one_way_ANOVA": app.OneWayANOVAParams,
-                "log_rank_test": app.LogRankTest,
-                "chi_squared_test": app.ChiSquaredTestParams,
-                "two_proportions_test": app.TwoProportionsTestParams,
-                "single_proportion_test": app.SingleProportionTestParams,
-                "cox_ph": app.CoxPhParams,
-                "correlation": app.Correlation,
-                "kruskal-wallace": app.KruskalWallace,
-                "simple_linear_regression": app.SimpleLinearRegression,
-                "multiple_linear_regression": app.MultipleLinearRegression,
-                "one_mean_wilcoxon": app.OneMeanWilcoxon,
-                "mann_whitney_test": app.MannWhitneyTest,
-                "paired_wilcoxon_test": app.PairedWilcoxonTest
-            }
-            
-            model_class = model_class_map[test_type]
-            model_instance = model_class(**parameters)
+            test_function, model_class = app.STATISTICAL_TESTS[test_type]
+            model_instance = validate_parameters(model_class, parameters, loc=())
             
-            # Call the function directly
-            result = test_function_map[test_type](model_instance)
+            # Call the function directly; its R calls queue behind the statistical endpoints'
+            with call_priority(PRIORITY_AI):
+                result = test_function(model_instance)
             
             return result
                 
+        except RequestValidationError as e:
+            # The extracted parameters are outside the test's domain; say which and why
+            problems = "; ".join(f"{'.'.join(map(str, error['loc'])) or test_type}: {error['msg']}"
+                                 for error in e.errors())
+            raise HTTPException(status_code=422, detail=f"Invalid parameters for {test_type}: {problems}")
+        except RTimeoutError as e:
+            logger.error(f"Statistical function call timed out: {str(e)}")
+            raise HTTPException(status_code=504, detail=str(e))
+        except RUnavailableError as e:
+            raise HTTPException(status_code=503, detail=str(e))
         except Exception as e:
             logger.error(f"Statistical function call failed: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Statistical function call failed: {str(e)}")
@@ -291,62 +362,26 @@ class PowerGPTCoordinator:
         Returns:
             AIResponse with educational content
         """
-        if not self.is_ai_enabled():
-            # Return a basic response without AI
-            return AIResponse(
-                sample_size=api_result.get("result"),
-                interpretation=f"Sample size calculation completed for {test_type}",
-                assumptions=["Please consult statistical literature for assumptions"],
-                recommendations=["Consider consulting with a statistician"],
-                educational_context=f"This is a {test_type} power analysis result."
-            )
+        if not self.is_ai_enabled() or self.transport.breaker.is_open():
+            # Return a basic response without AI (instantly while OpenAI is failing)
+            return self._basic_response(test_type, api_result)
         
         try:
-            # Create system prompt for response generation
-            system_prompt = f"""
-            You are PowerGPT, an AI-powered statistical consultant specializing in power analysis.
-            
-            Generate a comprehensive, educational response that includes:
-            
-            1. Clear explanation of the statistical test and its purpose
-            2. Interpretation of the sample size result
-            3. Statistical assumptions that should be met
-            4. Practical recommendations for study design
-            5. Educational context about power analysis
-            
-            Be conversational, educational, and helpful. Use clear language that researchers can understand.
-            Include practical advice and explain the implications of the results.
-            
-            Return a JSON object with:
-            - sample_size: the calculated sample size
-            - interpretation: detailed interpretation of results
-            - assumptions: list of statistical assumptions
-            - recommendations: list of study design recommendations
-            - educational_context: educational explanation of the test
-            """
-            
-            # Prepare context for GPT
-            context = f"""
-            User Query: {user_query}
-            Statistical Test: {test_type}
-            Parameters Used: {json.dumps(parameters, indent=2)}
-            API Result: {json.dumps(api_result, indent=2)}
-            """
-            
-            # Call OpenAI for response generation
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": context}
-                ],
-                temperature=0.7,  # Higher temperature for creative responses
-                max_tokens=1000
-            )
+            # Per-request details go in the user message; the system prompt stays cacheable
+            context = json.dumps({
+                "user_query": user_query,
+                "statistical_test": test_type,
+                "parameters": parameters,
+                "result": api_result
+            }, separators=(",", ":"))
+            
+            completion = self.router.complete("explanation", [
+                {"role": "system", "content": EXPLANATION_SYSTEM_PROMPT},
+                {"role": "user", "content": context}
+            ])
             
             # Parse the response
-            content = response.choices[0].message.content
-            response_data = json.loads(content)
+            response_data = json.loads(completion.content)
             
             return AIResponse(
                 sample_size=response_data.get("sample_size"),
@@ -359,37 +394,93 @@ class PowerGPTCoordinator:
         except Exception as e:
             logger.error(f"Error generating response: {str(e)}")
             # Return a basic response on error
-            return AIResponse(
-                sample_size=api_result.get("result"),
-                interpretation=f"Sample size calculation completed for {test_type}",
-                assumptions=["Please consult statistical literature for assumptions"],
-                recommendations=["Consider consulting with a statistician"],
-                educational_context=f"This is a {test_type} power analysis result."
-            )
+            return self._basic_response(test_type, api_result)
+    
+    def _basic_response(self, test_type: str, api_result: Dict[str, Any]) -> AIResponse:
+        """Template response used when GPT is disabled or unavailable"""
+        return AIResponse(
+            sample_size=api_result.get("result"),
+            interpretation=f"Sample size calculation completed for {test_type}",
+            assumptions=["Please consult statistical literature for assumptions"],
+            recommendations=["Consider consulting with a statistician"],
+            educational_context=f"This is a {test_type} power analysis result."
+        )
     
-    def process_query(self, user_query: str) -> Dict[str, Any]:
+    def process_query(self, user_query: str, session_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Complete AI-powered query processing pipeline
         
+        Concurrent queries with the same normalized text (and the same
+        session context) are coalesced into a single run whose result is shared.
+        
         Args:
             user_query: Natural language query from user
+            session_id: Chat session; follow-ups are resolved against its last request
             
         Returns:
             Complete response with statistical results and educational content
         """
+        previous = self.sessions.get(session_id) if session_id else None
+        context = (previous.test_type, previous.parameters) if previous else None
+        shared = self.query_flights.do(
+            canonical_key(normalize_query(user_query), context),
+            lambda: self._run_query_pipeline(user_query, previous)
+        )
+        # Coalesced followers may still be copying the shared result, so only a copy is modified
+        result = dict(shared)
+        result["user_query"] = user_query
+        extracted = result.get("extracted_query")
+        if session_id and extracted:
+            self.sessions.update(session_id, extracted["test_type"], extracted["parameters"],
+                                 result["statistical_result"])
+        result["session_id"] = session_id
+        return result
+    
+    def _resolve_query(self, user_query: str, previous: Optional[SessionState]) -> StatisticalQuery:
+        """Apply a follow-up to the session's last request, or extract parameters with GPT"""
+        if previous is not None and previous.test_type:
+            changes = resolve_follow_up(user_query, previous.test_type, previous.parameters)
+            if changes is not None:
+                logger.info(f"Resolved follow-up without extraction: {changes}")
+                return StatisticalQuery(
+                    user_query=user_query,
+                    test_type=previous.test_type,
+                    parameters={**previous.parameters, **changes},
+                    confidence=1.0,
+                    source="follow_up"
+                )
+        return self.extract_parameters(user_query, previous)
+    
+    def _statistical_result(self, test_type: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """Result for (test, parameters), from the result cache when it was computed before"""
+        api_result = self.result_cache.get(test_type, parameters)
+        if api_result is None:
+            api_result = self.call_statistical_api(test_type, parameters)
+            self.result_cache.put(test_type, parameters, api_result)
+        return api_result
+    
+    def _run_query_pipeline(self, user_query: str, previous: Optional[SessionState] = None) -> Dict[str, Any]:
+        """Run extraction, calculation and explanation for one query"""
         try:
             logger.info(f"Processing query: {user_query}")
             
-            # Step 1: Extract parameters using GPT (if AI is enabled)
+            # Step 1: Extract parameters using GPT (if AI is enabled), or apply a follow-up
             if self.is_ai_enabled():
-                extracted_query = self.extract_parameters(user_query)
+                extracted_query = self._resolve_query(user_query, previous)
                 logger.info(f"Extracted parameters: {extracted_query}")
                 
-                # Step 2: Call statistical API
-                api_result = self.call_statistical_api(
-                    extracted_query.test_type, 
-                    extracted_query.parameters
-                )
+                # Step 2: Call statistical API (its success is the extraction's accuracy signal)
+                try:
+                    api_result = self._statistical_result(
+                        extracted_query.test_type, 
+                        extracted_query.parameters
+                    )
+                except HTTPException:
+                    if extracted_query.model:
+                        self.router.record_outcome("extraction", extracted_query.model, False)
+                    raise
+                if extracted_query.model:
+                    self.router.record_outcome("extraction", extracted_query.model, True)
                 logger.info(f"API result: {api_result}")
                 
                 # Step 3: Generate educational response
@@ -422,6 +513,8 @@ class PowerGPTCoordinator:
             logger.info("Query processing completed successfully")
             return complete_response
             
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Query processing failed: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Query processing failed: {str(e)}")
@@ -523,7 +616,7 @@ class PowerGPTCoordinator:
 # Example usage and testing
 if __name__ == "__main__":
     # Initialize coordinator (will prompt for API key if not found)
-    coordinator = PowerGPTCoordinator()
+    coordinator = PowerGPTCoordinator(interactive=True)
     
     # Test query processing
     test_query = "I need to calculate sample size for a two-group comparison with expected difference of 0.5, standard deviation of 1.0, and 80% power"
@@ -7,10 +7,14 @@ Provides natural language interface for statistical power analysis.
 """
 
 import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, Field
 from ai_coordinator import PowerGPTCoordinator, StatisticalQuery, AIResponse
+from health import utc_now
+from openai_transport import CircuitBreaker
 
 # Create router for AI endpoints
 ai_router = APIRouter(prefix="/ai", tags=["AI Integration"])
@@ -21,6 +25,7 @@ class AIQueryRequest(BaseModel):
     query: str = Field(..., description="Natural language query for statistical analysis")
     include_educational_content: bool = Field(True, description="Include educational explanations")
     response_format: str = Field("detailed", description="Response format: 'detailed' or 'simple'")
+    session_id: Optional[str] = Field(None, description="Chat session id; follow-up queries reuse its last request")
 
 class AIQueryResponse(BaseModel):
     """Response model for AI-powered queries"""
@@ -32,6 +37,7 @@ class AIQueryResponse(BaseModel):
     processing_time: Optional[str] = Field(None, description="Processing time")
     error_message: Optional[str] = Field(None, description="Error message if processing failed")
     ai_enabled: bool = Field(..., description="Whether AI features are enabled")
+    session_id: Optional[str] = Field(None, description="Session id to send with follow-up queries")
 
 class TestInfoRequest(BaseModel):
     """Request model for getting test information"""
@@ -48,6 +54,13 @@ class TestInfoResponse(BaseModel):
 # Global coordinator instance
 _ai_coordinator = None
 
+# Dedicated threads for the blocking AI pipeline, so it never runs on the event loop
+# or takes threads from the pool that serves the statistical endpoints
+_ai_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("POWERGPT_AI_CONCURRENCY", "8")),
+    thread_name_prefix="ai-query"
+)
+
 def get_ai_coordinator() -> PowerGPTCoordinator:
     """Get AI coordinator instance (singleton pattern)"""
     global _ai_coordinator
@@ -73,11 +86,15 @@ async def process_ai_query(
     - "What sample size do I need for a chi-squared test with effect size 0.3, 1 degree of freedom, and 90% power?"
     - "Help me design a survival analysis study with 80% power, equal allocation, 30% events in treatment, 50% in control, hazard ratio 0.6"
     """
+    # Start a session on the first query so clients can send follow-ups
+    session_id = request.session_id or get_ai_coordinator().sessions.new_session_id()
     try:
         coordinator = get_ai_coordinator()
         
         # Process the query through AI coordinator
-        result = coordinator.process_query(request.query)
+        result = await asyncio.get_running_loop().run_in_executor(
+            _ai_executor, coordinator.process_query, request.query, session_id
+        )
         
         # Check if AI is enabled
         if not result.get("ai_enabled", False):
@@ -85,7 +102,8 @@ async def process_ai_query(
                 success=False,
                 user_query=request.query,
                 error_message=result.get("error", "AI features are disabled"),
-                ai_enabled=False
+                ai_enabled=False,
+                session_id=session_id
             )
         
         # Format response based on user preference
@@ -96,7 +114,8 @@ async def process_ai_query(
                 user_query=request.query,
                 statistical_result=result.get("statistical_result"),
                 processing_time=result.get("processing_time"),
-                ai_enabled=True
+                ai_enabled=True,
+                session_id=session_id
             )
         else:
             # Return detailed response with educational content
@@ -107,7 +126,8 @@ async def process_ai_query(
                 statistical_result=result.get("statistical_result"),
                 ai_response=AIResponse(**result.get("ai_response", {})) if request.include_educational_content else None,
                 processing_time=result.get("processing_time"),
-                ai_enabled=True
+                ai_enabled=True,
+                session_id=session_id
             )
             
     except Exception as e:
@@ -116,7 +136,8 @@ async def process_ai_query(
             success=False,
             user_query=request.query,
             error_message=str(e),
-            ai_enabled=coordinator.is_ai_enabled()
+            ai_enabled=coordinator.is_ai_enabled(),
+            session_id=session_id
         )
 
 # Get available tests endpoint
@@ -188,29 +209,34 @@ async def ai_health_check() -> Dict[str, Any]:
     """
     Health check for AI integration service
     
-    Checks if OpenAI API key is configured and service is ready
+    Checks if OpenAI API key is configured and the OpenAI circuit breaker is closed.
+    Worker readiness (R warm state) is reported by /health/ready.
     """
     try:
         coordinator = get_ai_coordinator()
         ai_enabled = coordinator.is_ai_enabled()
         
         if ai_enabled:
+            breaker_state = coordinator.transport.breaker.state
+            healthy = breaker_state == CircuitBreaker.CLOSED
             return {
-                "status": "healthy",
-                "message": "AI integration service is ready",
+                "status": "healthy" if healthy else "degraded",
+                "message": "AI integration service is ready" if healthy
+                           else f"OpenAI circuit breaker is {breaker_state} - statistical APIs still available",
                 "openai_configured": True,
-                "available_tests": 16,
+                "breaker_state": breaker_state,
+                "available_tests": len(coordinator.available_tests),
                 "ai_enabled": True,
-                "timestamp": "2025-07-22T09:42:00Z"
+                "timestamp": utc_now()
             }
         else:
             return {
                 "status": "degraded",
                 "message": "AI features are disabled - statistical APIs still available",
                 "openai_configured": False,
-                "available_tests": 16,
+                "available_tests": len(coordinator.available_tests),
                 "ai_enabled": False,
-                "timestamp": "2025-07-22T09:42:00Z"
+                "timestamp": utc_now()
             }
         
     except Exception as e:
@@ -218,9 +244,39 @@ async def ai_health_check() -> Dict[str, Any]:
             "status": "unhealthy",
             "message": f"Health check failed: {str(e)}",
             "ai_enabled": False,
-            "timestamp": "2025-07-22T09:42:00Z"
+            "timestamp": utc_now()
         }
 
+# OpenAI transport status endpoint
+@ai_router.get("/transport")
+async def ai_transport_status() -> Dict[str, Any]:
+    """
+    Circuit breaker state, call latency percentiles and counters for the OpenAI transport
+    """
+    coordinator = get_ai_coordinator()
+    return {
+        "ai_enabled": coordinator.is_ai_enabled(),
+        **coordinator.transport.status()
+    }
+
+# Model routing and usage endpoint
+@ai_router.get("/usage")
+async def ai_usage() -> Dict[str, Any]:
+    """
+    Model routing configuration with per-model tokens, latency, accuracy and cost,
+    plus chat session and result cache counters (and the offline stand-in's, when used)
+    """
+    coordinator = get_ai_coordinator()
+    usage = {
+        "ai_enabled": coordinator.is_ai_enabled(),
+        **coordinator.router.usage(),
+        "sessions": coordinator.sessions.stats(),
+        "result_cache": coordinator.result_cache.stats()
+    }
+    if coordinator.mock_client is not None:
+        usage["mock_openai"] = coordinator.mock_client.stats()
+    return usage
+
 # Helper functions for test information
 def get_test_description(test_type: str) -> str:
     """Get description for a statistical test"""
@@ -240,7 +296,9 @@ def get_test_description(test_type: str) -> str:
         "multiple_linear_regression": "Test relationship between multiple predictors and outcome",
         "one_mean_wilcoxon": "Non-parametric one-sample test",
         "mann_whitney_test": "Non-parametric alternative to two-sample t-test",
-        "paired_wilcoxon_test": "Non-parametric alternative to paired t-test"
+        "paired_wilcoxon_test": "Non-parametric alternative to paired t-test",
+        "equivalence_means": "Show two means are equivalent (TOST) or one is not inferior",
+        "equivalence_proportions": "Show two proportions are equivalent (TOST) or one is not inferior"
     }
     return descriptions.get(test_type, "Statistical test for power analysis")
 
@@ -262,7 +320,9 @@ def get_example_query(test_type: str) -> str:
         "multiple_linear_regression": "Multiple regression with 3 predictors, effect size 0.15, 80% power",
         "one_mean_wilcoxon": "Non-parametric one-sample test with effect size 0.3, 80% power",
         "mann_whitney_test": "Non-parametric two-group comparison with effect size 0.5, 80% power",
-        "paired_wilcoxon_test": "Non-parametric paired test with effect size 0.4, 80% power"
+        "paired_wilcoxon_test": "Non-parametric paired test with effect size 0.4, 80% power",
+        "equivalence_means": "Equivalence of two formulations with margins of -0.5 and 0.5, SD 1, no true difference, 80% power",
+        "equivalence_proportions": "Non-inferiority of a new treatment with 80% cure rate vs 80% for standard care, margin -0.1, 80% power"
     }
     return examples.get(test_type, "Natural language query for statistical power analysis")
 
@@ -0,0 +1,297 @@
+"""
+PowerGPT Allocation Optimizer
+=============================
+Cost-optimal allocation ratio (and cluster size) for two-arm designs.
+
+The two-group endpoints assume 1:1 allocation, and log_rank_test takes the
+ratio k = nE / nC as an input. When subjects cost different amounts per arm,
+or an arm's enrollment or budget is capped, another ratio reaches the same
+power more cheaply. With an intracluster correlation, the cluster size m is
+a second knob: each arm is inflated by the design effect 1 + (m - 1) ICC,
+and every cluster adds a fixed cost.
+
+The optimizer:
+
+1. solves the control-arm size for every (target power, k, m) cell of a
+   candidate grid at once, by vectorized bisection on the test's power
+   function
+2. rounds each arm up, prices it and applies the constraints
+3. refines the best ratio of each (power, m) between its grid neighbours
+   with a bounded scalar search
+4. returns the best design per target power and the Pareto front of
+   (cost, total N, power) over all feasible candidates
+
+Power uses the formulas behind the fixed-sample endpoints, generalized to
+unequal arms: the noncentral t of power.t.test (two_sample_t_test), the
+arcsine approximation of pwr.2p2n.test (two_proportions_test) and
+Freedman's formula of ssizeCT (log_rank_test).
+"""
+
+import math
+from typing import Any, Callable, Dict, Optional, Sequence
+
+import numpy as np
+from scipy.optimize import minimize_scalar
+from scipy.special import ndtr
+from scipy.stats import nct, norm
+from scipy.stats import t as t_distribution
+
+ALPHA = 0.05
+
+ALLOCATION_TESTS = ("two_sample_t_test", "two_proportions_test", "log_rank_test")
+OBJECTIVES = ("cost", "n")
+
+# Candidate allocation ratios per grid, spaced evenly on the log scale
+RATIO_CANDIDATES = 81
+
+# Bisection steps of the vectorized solver (on log n, from 1 to MAX_N)
+BISECTIONS = 60
+MAX_N = 1e7
+
+# Score of infeasible ratios during refinement (finite, which the bounded search needs)
+INFEASIBLE = 1e300
+
+# Largest candidate grid (powers x ratios x cluster sizes) per request
+MAX_CANDIDATES = 50_000
+
+
+def _sides(alternative: str) -> int:
+    return 1 if alternative in ("greater", "less", "one.sided") else 2
+
+
+def _t_power(parameters: Dict[str, Any]) -> Callable:
+    effect = abs(parameters["delta"]) / parameters["sd"]
+    sides = _sides(parameters.get("alternative", "two.sided"))
+
+    def power(n_e, n_c):
+        df = np.maximum(n_e + n_c - 2, 1e-3)
+        ncp = effect / np.sqrt(1 / n_e + 1 / n_c)
+        return nct.sf(t_distribution.isf(ALPHA / sides, df), df, ncp)
+    return power
+
+
+def _proportions_power(parameters: Dict[str, Any]) -> Callable:
+    h = abs(2 * math.asin(math.sqrt(parameters["p1"])) - 2 * math.asin(math.sqrt(parameters["p2"])))
+    z = norm.isf(ALPHA / _sides(parameters.get("alternative", "two.sided")))
+
+    def power(n_e, n_c):
+        return ndtr(h * np.sqrt(n_e * n_c / (n_e + n_c)) - z)
+    return power
+
+
+def _log_rank_power(parameters: Dict[str, Any]) -> Callable:
+    p_e, p_c, rr = parameters["pE"], parameters["pC"], parameters["RR"]
+    z = norm.isf(ALPHA / 2)
+
+    def power(n_e, n_c):
+        k = n_e / n_c
+        events = n_e * p_e + n_c * p_c
+        return ndtr(np.sqrt(k * events) * abs(1 - rr) / (k * rr + 1) - z)
+    return power
+
+
+POWER_FUNCTIONS = {
+    "two_sample_t_test": _t_power,
+    "two_proportions_test": _proportions_power,
+    "log_rank_test": _log_rank_power,
+}
+
+
+def solve_control_size(power: Callable, target: np.ndarray, ratio: np.ndarray) -> np.ndarray:
+    """Continuous control-arm size reaching ``target`` with nE = ratio * nC, for whole arrays at once"""
+    low = np.zeros(np.broadcast(target, ratio).shape)
+    high = np.full(low.shape, math.log(MAX_N))
+    if np.any(power(ratio * MAX_N, np.full(low.shape, MAX_N)) < target):
+        raise ValueError(f"Target power is not reached with {MAX_N:.0f} subjects per arm")
+    for _ in range(BISECTIONS):
+        middle = (low + high) / 2
+        n_c = np.exp(middle)
+        short = power(ratio * n_c, n_c) < target
+        low = np.where(short, middle, low)
+        high = np.where(short, high, middle)
+    return np.exp(high)
+
+
+class CostModel:
+    """Prices and feasibility of rounded designs"""
+
+    def __init__(self, cost_e: float = 1.0, cost_c: float = 1.0, cluster_cost: float = 0.0, icc: float = 0.0,
+                 budget: Optional[float] = None, max_cost_e: Optional[float] = None,
+                 max_cost_c: Optional[float] = None, max_n_e: Optional[float] = None,
+                 max_n_c: Optional[float] = None):
+        """
+        Args:
+            cost_e, cost_c: Cost per subject in the experimental / control arm
+            cluster_cost: Fixed cost per cluster (with icc > 0)
+            icc: Intracluster correlation; 0 for individually randomized designs
+            budget: Cap on the total cost
+            max_cost_e, max_cost_c: Caps on each arm's cost
+            max_n_e, max_n_c: Caps on each arm's enrollment
+        """
+        self.cost_e = cost_e
+        self.cost_c = cost_c
+        self.cluster_cost = cluster_cost
+        self.icc = icc
+        self.budget = budget
+        self.max_cost_e = max_cost_e
+        self.max_cost_c = max_cost_c
+        self.max_n_e = max_n_e
+        self.max_n_c = max_n_c
+
+    def design(self, n_c: np.ndarray, ratio: np.ndarray, cluster_size: np.ndarray) -> Dict[str, np.ndarray]:
+        """Rounded arms, clusters, costs and feasibility from continuous, unclustered control sizes"""
+        inflation = 1 + (cluster_size - 1) * self.icc
+        if self.icc > 0:
+            # Whole clusters per arm
+            clusters_e = np.ceil(ratio * n_c * inflation / cluster_size - 1e-9)
+            clusters_c = np.ceil(n_c * inflation / cluster_size - 1e-9)
+            n_e, n_c = clusters_e * cluster_size, clusters_c * cluster_size
+        else:
+            n_e, n_c = np.ceil(ratio * n_c - 1e-9), np.ceil(n_c - 1e-9)
+            clusters_e = clusters_c = np.zeros_like(n_e)
+        arm_cost_e = n_e * self.cost_e + clusters_e * self.cluster_cost
+        arm_cost_c = n_c * self.cost_c + clusters_c * self.cluster_cost
+        cost = arm_cost_e + arm_cost_c
+        feasible = np.ones(cost.shape, dtype=bool)
+        for value, cap in ((cost, self.budget), (arm_cost_e, self.max_cost_e), (arm_cost_c, self.max_cost_c),
+                           (n_e, self.max_n_e), (n_c, self.max_n_c)):
+            if cap is not None:
+                feasible &= value <= cap
+        return {"nE": n_e, "nC": n_c, "clusters_E": clusters_e, "clusters_C": clusters_c, "cost": cost,
+                "feasible": feasible}
+
+
+def pareto_front(cost: np.ndarray, n: np.ndarray, power: np.ndarray) -> np.ndarray:
+    """
+    Indices of the distinct (cost, N, power) points not dominated on lower cost, lower N and higher power
+
+    Sorted by (cost, N, -power), any point dominating another precedes it; so a point at power level p is
+    dominated exactly when an earlier point among those with power >= p has an N no larger than its own.
+    """
+    points = np.stack([cost, n, power], axis=-1)
+    _, first = np.unique(points, axis=0, return_index=True)
+    order = first[np.lexsort((-power[first], n[first], cost[first]))]
+    keep = []
+    for level in np.unique(power[order]):
+        pool = order[power[order] >= level]
+        earlier_min = np.minimum.accumulate(np.concatenate([[np.inf], n[pool][:-1]]))
+        at_level = power[pool] == level
+        keep.append(pool[at_level & (earlier_min > n[pool])])
+    return np.concatenate(keep) if keep else np.array([], dtype=int)
+
+
+def _row(design: Dict[str, np.ndarray], index, power: float, ratio: float, cluster_size: float,
+         clustered: bool) -> Dict[str, Any]:
+    n_e, n_c = float(design["nE"][index]), float(design["nC"][index])
+    row = {"power": float(power), "k": float(ratio), "nE": n_e, "nC": n_c, "n_total": n_e + n_c,
+           "cost": float(design["cost"][index]), "result": [n_e, n_c]}
+    if clustered:
+        row.update(cluster_size=float(cluster_size), clusters_E=float(design["clusters_E"][index]),
+                   clusters_C=float(design["clusters_C"][index]))
+    return row
+
+
+def optimize_allocation(test: str, parameters: Dict[str, Any], powers: Sequence[float], costs: CostModel,
+                        ratio_range: Sequence[float] = (0.25, 4.0), cluster_sizes: Sequence[float] = (1,),
+                        objective: str = "cost") -> Dict[str, Any]:
+    """
+    Best allocation ratio (and cluster size) per target power, and the Pareto front
+
+    Args:
+        test: One of ALLOCATION_TESTS
+        parameters: The test's parameters apart from power (and k)
+        powers: Target powers
+        costs: Prices and constraints
+        ratio_range: Smallest and largest k = nE / nC to consider
+        cluster_sizes: Candidate cluster sizes (used when costs.icc > 0)
+        objective: "cost" (cheapest design) or "n" (smallest total N, ties broken by cost)
+    """
+    if test not in POWER_FUNCTIONS:
+        raise ValueError(f"Allocation optimization is available for: {', '.join(ALLOCATION_TESTS)}")
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objective must be one of {', '.join(OBJECTIVES)}")
+    low_ratio, high_ratio = ratio_range
+    if not 0 < low_ratio <= 1 <= high_ratio:
+        raise ValueError("ratio_range must satisfy 0 < low <= 1 <= high")
+    power_function = POWER_FUNCTIONS[test](parameters)
+    clustered = costs.icc > 0
+    sizes = np.asarray(cluster_sizes if clustered else (1,), dtype=float)
+    targets = np.asarray(powers, dtype=float)
+    # The grid always contains 1:1, the reference design
+    ratios = np.unique(np.concatenate([np.geomspace(low_ratio, high_ratio, RATIO_CANDIDATES), [1.0]]))
+    if targets.size * ratios.size * sizes.size > MAX_CANDIDATES:
+        raise ValueError(f"At most {MAX_CANDIDATES} candidate designs per request")
+
+    # Solve every (power, ratio, cluster size) cell at once; clustering only rescales the arms afterwards
+    target_grid, ratio_grid, size_grid = np.meshgrid(targets, ratios, sizes, indexing="ij")
+    n_c = solve_control_size(power_function, target_grid[..., :1], ratio_grid[..., :1])
+    n_c = np.broadcast_to(n_c, target_grid.shape)
+    design = costs.design(n_c, ratio_grid, size_grid)
+    n_total = design["nE"] + design["nC"]
+
+    def score(cost, n):
+        # "n" breaks ties between equal totals by cost
+        return cost if objective == "cost" else n + 1e-9 * cost
+
+    def refine(target: float, size: float, r: int) -> Optional[Dict[str, Any]]:
+        """Best design with a continuous ratio between the grid neighbours of ratios[r]"""
+        def rounded(log_ratio):
+            ratio = np.array([math.exp(log_ratio)])
+            local = costs.design(solve_control_size(power_function, np.array([target]), ratio), ratio,
+                                 np.array([size]))
+            return ratio[0], local
+
+        def objective_at(log_ratio):
+            _, local = rounded(log_ratio)
+            if not local["feasible"][0]:
+                return INFEASIBLE
+            return float(score(local["cost"][0], local["nE"][0] + local["nC"][0]))
+
+        bounds = (math.log(ratios[max(r - 1, 0)]), math.log(ratios[min(r + 1, ratios.size - 1)]))
+        search = minimize_scalar(objective_at, bounds=bounds, method="bounded", options={"xatol": 1e-4})
+        if search.fun >= INFEASIBLE:
+            return None
+        ratio, local = rounded(search.x)
+        return {**_row(local, 0, target, ratio, size, clustered), "score": search.fun}
+
+    one_to_one = int(np.searchsorted(ratios, 1.0))
+    best, balanced = [], []
+    for p, target in enumerate(targets):
+        scores = np.where(design["feasible"][p], score(design["cost"][p], n_total[p]), np.inf)  # (ratios, sizes)
+        if not np.isfinite(scores).any():
+            best.append({"power": float(target), "feasible": False})
+            balanced.append({"power": float(target), "k": 1.0, "feasible": False})
+            continue
+        r, s = np.unravel_index(int(np.argmin(scores)), scores.shape)
+        chosen = _row(design, (p, r, s), target, ratios[r], sizes[s], clustered)
+        # Only the ratio is continuous; the best cluster size is kept from the grid
+        local = refine(target, sizes[s], int(r))
+        if local is not None and local.pop("score") < scores[r, s]:
+            chosen = local
+        best.append(chosen)
+
+        # The 1:1 design (at its best cluster size) for comparison
+        s = int(np.argmin(scores[one_to_one]))
+        if np.isfinite(scores[one_to_one, s]):
+            reference = _row(design, (p, one_to_one, s), target, 1.0, sizes[s], clustered)
+            chosen["saving"] = reference["cost"] - chosen["cost"]
+            balanced.append(reference)
+        else:
+            balanced.append({"power": float(target), "k": 1.0, "feasible": False})
+
+    indices = np.argwhere(design["feasible"])
+    front = pareto_front(design["cost"][design["feasible"]], n_total[design["feasible"]],
+                         target_grid[design["feasible"]])
+    front = sorted(
+        (_row(design, tuple(indices[i]), targets[indices[i][0]], ratios[indices[i][1]], sizes[indices[i][2]],
+              clustered) for i in front),
+        key=lambda row: (row["cost"], row["n_total"], -row["power"]),
+    )
+    return {
+        "test": test,
+        "objective": objective,
+        "designs": best,
+        "balanced": balanced,
+        "pareto_front": front,
+        "candidates": int(target_grid.size),
+    }
@@ -7,122 +7,421 @@
 # def hello_world():
 #     return render_template("index.html", title="Hello")
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import rpy2.robjects as robjects
+import time
+_import_started = time.perf_counter()
+
+import csv
+import math
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Annotated, Any, Dict, List, Literal, Optional, Tuple, Union
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field, ValidationError, model_validator
 import uvicorn
-from ai_endpoints import ai_router
+import r_session
+from r_session import startup_timer
+from worker_recycling import RSSRecycleMiddleware
+from single_flight import coalesce_requests
+from admission import (
+    AdmissionMiddleware, admission_status, ai_lane, compute_lane, heavy_lane, r_lane, upload_lane
+)
+from event_loop_monitor import EventLoopMonitor
+from encoding import DefaultJSONResponse, negotiated
+from profiling import ProfilingMiddleware, admin_router
+from health import health_router
+import adaptive
+import allocation
+import assurance
+import equivalence
+import group_sequential
+import pilot_data
+import survival
+from parameter_domains import (
+    Alternative, CorrelationCoefficient, DegreesOfFreedom, EffectSize, Groups, HazardRatio, OpenProbability,
+    Positive, Power, Probability, ProportionAlternative, ProportionMethod, check_arcsine_effect,
+    check_direction, validate_parameters
+)
+import exact_proportions
+from ai_endpoints import ai_router, get_ai_coordinator
+
+startup_timer.record("import", time.perf_counter() - _import_started)
+
+# Wake-up lag of the event loop, i.e. time it spends blocked by synchronous work
+loop_monitor = EventLoopMonitor(
+    interval=float(os.getenv("POWERGPT_LOOP_MONITOR_INTERVAL_MS", "50")) / 1000,
+    threshold=float(os.getenv("POWERGPT_LOOP_STALL_MS", "20")) / 1000,
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start R, preload and warm every script and warm the AI coordinator before serving"""
+    r_session.initialize()
+    r_session.warm_up()
+    with startup_timer.phase("ai_coordinator"):
+        coordinator = get_ai_coordinator()
+        if coordinator.is_ai_enabled():
+            coordinator.load_openai_client()
+    report = startup_timer.report()
+    print(f"Startup completed in {report['total_ms']} ms: {report['phases_ms']}")
+    loop_monitor.start()
+    yield
+    await loop_monitor.stop()
 
 app = FastAPI(
     title='PowerGPT API - AI-Powered Statistical Power Analysis',
     description='A comprehensive API for statistical power analysis with AI integration',
     version='2.0',
-    openapi_url="/api/v1/openapi.json"
+    openapi_url="/api/v1/openapi.json",
+    default_response_class=DefaultJSONResponse,
+    lifespan=lifespan
+)
+
+# Recycle the worker once its memory grows past POWERGPT_MAX_RSS_MB (set by serve.py)
+app.add_middleware(RSSRecycleMiddleware)
+
+# Profile a POWERGPT_PROFILE_SAMPLE_RATE fraction of computations (after admission, so queueing is excluded)
+app.add_middleware(ProfilingMiddleware)
+
+# Endpoints that never call R
+R_FREE_ENDPOINTS = (
+    "/api/v1/equivalence_means", "/api/v1/equivalence_proportions", "/api/v1/survival_design",
+    "/api/v1/optimal_allocation", "/api/v1/assurance",
+)
+# R-backed endpoints that can run long: the proportion tests' method="exact" searches, and designs that
+# run the fixed-sample R test and then compute for much longer
+HEAVY_ENDPOINTS = (
+    "/api/v1/single_proportion_test", "/api/v1/two_proportions_test", "/api/v1/group_sequential",
+    "/api/v1/sample_size_reestimation",
 )
 
+# Bound concurrency and queueing separately for R computations, R-free designs, uploads and AI queries;
+# shed overload with 429
+app.add_middleware(AdmissionMiddleware, routes=[
+    ("POST", "/ai/query", ai_lane),
+    ("POST", "/api/v1/pilot/", upload_lane),
+    *(("POST", path, compute_lane) for path in R_FREE_ENDPOINTS),
+    *(("POST", path, heavy_lane) for path in HEAVY_ENDPOINTS),
+    ("POST", "/api/v1/", r_lane),
+])
+
+@app.exception_handler(r_session.RTimeoutError)
+async def r_timeout_handler(request: Request, error: r_session.RTimeoutError):
+    '''An R computation overran its deadline (POWERGPT_R_TIMEOUT)'''
+    return JSONResponse(status_code=504, content={
+        "detail": str(error),
+        "error": "r_timeout",
+        "function": error.function,
+        "timeout_s": error.timeout,
+        "phase": error.phase,
+    })
+
+@app.exception_handler(r_session.RUnavailableError)
+async def r_unavailable_handler(request: Request, error: r_session.RUnavailableError):
+    '''R is wedged and this worker is being replaced; another worker can serve the retry'''
+    return JSONResponse(status_code=503, content={"detail": str(error), "error": "r_unavailable"},
+                        headers={"Retry-After": "1"})
+
 # Include AI endpoints
 app.include_router(ai_router)
 
+# Admin-only profiling endpoints (enabled by POWERGPT_ADMIN_TOKEN)
+app.include_router(admin_router)
+
+# Liveness and readiness probes for load balancers
+app.include_router(health_router)
+
 # Define the Pydantic model for input parameters
 class AddNumbers(BaseModel):
     a: int
     b: int
 
 class TwoSampleTTest(BaseModel):
-    delta: float
-    sd: float
-    power: float
+    delta: EffectSize  # difference in means
+    sd: Positive
+    power: Power
 
 class LogRankTest(BaseModel):
-    power: float
-    k: float # ratio of participants in experimental/treatment group compared to group C (control group).
-    pE: float # probability of failure in treatment group over the maximum time period of the study (t years).
-    pC: float # probability of failure in group C (control group) over the maximum time period of the study (t years).
-    RR: float # postulated hazard ratio
+    power: Power
+    k: Positive # ratio of participants in experimental/treatment group compared to group C (control group).
+    pE: OpenProbability # probability of failure in treatment group over the maximum time period of the study (t years).
+    pC: OpenProbability # probability of failure in group C (control group) over the maximum time period of the study (t years).
+    RR: HazardRatio # postulated hazard ratio
 
 class PairedTTest(BaseModel):
-    d: float
-    power: float
-    alternative: str
+    d: EffectSize
+    power: Power
+    alternative: Alternative
+
+    @model_validator(mode="after")
+    def effect_matches_alternative(self):
+        check_direction(self.d, self.alternative)
+        return self
 
 class TwoProportionsTestParams(BaseModel):
-    p1: float  
-    p2: float
-    power: float  # Power of the test
-    alternative: str  # Alternative hypothesis: "two.sided", "greater", or "less"
+    p1: Probability
+    p2: Probability
+    power: Power  # Power of the test
+    alternative: ProportionAlternative  # Alternative hypothesis: "two.sided", "greater", "less" or "one.sided"
+    method: ProportionMethod = "normal"  # "normal" (arcsine approximation) or "exact" (Fisher's exact test)
+
+    @model_validator(mode="after")
+    def effect_matches_alternative(self):
+        check_arcsine_effect(self.p1, self.p2, self.alternative)
+        return self
 
 class ChiSquaredTestParams(BaseModel):
-    w: float  # Effect size
-    df: int  # Degrees of freedom
-    power: float  # Power of the test
+    w: Positive  # Effect size
+    df: int = Field(ge=1)  # Degrees of freedom
+    power: Power  # Power of the test
 
 class OneMeanTTestParams(BaseModel):
-    d: float  # Effect size
-    power: float  # Power of the test
-    alternative: str  # Alternative hypothesis: "two.sided", "greater", or "less"
+    d: EffectSize  # Effect size
+    power: Power  # Power of the test
+    alternative: Alternative  # Alternative hypothesis: "two.sided", "greater", or "less"
+
+    @model_validator(mode="after")
+    def effect_matches_alternative(self):
+        check_direction(self.d, self.alternative)
+        return self
 
 class OneWayANOVAParams(BaseModel):
-    k: int  # Number of groups
-    f: float  # Effect size
-    power: float  # Power of the test
+    k: Groups  # Number of groups
+    f: Positive  # Effect size
+    power: Power  # Power of the test
 
 class SingleProportionTestParams(BaseModel):
-    p0: float  
-    p1: float
-    power: float  # Power of the test
-    alternative: str  # Alternative hypothesis: "two.sided", "greater", or "less"
+    p0: Probability
+    p1: Probability
+    power: Power  # Power of the test
+    alternative: ProportionAlternative  # Alternative hypothesis: "two.sided", "greater", "less" or "one.sided"
+    method: ProportionMethod = "normal"  # "normal" (arcsine approximation) or "exact" (exact binomial test)
+
+    @model_validator(mode="after")
+    def effect_matches_alternative(self):
+        check_arcsine_effect(self.p1, self.p0, self.alternative)
+        return self
 
 class CoxPhParams(BaseModel):
-    power: float  # Power of the test
-    theta: float #postulated hazard ratio
-    p: float #proportion of subjects taking value one for the covariate of interest (in equal allocation, p = 0.5)
-    psi: float #proportion of subjects died of the disease of interest (event rate)
+    power: Power  # Power of the test
+    theta: HazardRatio #postulated hazard ratio
+    p: OpenProbability #proportion of subjects taking value one for the covariate of interest (in equal allocation, p = 0.5)
+    psi: Annotated[float, Field(gt=0, le=1)] #proportion of subjects died of the disease of interest (event rate)
     
 class Correlation(BaseModel):
-    r: float  # Correlation coefficient
-    power: float  # Power of the test
+    r: CorrelationCoefficient  # Correlation coefficient
+    power: Power  # Power of the test
 
 class KruskalWallace(BaseModel):
-    k: int  # Number of groups
-    f: float  # Effect size
-    power: float  # Power of the test
+    k: Groups  # Number of groups
+    f: Positive  # Effect size
+    power: Power  # Power of the test
 
 class SimpleLinearRegression(BaseModel):
-  u:float=1
-  f2:float
-  power:float
+  u:DegreesOfFreedom=1
+  f2:Positive
+  power:Power
 
 class MultipleLinearRegression(BaseModel):
-    u: float  # degrees of freedom for numerator
-    f2: float  # effect size
-    power: float  # desired statistical power
+    u: DegreesOfFreedom  # degrees of freedom for numerator
+    f2: Positive  # effect size
+    power: Power  # desired statistical power
 
 class OneMeanWilcoxon(BaseModel):
-    d: float  # effect size (Cohen's d)
-    power: float  # desired statistical power
-    alternative: str = "two.sided"  # type of alternative hypothesis
+    d: EffectSize  # effect size (Cohen's d)
+    power: Power  # desired statistical power
+    alternative: Alternative = "two.sided"  # type of alternative hypothesis
+
+    @model_validator(mode="after")
+    def effect_matches_alternative(self):
+        check_direction(self.d, self.alternative)
+        return self
 
 class MannWhitneyTest(BaseModel):
-   d: float
-   power: float
-   alternative: str = "two.sided"  # type of alternative hypothesis
+   d: EffectSize
+   power: Power
+   alternative: Alternative = "two.sided"  # type of alternative hypothesis
+
+   @model_validator(mode="after")
+   def effect_matches_alternative(self):
+       check_direction(self.d, self.alternative)
+       return self
 
 class PairedWilcoxonTest(BaseModel):
-    d: float  # effect size (Cohen's d)
-    power: float  # desired statistical power
-    alternative: str = "two.sided"  # type of alternative hypothesis    
+    d: EffectSize  # effect size (Cohen's d)
+    power: Power  # desired statistical power
+    alternative: Alternative = "two.sided"  # type of alternative hypothesis    
+
+    @model_validator(mode="after")
+    def effect_matches_alternative(self):
+        check_direction(self.d, self.alternative)
+        return self
+
+class GroupSequentialDesign(BaseModel):
+    test: str  # fixed-sample test to extend, e.g. "two_sample_t_test"
+    parameters: Dict[str, Any]  # request body of that test
+    looks: Optional[int] = Field(None, ge=1)  # number of analyses including the final one; len(timing), or 5, when omitted
+    boundary: Literal[group_sequential.BOUNDARY_METHODS] = "obrien_fleming"  # one of group_sequential.BOUNDARY_METHODS
+    timing: Optional[List[float]] = None  # information fractions of the looks; equally spaced when omitted
+
+class NormalPrior(BaseModel):
+    distribution: Literal["normal"]
+    mean: float
+    sd: float = Field(ge=0)  # 0 gives a point prior
+
+class LogNormalPrior(BaseModel):
+    distribution: Literal["lognormal"]
+    meanlog: float  # mean of the log, e.g. log(0.7) for a hazard ratio centred on 0.7
+    sdlog: float = Field(ge=0)
+
+class BetaPrior(BaseModel):
+    distribution: Literal["beta"]
+    a: Positive
+    b: Positive
+
+Prior = Annotated[Union[NormalPrior, LogNormalPrior, BetaPrior], Field(discriminator="distribution")]
+
+class AssuranceDesign(BaseModel):
+    test: Literal[assurance.ASSURANCE_TESTS]  # one of assurance.ASSURANCE_TESTS
+    priors: Dict[str, Prior]  # parameter -> prior, e.g. {"d": {"distribution": "normal", "mean": 0.5, "sd": 0.2}}
+    parameters: Dict[str, float] = {}  # values of the parameters without a prior
+    assurance: float = Field(0.8, gt=0, lt=1)  # target assurance
+    alternative: ProportionAlternative = "two.sided"
+    n: Optional[float] = Field(None, gt=0)  # evaluate this N instead of solving for one
+
+class EquivalenceMeans(BaseModel):
+    hypothesis: Literal[equivalence.HYPOTHESES] = "equivalence"  # "equivalence" (TOST) or "non_inferiority"
+    design: Literal[equivalence.MEAN_DESIGNS] = "two_sample"
+    delta: float = 0  # expected true difference (mean difference, or mean minus reference value)
+    sd: Positive  # standard deviation (of the differences for a paired design)
+    lower: Optional[float] = None  # equivalence margins for the difference
+    upper: Optional[float] = None
+    margin: Optional[float] = None  # signed non-inferiority margin: negative when higher is better
+    power: Power
+
+    @model_validator(mode="after")
+    def margins_match_hypothesis(self):
+        equivalence.check_margins(self.hypothesis, self.delta, self.lower, self.upper, self.margin)
+        return self
+
+class EquivalenceProportions(BaseModel):
+    hypothesis: Literal[equivalence.HYPOTHESES] = "equivalence"
+    design: Literal[equivalence.PROPORTION_DESIGNS] = "two_sample"
+    p1: OpenProbability  # expected proportion in the test group
+    p2: Optional[OpenProbability] = None  # expected proportion in the reference group (two_sample)
+    p0: Optional[Probability] = None  # known reference proportion (one_sample)
+    lower: Optional[float] = None  # equivalence margins for p1 - p2 (or p1 - p0)
+    upper: Optional[float] = None
+    margin: Optional[float] = None  # signed non-inferiority margin: negative when higher is better
+    power: Power
+
+    @property
+    def reference(self) -> Optional[float]:
+        return self.p2 if self.design == "two_sample" else self.p0
+
+    @model_validator(mode="after")
+    def margins_match_hypothesis(self):
+        if self.reference is None:
+            raise ValueError(f"design '{self.design}' needs {'p2' if self.design == 'two_sample' else 'p0'}")
+        equivalence.check_margins(self.hypothesis, self.p1 - self.reference, self.lower, self.upper, self.margin)
+        return self
+
+NonNegative = Annotated[float, Field(ge=0)]
+
+class SurvivalDesign(BaseModel):
+    power: Power
+    RR: Union[HazardRatio, List[HazardRatio]]  # hazard ratio, experimental over control (cox_ph's theta)
+    k: Positive = 1  # allocation ratio experimental:control, as in log_rank_test (p / (1 - p) for cox_ph's p)
+    hazards: Optional[List[Positive]] = None  # control-arm hazard rates per time unit, one per piece
+    breaks: List[Positive] = []  # times since entry where the control hazard changes
+    median_control: Optional[Positive] = None  # constant control hazard given as a median survival time
+    dropout: Union[NonNegative, List[NonNegative]] = 0  # dropout hazard rate, the same in both arms
+    accrual_time: Optional[Union[Positive, List[Positive]]] = None  # length of the accrual period
+    accrual_rate: Optional[Union[Positive, List[Positive]]] = None  # or patients enrolled per time unit
+    follow_up: Union[NonNegative, List[NonNegative]] = 0  # minimum follow-up after the last patient enters
+    accrual_shape: float = 0  # 0 for uniform accrual; > 0 when enrollment speeds up over the accrual period
+    method: Literal[survival.METHODS] = "lachin_foulkes"
+
+    @model_validator(mode="after")
+    def one_of_each(self):
+        if (self.hazards is None) == (self.median_control is None):
+            raise ValueError("give exactly one of hazards and median_control")
+        if (self.accrual_time is None) == (self.accrual_rate is None):
+            raise ValueError("give exactly one of accrual_time and accrual_rate")
+        return self
+
+class AllocationDesign(BaseModel):
+    test: Literal[allocation.ALLOCATION_TESTS]  # one of allocation.ALLOCATION_TESTS
+    parameters: Dict[str, Any]  # request body of that test, without power (and k for log_rank_test)
+    powers: List[Power] = Field([0.8, 0.85, 0.9], min_length=1)  # target powers
+    cost_E: Positive = 1  # cost per subject in the experimental arm
+    cost_C: Positive = 1  # cost per subject in the control arm
+    budget: Optional[Positive] = None  # cap on the total cost
+    max_cost_E: Optional[Positive] = None  # caps on each arm's cost
+    max_cost_C: Optional[Positive] = None
+    max_nE: Optional[Positive] = None  # caps on each arm's enrollment
+    max_nC: Optional[Positive] = None
+    icc: float = Field(0, ge=0, lt=1)  # intracluster correlation; 0 for individual randomization
+    cluster_cost: NonNegative = 0  # fixed cost per cluster
+    cluster_sizes: List[Annotated[int, Field(ge=1)]] = list(range(2, 101))  # candidate cluster sizes (with icc)
+    ratio_range: Tuple[Positive, Positive] = (0.25, 4.0)  # smallest and largest k = nE / nC to consider
+    objective: Literal[allocation.OBJECTIVES] = "cost"  # "cost" or "n" (smallest total sample size)
+
+class InterimData(BaseModel):
+    n1: Positive  # sample size per group (pairs, subjects) at the interim look
+    z: Optional[float] = None  # interim test statistic, signed like the effect
+    delta: Optional[float] = None  # or the observed effect in the test's own terms: mean difference and sd,
+    sd: Optional[Positive] = None
+    p1: Optional[OpenProbability] = None  # the two proportions,
+    p2: Optional[OpenProbability] = None
+    d: Optional[float] = None  # or Cohen's d
+
+class AdaptiveDesign(BaseModel):
+    test: Literal[tuple(adaptive.ADAPTIVE_TESTS)]  # one of adaptive.ADAPTIVE_TESTS
+    parameters: Dict[str, Any]  # request body of that test as planned, including power
+    planned_n: Optional[Positive] = None  # planned sample size per group; from the test's endpoint when omitted
+    interim: InterimData
+    max_n: Optional[Positive] = None  # cap on the total sample size per group (default twice the planned one)
+    target_power: Optional[Power] = None  # target conditional power (default: the planned power)
+    cp_min: Optional[OpenProbability] = None  # lower end of the promising zone (default: smallest valid)
+    second_stage_sizes: Optional[List[Positive]] = None  # candidate n2 of the conditional power surface
+
+
+def exact_sample_size(engine, *args):
+    '''Run an exact-test sample size search, reporting invalid inputs as 400'''
+    try:
+        exact = engine(*args)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"result": float(exact["stable_n"]), "method": "exact", **exact}
+
+@app.get('/api/v1/startup_timings')
+def startup_timings():
+    '''Report how long each import and initialization phase took at startup'''
+    return {"r_initialized": r_session.is_initialized(), **startup_timer.report()}
+
+@app.get('/api/v1/admission')
+def admission():
+    '''Report concurrency, queue depth, measured delays and shed counts for each lane'''
+    return admission_status(r_lane, heavy_lane, compute_lane, ai_lane, upload_lane)
+
+@app.get('/api/v1/event_loop')
+def event_loop(reset: bool = False):
+    '''Report event-loop lag since startup or the last reset; ``reset=true`` starts a new window'''
+    stats = loop_monitor.stats()
+    if reset:
+        loop_monitor.reset()
+    return stats
 
-    
 @app.post('/api/v1/add')
+@coalesce_requests('add')
 def add_two_numbers(add_numbers: AddNumbers):
     '''Add two numbers using an R function'''
-    print("Loading the R script")
-    # Load the R script
-    robjects.r.source("sum.r")
-
     print("Getting the add_numbers function from R")
-    # Get the add_numbers function from R
-    add_numbers_r = robjects.globalenv['add_numbers']
+    # Get the preloaded add_numbers function from the R session
+    add_numbers_r = r_session.get_function('add_numbers')
 
     print(f"Calling the R function with a={add_numbers.a} and b={add_numbers.b}")
     # Call the R function
@@ -133,6 +432,7 @@ def add_two_numbers(add_numbers: AddNumbers):
     return {"result": int(result[0])}
 
 @app.post('/api/v1/two_sample_t_test')
+@coalesce_requests('two_sample_t_test')
 def two_sample_t_test(twosamplettest_n: TwoSampleTTest):
     """
     This function calculates the sample size required to achieve a target power for a two-sample t-test using an R function.
@@ -175,13 +475,9 @@ def two_sample_t_test(twosamplettest_n: TwoSampleTTest):
     """
 
     '''Calculate sample size for a two-sample t-test using an R function'''
-    print("Loading the R script")
-    # Load the R script
-    robjects.r.source("twoSampleTTest.R")
-
     print("Getting the twosamplettest_n function from R")
-    # Get the twosamplettest_n function from R
-    twosamplettest_n_r = robjects.globalenv['twosamplettest_n']
+    # Get the preloaded twosamplettest_n function from the R session
+    twosamplettest_n_r = r_session.get_function('twosamplettest_n')
 
     print(f"Calling the R function with delta={twosamplettest_n.delta}, sd={twosamplettest_n.sd}, and power={twosamplettest_n.power}")
     # Call the R function
@@ -192,6 +488,8 @@ def two_sample_t_test(twosamplettest_n: TwoSampleTTest):
     return {"result": float(result[0])}
  
 @app.post('/api/v1/log_rank_test')
+@negotiated
+@coalesce_requests('log_rank_test')
 def log_rank_test(logranktest_n: LogRankTest):
     """
     This function calculates the sample size required to achieve a target power for a log-rank test using an R function.
@@ -252,13 +550,9 @@ def log_rank_test(logranktest_n: LogRankTest):
 
 
     '''Calculate sample size for a log-rank test using an R function'''
-    print("Loading the R script")
-    # Load the R script
-    robjects.r.source("logRankTest.R")
-
     print("Getting the logranktest_n function from R")
-    # Get the logranktest_n function from R
-    logranktest_n_r = robjects.globalenv['logranktest_n']
+    # Get the preloaded logranktest_n function from the R session
+    logranktest_n_r = r_session.get_function('logranktest_n')
 
     print(f"Calling the R function with power={logranktest_n.power}, k={logranktest_n.k}, pE={logranktest_n.pE}, pC={logranktest_n.pC}, and RR={logranktest_n.RR}")
     # Call the R function
@@ -275,6 +569,7 @@ def log_rank_test(logranktest_n: LogRankTest):
     return {"result": [float(result[0]), float(result[1])]}
 
 @app.post('/api/v1/paired_T_test')
+@coalesce_requests('paired_T_test')
 def paired_t_test(paired_t_test_n: PairedTTest):
     """
     This function calculates the sample size required to achieve a target power for a paired t-test using an R function.
@@ -343,13 +638,9 @@ def paired_t_test(paired_t_test_n: PairedTTest):
     """
 
     '''Calculate sample size for a paired t-test using an R function'''
-    print("Loading the R script")
-    # Load the R script
-    robjects.r.source("paired_T_test.R")
-
     print("Getting the paired_t_test_n function from R")
-    # Get the paired_t_test function from R
-    paired_t_test_r = robjects.globalenv['paired_t_test_n']
+    # Get the preloaded paired_t_test function from the R session
+    paired_t_test_r = r_session.get_function('paired_t_test_n')
 
     print(f"Calling the R function with d={paired_t_test_n.d}, power={paired_t_test_n.power}, alternative={paired_t_test_n.alternative}")
     # Call the R function
@@ -364,6 +655,8 @@ def paired_t_test(paired_t_test_n: PairedTTest):
     return {"result": float(result[0])}
 
 @app.post('/api/v1/two_proportions_test')
+@negotiated
+@coalesce_requests('two_proportions_test')
 def two_proportions_test(two_proportions_test_n: TwoProportionsTestParams):
     """
     This function calculates the sample size required to achieve a target power for a two-proportions z-test using an R function.
@@ -398,6 +691,9 @@ def two_proportions_test(two_proportions_test_n: TwoProportionsTestParams):
     - **alternative**: The type of alternative hypothesis, which specifies whether the user is conducting a two-tailed test 
       (the default) or a one-tailed test. A one-tailed test is appropriate when the user expects a difference in a specific direction 
       between the two proportions.
+    - **method**: "normal" (the default) uses the arcsine approximation above. "exact" uses Fisher's exact test, which is more 
+      accurate for rare events; the result is then the smallest stable sample size per group, and the response also reports the 
+      smallest sample size reaching the target power and the exact power curve around it.
 
     When to Use:
     - This function should be called when the task involves comparing the proportions of a binary outcome between two independent groups, 
@@ -422,13 +718,18 @@ def two_proportions_test(two_proportions_test_n: TwoProportionsTestParams):
     """
 
     '''Calculate sample size for a two-proportions test using an R function'''
-    print("Loading the R script")
-    # Load the R script
-    robjects.r.source("two_proportions_test.R")
+    if two_proportions_test_n.method == "exact":
+        return exact_sample_size(
+            exact_proportions.two_proportions_sample_size,
+            two_proportions_test_n.p1,
+            two_proportions_test_n.p2,
+            two_proportions_test_n.power,
+            two_proportions_test_n.alternative
+        )
 
     print("Getting the two_proportions_test function from R")
     # Retrieve the function defined in R
-    two_proportions_test_r = robjects.globalenv['two_proportions_test_n']
+    two_proportions_test_r = r_session.get_function('two_proportions_test_n')
 
     print(f"Calling the R function with power={two_proportions_test_n.power}, alternative={two_proportions_test_n.alternative}")
     # Call the R function with the parameters from the input model
@@ -444,6 +745,7 @@ def two_proportions_test(two_proportions_test_n: TwoProportionsTestParams):
     return {"result": float(result[0])}
 
 @app.post('/api/v1/chi_squared_test')
+@coalesce_requests('chi_squared_test')
 def chi_squared_test(chi_squared_test_n: ChiSquaredTestParams):
     """
     This function calculates the sample size required to achieve a target power for a chi-squared test using an R function.
@@ -504,13 +806,9 @@ def chi_squared_test(chi_squared_test_n: ChiSquaredTestParams):
     """
 
     '''Calculate sample size for a chi-squared test using an R function'''
-    print("Loading the R script")
-    # Load the R script
-    robjects.r.source("chi_squared_test.R")
-
     print("Getting the chi_squared_test function from R")
     # Retrieve the function defined in R
-    chi_squared_test_r = robjects.globalenv['chi_squared_test_n']
+    chi_squared_test_r = r_session.get_function('chi_squared_test_n')
 
     print(f"Calling the R function with w={chi_squared_test_n.w}, df={chi_squared_test_n.df}, power={chi_squared_test_n.power}")
     # Call the R function with the parameters from the input model
@@ -525,6 +823,7 @@ def chi_squared_test(chi_squared_test_n: ChiSquaredTestParams):
     return {"result": float(result[0])}
 
 @app.post('/api/v1/one_mean_T_test')
+@coalesce_requests('one_mean_T_test')
 def one_mean_T_test(one_mean_T_test_n: OneMeanTTestParams):
     """
     This function calculates the sample size required to achieve a target power for a one-mean t-test using an R function.
@@ -566,13 +865,9 @@ def one_mean_T_test(one_mean_T_test_n: OneMeanTTestParams):
     """
 
     '''Calculate sample size for a one-mean t-test using an R function'''
-    print("Loading the R script")
-    # Load the R script
-    robjects.r.source("one_mean_T_test.R")
-
     print("Getting the one_mean_T_test function from R")
     # Retrieve the function defined in R
-    one_mean_T_test_r = robjects.globalenv['one_mean_T_test_n']
+    one_mean_T_test_r = r_session.get_function('one_mean_T_test_n')
 
     print(f"Calling the R function with d={one_mean_T_test_n.d}, power={one_mean_T_test_n.power}, alternative={one_mean_T_test_n.alternative}")
     # Call the R function with the parameters from the input model
@@ -587,6 +882,7 @@ def one_mean_T_test(one_mean_T_test_n: OneMeanTTestParams):
     return {"result": float(result[0])}
 
 @app.post('/api/v1/one_way_ANOVA')
+@coalesce_requests('one_way_ANOVA')
 def one_way_ANOVA(one_way_ANOVA_n: OneWayANOVAParams):
     """
     This function calculates the sample size required to achieve a target power for a one-way ANOVA using an R function.
@@ -645,13 +941,9 @@ def one_way_ANOVA(one_way_ANOVA_n: OneWayANOVAParams):
       such as in studies comparing different interventions or treatment levels.
     """
     '''Calculate sample size for a one-way ANOVA using an R function'''
-    print("Loading the R script")
-    # Load the R script
-    robjects.r.source("one_way_ANOVA.R")
-
     print("Getting the one_way_ANOVA function from R")
     # Retrieve the function defined in R
-    one_way_ANOVA_r = robjects.globalenv['one_way_ANOVA_n']
+    one_way_ANOVA_r = r_session.get_function('one_way_ANOVA_n')
 
     print(f"Calling the R function with k={one_way_ANOVA_n.k}, f={one_way_ANOVA_n.f}, power={one_way_ANOVA_n.power}")
     # Call the R function with the parameters from the input model
@@ -666,6 +958,8 @@ def one_way_ANOVA(one_way_ANOVA_n: OneWayANOVAParams):
     return {"result": float(result[0])}
 
 @app.post('/api/v1/single_proportion_test')
+@negotiated
+@coalesce_requests('single_proportion_test')
 def single_proportion_test(single_proportion_test_n: SingleProportionTestParams):
     """
     This function calculates the sample size required to achieve a target power for a single-proportion z-test using an R function.
@@ -698,6 +992,9 @@ def single_proportion_test(single_proportion_test_n: SingleProportionTestParams)
     - **power**: The desired power level (e.g., 0.80 or 0.90) to detect the specified difference in proportions. Power refers to the likelihood of correctly rejecting the null hypothesis when there is a true difference.
     - **alternative**: The type of alternative hypothesis, which specifies whether the user is conducting a two-tailed test 
       (the default) or a one-tailed test. A one-tailed test is appropriate when the user expects the sample proportion to differ in a specific direction.
+    - **method**: "normal" (the default) uses the arcsine approximation above. "exact" uses the exact binomial test (two-sided as in R's
+      binom.test, by null likelihood rather than equal tails), which is more accurate for rare events; the result is then the smallest stable sample size, and the response also reports the smallest 
+      sample size reaching the target power and the exact power curve around it.
 
     When to Use:
     - This function should be called when the task involves comparing a sample proportion to a known or hypothesized population proportion, 
@@ -720,13 +1017,18 @@ def single_proportion_test(single_proportion_test_n: SingleProportionTestParams)
       (e.g., proportion of smokers in a population) differs from a known or expected proportion.
     """
     '''Calculate sample size for a single-proportion test using an R function'''
-    print("Loading the R script")
-    # Load the R script
-    robjects.r.source("single_proportion_test.R")
+    if single_proportion_test_n.method == "exact":
+        return exact_sample_size(
+            exact_proportions.single_proportion_sample_size,
+            single_proportion_test_n.p0,
+            single_proportion_test_n.p1,
+            single_proportion_test_n.power,
+            single_proportion_test_n.alternative
+        )
 
     print("Getting the single_proportion_test function from R")
     # Retrieve the function defined in R
-    single_proportion_test_r = robjects.globalenv['single_proportion_test_n']
+    single_proportion_test_r = r_session.get_function('single_proportion_test_n')
 
     print(f"Calling the R function with power={single_proportion_test_n.power}, alternative={single_proportion_test_n.alternative}")
     # Call the R function with the parameters from the input model
@@ -742,6 +1044,7 @@ def single_proportion_test(single_proportion_test_n: SingleProportionTestParams)
     return {"result": float(result[0])}
 
 @app.post('/api/v1/cox_ph')
+@coalesce_requests('cox_ph')
 def cox_ph(cox_ph_n: CoxPhParams):
     """
     This function calculates the sample size required to achieve a target power for a Cox proportional hazards model using an R function.
@@ -790,13 +1093,9 @@ def cox_ph(cox_ph_n: CoxPhParams):
     - This function is especially useful in clinical trials or cohort studies where survival time is the outcome, and there is a need to adjust for multiple covariates.
     """
     '''Calculate sample size for a cox_ph using an R function'''
-    print("Loading the R script")
-    # Load the R script
-    robjects.r.source("cox_ph.R")
-
     print("Getting the cox_ph function from R")
     # Retrieve the function defined in R
-    cox_ph_r = robjects.globalenv['cox_ph_n']
+    cox_ph_r = r_session.get_function('cox_ph_n')
 
     print(f"Calling the R function with power={cox_ph_n.power}, theta={cox_ph_n.theta}, p={cox_ph_n.p}, psi={cox_ph_n.psi}")
     # Call the R function with the parameters from the input model
@@ -814,6 +1113,7 @@ def cox_ph(cox_ph_n: CoxPhParams):
 
 
 @app.post('/api/v1/correlation')
+@coalesce_requests('correlation')
 def correlation(correlation: Correlation):
     """
     This function calculates the sample size required to achieve a target power for correlation analysis using an R function.
@@ -856,13 +1156,9 @@ def correlation(correlation: Correlation):
       (e.g., height and weight) and provides the expected correlation coefficient, power, and alternative hypothesis type.
     """
 
-    print("Loading the R script")
-    # Load the R script
-    robjects.r.source("correlation.R")
-
     print("Getting the correlation function from R")
     # Retrieve the function defined in R
-    correlation_r = robjects.globalenv['correlation']
+    correlation_r = r_session.get_function('correlation')
 
     print(f"Calling the R function with r={correlation.r}, power={correlation.power}")
     # Call the R function with the parameters from the input model
@@ -878,6 +1174,7 @@ def correlation(correlation: Correlation):
 
 
 @app.post('/api/v1/kruskal-wallace')
+@coalesce_requests('kruskal-wallace')
 def kruskal_wallace(kruskal_wallace_test: KruskalWallace):
     """
     This function calculates the sample size required for a Kruskal-Wallace test using an R function.
@@ -922,13 +1219,9 @@ def kruskal_wallace(kruskal_wallace_test: KruskalWallace):
       approach and provides the number of groups, expected effect size, and desired power.
     """
 
-    print("Loading the R script")
-    # Load the R script
-    robjects.r.source("kruskal_wallace_test.R")
-
     print("Getting the kruskal_wallace_test function from R")
     # Retrieve the function defined in R
-    kruskal_wallace_test_r = robjects.globalenv['kruskal_wallace_test']
+    kruskal_wallace_test_r = r_session.get_function('kruskal_wallace_test')
 
     print(f"Calling the R function with k={kruskal_wallace_test.k}, f={kruskal_wallace_test.f}, power={kruskal_wallace_test.power}")
     # Call the R function with the parameters from the input model
@@ -944,6 +1237,7 @@ def kruskal_wallace(kruskal_wallace_test: KruskalWallace):
 
 
 @app.post('/api/v1/simple_linear_regression')
+@coalesce_requests('simple_linear_regression')
 def simple_linear_regression(simple_linear_regression: SimpleLinearRegression):
     """
     This function calculates the sample size required to achieve a target power for a simple linear regression analysis using an 
@@ -984,13 +1278,9 @@ def simple_linear_regression(simple_linear_regression: SimpleLinearRegression):
       outcome variables are assumed to be normally distributed.
     """
     """Calculate sample size for a simple linear regression using an R function"""
-    print("Loading the R script")
-    # Load the R script
-    robjects.r.source("simple_linear_regression.R")
-
     print("Getting the simple_linear_regression function from R")
-    # Get the simple_linear_regression_n function from R
-    simple_linear_regression_n_r = robjects.globalenv['simple_linear_regression']
+    # Get the preloaded simple_linear_regression_n function from the R session
+    simple_linear_regression_n_r = r_session.get_function('simple_linear_regression')
 
     print(f"Calling the R function with u={simple_linear_regression.u}, "
           f"f2={simple_linear_regression.f2}, "
@@ -1011,6 +1301,7 @@ def simple_linear_regression(simple_linear_regression: SimpleLinearRegression):
 
 
 @app.post('/api/v1/multiple_linear_regression')
+@coalesce_requests('multiple_linear_regression')
 def multiple_linear_regression(multiple_linear_regression: MultipleLinearRegression):
     """
     This function calculates the required sample size for multiple linear regression using an R function.
@@ -1053,13 +1344,9 @@ def multiple_linear_regression(multiple_linear_regression: MultipleLinearRegress
       2. The outcome variable is continuous
       3. The focus is on detecting relationships between predictors and the outcome
     """
-    print("Loading the R script")
-    # Load the R script
-    robjects.r.source("multiple_linear_regression.R")
-
     print("Getting the multiple_linear_regression function from R")
-    # Get the MLR function from R
-    multiple_linear_regression_r = robjects.globalenv['multiple_linear_regression']
+    # Get the preloaded MLR function from the R session
+    multiple_linear_regression_r = r_session.get_function('multiple_linear_regression')
 
     print(f"Calling the R function with u={multiple_linear_regression.u}, f2={multiple_linear_regression.f2}, power={multiple_linear_regression.power}")
     # Call the R function
@@ -1071,6 +1358,7 @@ def multiple_linear_regression(multiple_linear_regression: MultipleLinearRegress
 
 
 @app.post('/api/v1/one_mean_wilcoxon')
+@coalesce_requests('one_mean_wilcoxon')
 def one_mean_wilcoxon(one_mean_wilcoxon: OneMeanWilcoxon):
     """
     This function calculates the required sample size for a one-sample Wilcoxon test using an R function.
@@ -1117,13 +1405,9 @@ def one_mean_wilcoxon(one_mean_wilcoxon: OneMeanWilcoxon):
       2. Non-parametric analysis is preferred
       3. The focus is on detecting differences from a hypothesized value
     """
-    print("Loading the R script")
-    # Load the R script
-    robjects.r.source("one_mean_wilcoxon.R")
-
     print("Getting the one_mean_wilcoxon function from R")
-    # Get the Wilcoxon test function from R
-    one_mean_wilcoxon_r = robjects.globalenv['one_mean_wilcoxon']
+    # Get the preloaded Wilcoxon test function from the R session
+    one_mean_wilcoxon_r = r_session.get_function('one_mean_wilcoxon')
 
     print(f"Calling the R function with d={one_mean_wilcoxon.d}, power={one_mean_wilcoxon.power}, alternative={one_mean_wilcoxon.alternative}")
     # Call the R function
@@ -1135,6 +1419,7 @@ def one_mean_wilcoxon(one_mean_wilcoxon: OneMeanWilcoxon):
 
 
 @app.post('/api/v1/mann_whitney_test')
+@coalesce_requests('mann_whitney_test')
 def mann_whitney_test_n(mann_whitney_test: MannWhitneyTest):
     """
     This function calculates the required sample size for a Mann-Whitney test based on the specified effect size, desired power, and alternative hypothesis using an R function.
@@ -1168,13 +1453,9 @@ def mann_whitney_test_n(mann_whitney_test: MannWhitneyTest):
     - The agent can also use this function when the problem involves sample size determination for a study design where 
       non-parametric outcomes are assumed.
     """
-    print("Loading the R script")
-    # Load the R script
-    robjects.r.source("mann_whitney_test.R")
-
     print("Getting the mann_whitney_test function from R")
-    # Get the mann_whitney_test function from R
-    mann_whitney_test_n_r = robjects.globalenv['mann_whitney_test']
+    # Get the preloaded mann_whitney_test function from the R session
+    mann_whitney_test_n_r = r_session.get_function('mann_whitney_test')
 
     print(f"Calling the R function with delta={mann_whitney_test.d}, sd={mann_whitney_test.power}, and power={mann_whitney_test.alternative}")
     # Call the R function
@@ -1185,6 +1466,7 @@ def mann_whitney_test_n(mann_whitney_test: MannWhitneyTest):
     return {"result": float(result[0])}
 
 @app.post('/api/v1/paired_wilcoxon_test')
+@coalesce_requests('paired_wilcoxon_test')
 def paired_wilcoxon_test(paired_wilcoxon_test: PairedWilcoxonTest):
     """
     This function calculates the required sample size for a paired Wilcoxon test using an R function.
@@ -1231,13 +1513,9 @@ def paired_wilcoxon_test(paired_wilcoxon_test: PairedWilcoxonTest):
       2. Non-parametric analysis is preferred
       3. The focus is on detecting differences within pairs
     """
-    print("Loading the R script")
-    # Load the R script
-    robjects.r.source("paired_wilcoxon_test.R")
-
     print("Getting the paired_wilcoxon_test function from R")
-    # Get the paired Wilcoxon test function from R
-    paired_wilcoxon_test_r = robjects.globalenv['paired_wilcoxon_test']
+    # Get the preloaded paired Wilcoxon test function from the R session
+    paired_wilcoxon_test_r = r_session.get_function('paired_wilcoxon_test')
 
     print(f"Calling the R function with d={paired_wilcoxon_test.d}, power={paired_wilcoxon_test.power}, alternative={paired_wilcoxon_test.alternative}")
     # Call the R function
@@ -1247,5 +1525,472 @@ def paired_wilcoxon_test(paired_wilcoxon_test: PairedWilcoxonTest):
     # Return the result (required sample size)
     return {"result": float(result[0])}
 
+@app.post('/api/v1/group_sequential')
+@negotiated
+@coalesce_requests('group_sequential')
+def group_sequential_design(design: GroupSequentialDesign):
+    """
+    This function turns a fixed-sample size calculation into a group-sequential design with interim analyses.
+
+    The fixed sample size comes from the chosen test's own endpoint (at its 5% significance level). Efficacy
+    boundaries are computed for the requested number of looks with O'Brien-Fleming, Pocock or Lan-DeMets
+    alpha-spending boundaries, and the fixed sample size is multiplied by the design's inflation factor to give
+    the maximum sample size. The response lists, for each look, the cumulative sample size, the z boundary,
+    the nominal p-value threshold and the cumulative probability of stopping under H0 and H1.
+
+    Parameters:
+    - **test**: A test whose statistic is asymptotically normal (see GROUP_SEQUENTIAL_TESTS).
+    - **parameters**: The request body that test's endpoint expects, including the target power.
+    - **looks**: Number of analyses including the final one (defaults to the length of timing, or 5).
+    - **boundary**: "obrien_fleming", "pocock", "lan_demets_obrien_fleming" or "lan_demets_pocock".
+    - **timing**: Information fractions of the looks (increasing, ending at 1); equally spaced by default.
+    """
+    if design.test not in GROUP_SEQUENTIAL_TESTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Group-sequential designs are available for: {', '.join(GROUP_SEQUENTIAL_TESTS)}"
+        )
+    test_function, model_class = STATISTICAL_TESTS[design.test]
+    parameters = validate_parameters(model_class, design.parameters)
+    # The fixed-sample tests use two-sided alternatives unless a one-sided one is requested
+    sides = 1 if getattr(parameters, "alternative", "two.sided") in ("greater", "less", "one.sided") else 2
+
+    try:
+        sequential = group_sequential.design(
+            looks=design.looks or (len(design.timing) if design.timing else 5), alpha=0.05, power=parameters.power, sides=sides,
+            method=design.boundary, timing=design.timing
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Some tests (log-rank) return one sample size per group
+    fixed = test_function(parameters)["result"]
+    maximum = _scale(fixed, sequential["inflation_factor"])
+    for stage in sequential["stages"]:
+        stage["sample_size"] = _scale(maximum, stage["information_fraction"])
+
+    return {
+        **sequential,
+        "test": design.test,
+        "fixed_sample_size": fixed,
+        "max_sample_size": maximum,
+        "expected_sample_size_h0": _scale(maximum, sequential["expected_sample_fraction_h0"]),
+        "expected_sample_size_h1": _scale(maximum, sequential["expected_sample_fraction_h1"]),
+    }
+
+@app.post('/api/v1/equivalence_means')
+@coalesce_requests('equivalence_means')
+def equivalence_means(design: EquivalenceMeans):
+    """
+    This function calculates the sample size for an equivalence (TOST) or non-inferiority comparison of means.
+
+    Equivalence is concluded when two one-sided t-tests at the 5% level reject both "difference <= lower" and
+    "difference >= upper"; its exact power is computed with Owen's Q function. Non-inferiority is one one-sided
+    t-test against the margin, with exact noncentral t power. The result is the smallest whole sample size
+    reaching the target power.
+
+    Parameters:
+    - **hypothesis**: "equivalence" or "non_inferiority".
+    - **design**: "two_sample" (n per group), "one_sample" (mean against a reference value) or "paired" (number
+      of pairs).
+    - **delta**: Expected true difference, in the units of the outcome (0 by default).
+    - **sd**: Standard deviation of the outcome (of the within-pair differences for "paired").
+    - **lower**, **upper**: Equivalence margins for the difference, with lower < delta < upper.
+    - **margin**: Non-inferiority margin. Negative when higher is better (H0: difference <= margin), positive
+      when lower is better (H0: difference >= margin).
+    - **power**: The desired power.
+
+    The response also gives the achieved power and the large-sample (normal) approximation for comparison.
+    """
+    try:
+        return equivalence.means_sample_size(
+            design.hypothesis, design.delta, design.sd, design.power, design=design.design,
+            lower=design.lower, upper=design.upper, margin=design.margin
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post('/api/v1/equivalence_proportions')
+@coalesce_requests('equivalence_proportions')
+def equivalence_proportions(design: EquivalenceProportions):
+    """
+    This function calculates the sample size for an equivalence (TOST) or non-inferiority comparison of proportions.
+
+    The difference p1 - p2 (or p1 - p0 for one group against a known proportion) is tested with the normal
+    approximation and unpooled variances, at the 5% level for each one-sided test.
+
+    Parameters:
+    - **hypothesis**: "equivalence" or "non_inferiority".
+    - **design**: "two_sample" (n per group, needs p2) or "one_sample" (needs p0).
+    - **p1**: Expected proportion in the test group.
+    - **p2** / **p0**: Expected proportion in the reference group / known reference proportion.
+    - **lower**, **upper**: Equivalence margins for the difference, with lower < p1 - p2 < upper.
+    - **margin**: Non-inferiority margin for the difference, negative when higher is better.
+    - **power**: The desired power.
+    """
+    try:
+        return equivalence.proportions_sample_size(
+            design.hypothesis, design.p1, design.reference, design.power, design=design.design,
+            lower=design.lower, upper=design.upper, margin=design.margin
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post('/api/v1/survival_design')
+@negotiated
+@coalesce_requests('survival_design')
+def survival_design(design: SurvivalDesign):
+    """
+    This function calculates the events and sample size of a two-arm survival trial from its accrual and follow-up.
+
+    Unlike log_rank_test, which needs the event probabilities over the study as inputs, this derives them
+    (Lachin-Foulkes): patients enter over the accrual period, are followed until the analysis a minimum
+    follow-up after the last entry, may drop out, and have piecewise-exponential hazards. Any of RR, dropout,
+    follow_up and accrual_time / accrual_rate may be a list; the response then has one row per combination
+    (under "scenarios"), e.g. a table trading accrual duration against follow-up.
+
+    Parameters:
+    - **power**: The desired power (two-sided 5% level).
+    - **RR**: Hazard ratio of the experimental over the control arm (cox_ph's theta).
+    - **k**: Allocation ratio experimental:control (for cox_ph's p, k = p / (1 - p)).
+    - **hazards** and **breaks**: Control-arm hazard rates and the times where they change; or
+      **median_control**: median survival in the control arm, for a constant hazard.
+    - **dropout**: Dropout hazard rate.
+    - **accrual_time** or **accrual_rate**: Length of the accrual period, or patients per time unit (the accrual
+      time is then solved for).
+    - **follow_up**: Minimum follow-up after the last patient enters.
+    - **accrual_shape**: 0 for uniform entry; positive when enrollment speeds up.
+    - **method**: "lachin_foulkes" (default) or "schoenfeld".
+
+    Each row gives the event probabilities pE and pC (usable in log_rank_test), the required events, the
+    total sample size, [nE, nC] as result, the study duration and the accrual rate.
+    """
+    hazards = design.hazards if design.hazards is not None else [math.log(2) / design.median_control]
+    try:
+        return survival.survival_design(
+            design.power, design.RR, hazards, design.breaks, k=design.k, dropout=design.dropout,
+            accrual_time=design.accrual_time, accrual_rate=design.accrual_rate, follow_up=design.follow_up,
+            accrual_shape=design.accrual_shape, method=design.method
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post('/api/v1/optimal_allocation')
+@negotiated
+@coalesce_requests('optimal_allocation')
+def optimal_allocation(design: AllocationDesign):
+    """
+    This function finds the allocation ratio (and cluster size) that minimizes cost or total sample size.
+
+    The fixed-sample endpoints use 1:1 allocation (log_rank_test takes k as an input). When subjects cost more
+    in one arm, or an arm's enrollment or budget is capped, an unequal split reaches the same power more
+    cheaply. Every candidate ratio k = nE / nC (and cluster size, when icc > 0) is sized for every target power
+    in one vectorized pass, priced, checked against the constraints, and the best ratio is then refined
+    locally. Power uses the same formulas as the test's endpoint, generalized to unequal arms.
+
+    Parameters:
+    - **test**: "two_sample_t_test", "two_proportions_test" or "log_rank_test".
+    - **parameters**: That test's request body without power (log_rank_test: without k).
+    - **powers**: Target powers (default 0.8, 0.85 and 0.9).
+    - **cost_E**, **cost_C**: Cost per subject in each arm.
+    - **budget**, **max_cost_E**, **max_cost_C**, **max_nE**, **max_nC**: Optional caps on the total cost, each
+      arm's cost and each arm's enrollment.
+    - **icc**, **cluster_cost**, **cluster_sizes**: For cluster-randomized designs; arms are inflated by the
+      design effect 1 + (m - 1) icc and rounded to whole clusters of size m.
+    - **ratio_range**: The range of k searched.
+    - **objective**: "cost" or "n".
+
+    The response gives the best design per target power (with its saving over 1:1), the 1:1 designs, and the
+    Pareto front of cost, total N and power over all feasible candidates.
+    """
+    _, model_class = STATISTICAL_TESTS[design.test]
+    fixed = {"power": design.powers[0], **({"k": 1} if design.test == "log_rank_test" else {})}
+    parameters = validate_parameters(model_class, {**design.parameters, **fixed}).model_dump()
+    costs = allocation.CostModel(
+        cost_e=design.cost_E, cost_c=design.cost_C, cluster_cost=design.cluster_cost, icc=design.icc,
+        budget=design.budget, max_cost_e=design.max_cost_E, max_cost_c=design.max_cost_C,
+        max_n_e=design.max_nE, max_n_c=design.max_nC
+    )
+    try:
+        return allocation.optimize_allocation(
+            design.test, parameters, design.powers, costs, ratio_range=design.ratio_range,
+            cluster_sizes=design.cluster_sizes, objective=design.objective
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post('/api/v1/sample_size_reestimation')
+@negotiated
+@coalesce_requests('sample_size_reestimation')
+def sample_size_reestimation(design: AdaptiveDesign):
+    """
+    This function computes conditional power at an interim look and re-estimates the sample size.
+
+    Given the planned design and interim data, it returns the conditional power at the planned sample size
+    (under the observed and the planned effect), the second-stage size reaching the target conditional power
+    under the Cui-Hung-Wang rule (weighted inverse-normal final test, valid for any increase) and under the
+    Mehta-Pocock promising-zone rule (conventional final test, increased only in the promising zone), and
+    the full decision surface: both rules over a grid of interim statistics, and the conditional power of every
+    candidate second-stage size.
+
+    Parameters:
+    - **test**: "two_sample_t_test", "two_proportions_test", "paired_T_test" or "one_mean_T_test".
+    - **parameters**: The planned request body of that test, including power.
+    - **planned_n**: Planned sample size per group; computed with the test's endpoint when omitted.
+    - **interim**: n1 per group and either z or the observed effect (delta and sd, p1 and p2, or d).
+    - **max_n**: Cap on the total sample size per group (default twice the planned one).
+    - **target_power**: Target conditional power (default: the planned power).
+    - **cp_min**: Lower end of the promising zone (default: the smallest value keeping the conventional test
+      valid).
+    - **second_stage_sizes**: Candidate second-stage sizes of the conditional power surface.
+
+    Sample sizes are per group and one-sided alpha is 0.025, matching the fixed-sample endpoints' two-sided 5%.
+    """
+    test_function, model_class = STATISTICAL_TESTS[design.test]
+    parameters = validate_parameters(model_class, design.parameters)
+    if design.planned_n is not None:
+        planned_n = design.planned_n
+    else:
+        planned_n = math.ceil(test_function(parameters)["result"])
+
+    try:
+        look = adaptive.interim_look(
+            design.test, parameters.model_dump(), planned_n, design.interim.model_dump(), max_n=design.max_n
+        )
+        return {
+            "test": design.test,
+            **adaptive.reestimate(
+                look, design.target_power or parameters.power, cp_min=design.cp_min,
+                second_stage_sizes=design.second_stage_sizes
+            ),
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+PILOT_FORMATS = ("csv", "parquet")
+
+async def stream_pilot_chunks(request: Request, file_format: Optional[str], columns: List[str], consume,
+                              delimiter: str = ","):
+    """
+    Parse an uploaded pilot file as it arrives and hand each column chunk to ``consume``
+
+    The request body is the raw file. CSV is parsed incrementally as the body streams in; Parquet, whose
+    footer comes last, is spooled to a temporary file and read one record batch at a time. Parsing and
+    ``consume`` run in the threadpool so a large upload does not block the event loop.
+    """
+    if file_format is None:
+        file_format = "parquet" if "parquet" in request.headers.get("content-type", "") else "csv"
+    if file_format not in PILOT_FORMATS:
+        raise HTTPException(status_code=415, detail=f"format must be one of {', '.join(PILOT_FORMATS)}")
+
+    def feed(chunks):
+        for chunk in chunks:
+            consume(chunk)
+
+    try:
+        if file_format == "csv":
+            chunker = pilot_data.CSVChunker(columns, delimiter=delimiter)
+            async for piece in request.stream():
+                if piece:
+                    await run_in_threadpool(lambda: feed(chunker.feed(piece)))
+            await run_in_threadpool(lambda: feed(chunker.close()))
+        else:
+            with tempfile.NamedTemporaryFile(suffix=".parquet") as spool:
+                async for piece in request.stream():
+                    spool.write(piece)
+                spool.flush()
+                await run_in_threadpool(lambda: feed(pilot_data.parquet_chunks(spool.name, columns)))
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def validated_parameter_sets(candidates: Dict[str, Dict[str, Any]]):
+    """Split estimated request bodies into those the tests' models accept and the reasons for the rest"""
+    tests, skipped = {}, {}
+    for name, parameters in candidates.items():
+        _, model_class = STATISTICAL_TESTS[name]
+        try:
+            tests[name] = {"endpoint": f"/api/v1/{name}", "parameters": model_class(**parameters).model_dump()}
+        except ValidationError as e:
+            skipped[name] = "; ".join(error["msg"] for error in e.errors(include_url=False))
+    return tests, skipped
+
+@app.post('/api/v1/pilot/effect_sizes')
+async def pilot_effect_sizes(
+    request: Request,
+    outcome: Optional[str] = None,
+    group: Optional[str] = None,
+    reference: Optional[str] = None,
+    paired_with: Optional[str] = None,
+    predictors: Optional[str] = None,
+    category: Optional[str] = None,
+    mu0: float = 0.0,
+    p0: float = Query(0.5, ge=0, le=1),
+    power: float = Query(0.8, gt=0, lt=1),
+    format: Optional[str] = None,
+    delimiter: str = Query(",", min_length=1, max_length=1),
+):
+    """
+    This function estimates effect sizes from uploaded pilot data, ready to send to the test endpoints.
+
+    The request body is the pilot file itself (CSV, or Parquet with pyarrow installed), e.g.
+    ``curl --data-binary @pilot.csv "/api/v1/pilot/effect_sizes?outcome=y&group=arm"``. It is read in a single
+    streaming pass into running (Welford) summaries, so files much larger than memory can be used. Missing
+    values (empty, NA, NaN, null) are skipped.
+
+    Query parameters:
+    - **outcome**: Numeric outcome column (0/1 for the proportion tests).
+    - **group**: Grouping column; two levels give the two-group tests, two or more the ANOVA tests.
+    - **reference**: Level of group used as the control (p2 / second group); the other level comes first.
+    - **paired_with**: Second measurement of the outcome per subject, for the paired tests.
+    - **predictors**: Comma-separated numeric predictors of the outcome, for correlation and regression.
+    - **category**: Categorical column crossed with group, for the chi-squared test.
+    - **mu0**, **p0**: Reference mean and proportion of the one-sample tests.
+    - **power**: Power placed in the returned parameter sets (default 0.8).
+    - **format**: "csv" or "parquet" (default: from the Content-Type, else csv); **delimiter** for CSV.
+
+    For every test the columns support, the response gives its endpoint and a validated request body;
+    estimates a test rejects (e.g. a zero effect) are listed under skipped with the reason.
+    """
+    try:
+        spec = pilot_data.PilotSpec(
+            outcome=outcome, group=group, paired_with=paired_with,
+            predictors=[name.strip() for name in predictors.split(",") if name.strip()] if predictors else (),
+            category=category, reference=reference, mu0=mu0, p0=p0
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    summary = pilot_data.PilotSummary(spec)
+    await stream_pilot_chunks(request, format, spec.columns, summary.update, delimiter=delimiter)
+
+    try:
+        candidates = summary.parameter_sets(power)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    tests, skipped = validated_parameter_sets(candidates)
+    return {"summary": summary.summary(), "tests": tests, "skipped": skipped}
+
+@app.post('/api/v1/pilot/survival')
+async def pilot_survival(
+    request: Request,
+    time: str,
+    status: str,
+    group: Optional[str] = None,
+    reference: Optional[str] = None,
+    covariate: Optional[str] = None,
+    horizon: Optional[float] = None,
+    power: float = Query(0.8, gt=0, lt=1),
+    format: Optional[str] = None,
+    delimiter: str = Query(",", min_length=1, max_length=1),
+):
+    """
+    This function estimates log_rank_test and cox_ph inputs from uploaded pilot time-to-event data.
+
+    The request body is the pilot file (CSV, or Parquet with pyarrow installed), streamed as for
+    /api/v1/pilot/effect_sizes. Rows are reduced to event and subject counts per distinct time and arm, and the
+    estimators run on the time-sorted counts: Kaplan-Meier event probabilities in O(n log n), and the Cox
+    hazard ratio by Newton's method with one pass over the distinct times per step.
+
+    Query parameters:
+    - **time**: Follow-up time column (time of event or censoring).
+    - **status**: Event indicator column: 1 for an event, 0 for censoring.
+    - **group**: Treatment arm column with two levels; gives pE, pC, RR and k for log_rank_test.
+    - **reference**: Control level of group (pC); the other level is experimental (pE).
+    - **covariate**: 0/1 covariate of interest for cox_ph; the experimental-arm indicator when omitted.
+    - **horizon**: Study horizon of the event probabilities; default the last time observed in both arms.
+    - **power**: Power placed in the returned parameter sets (default 0.8).
+    - **format**: "csv" or "parquet" (default: from the Content-Type, else csv); **delimiter** for CSV.
+
+    The response gives the Kaplan-Meier event probabilities and medians, the hazard ratio with its 95% interval
+    and the log-rank test, and validated request bodies for log_rank_test and cox_ph (psi is the pooled
+    Kaplan-Meier event probability by the horizon).
+    """
+    try:
+        spec = pilot_data.SurvivalSpec(time, status, group=group, covariate=covariate, reference=reference,
+                                       horizon=horizon)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    summary = pilot_data.SurvivalSummary(spec)
+    await stream_pilot_chunks(request, format, spec.columns, summary.update, delimiter=delimiter)
+
+    try:
+        estimates, candidates = await run_in_threadpool(summary.estimate, power)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    tests, skipped = validated_parameter_sets(candidates)
+    return {"summary": estimates, "tests": tests, "skipped": skipped}
+
+@app.post('/api/v1/assurance')
+@coalesce_requests('assurance')
+def assurance_sample_size(design: AssuranceDesign):
+    """
+    This function calculates the sample size that reaches a target assurance (Bayesian expected power).
+
+    Assurance is power averaged over a prior on the uncertain parameters instead of evaluated at a point
+    estimate. A success is a significant result in the favourable direction (that of a one-sided alternative,
+    or of the prior's centre), so assurance levels off at the prior probability of such an effect, reported as
+    max_assurance. Priors are integrated with Gauss-Hermite (normal, log-normal) or Gauss-Legendre (beta)
+    quadrature, so one request replaces hundreds of point power calculations.
+
+    Parameters:
+    - **test**: two_sample_t_test (priors on delta and/or sd), one_mean_T_test / paired_T_test (prior on d),
+      two_proportions_test (beta priors on p1 and/or p2), single_proportion_test (beta prior on p1, p0 fixed)
+      or log_rank_test (log-normal prior on RR; k, pE and pC fixed).
+    - **priors**: Parameter -> {"distribution": "normal", "mean", "sd"}, {"distribution": "lognormal",
+      "meanlog", "sdlog"} or {"distribution": "beta", "a", "b"}.
+    - **parameters**: Fixed values of the remaining parameters.
+    - **assurance**: Target assurance (default 0.8).
+    - **alternative**: "two.sided", "one.sided", "greater" or "less" (log_rank_test: "two.sided" or "one.sided").
+    - **n**: Optional; report the assurance of this N (per group, or events for log_rank_test) instead.
+
+    The result is the sample size per group (for log_rank_test, [nE, nC] as in the log_rank_test endpoint),
+    together with the achieved assurance, max_assurance and the conventional power at the prior's centre.
+    """
+    try:
+        return assurance.assurance_design(
+            design.test,
+            {name: prior.model_dump() for name, prior in design.priors.items()},
+            design.parameters,
+            target=design.assurance,
+            alternative=design.alternative,
+            n=design.n
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _scale(size, factor):
+    return [n * factor for n in size] if isinstance(size, list) else size * factor
+
+# Test name -> (handler, parameter model), shared by the AI pipeline and the profiler
+STATISTICAL_TESTS = {
+    "two_sample_t_test": (two_sample_t_test, TwoSampleTTest),
+    "paired_T_test": (paired_t_test, PairedTTest),
+    "one_mean_T_test": (one_mean_T_test, OneMeanTTestParams),
+    "one_way_ANOVA": (one_way_ANOVA, OneWayANOVAParams),
+    "log_rank_test": (log_rank_test, LogRankTest),
+    "chi_squared_test": (chi_squared_test, ChiSquaredTestParams),
+    "two_proportions_test": (two_proportions_test, TwoProportionsTestParams),
+    "single_proportion_test": (single_proportion_test, SingleProportionTestParams),
+    "cox_ph": (cox_ph, CoxPhParams),
+    "correlation": (correlation, Correlation),
+    "kruskal-wallace": (kruskal_wallace, KruskalWallace),
+    "simple_linear_regression": (simple_linear_regression, SimpleLinearRegression),
+    "multiple_linear_regression": (multiple_linear_regression, MultipleLinearRegression),
+    "one_mean_wilcoxon": (one_mean_wilcoxon, OneMeanWilcoxon),
+    "mann_whitney_test": (mann_whitney_test_n, MannWhitneyTest),
+    "paired_wilcoxon_test": (paired_wilcoxon_test, PairedWilcoxonTest),
+    "equivalence_means": (equivalence_means, EquivalenceMeans),
+    "equivalence_proportions": (equivalence_proportions, EquivalenceProportions),
+}
+
+# Tests with asymptotically normal statistics, whose sample sizes scale with the sequential inflation factor
+GROUP_SEQUENTIAL_TESTS = (
+    "two_sample_t_test", "paired_T_test", "one_mean_T_test", "log_rank_test", "two_proportions_test",
+    "single_proportion_test", "cox_ph", "correlation", "one_mean_wilcoxon", "mann_whitney_test",
+    "paired_wilcoxon_test",
+)
+
 if __name__ == '__main__':
-    uvicorn.run(app, host="0.0.0.0", port=5000)
+    # Single-process development server; use serve.py to run multiple workers in production
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("POWERGPT_PORT", "5001")))
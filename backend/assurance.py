@@ -0,0 +1,264 @@
+"""
+PowerGPT Bayesian Assurance
+===========================
+Assurance (expected power) and the sample size reaching a target assurance.
+
+Assurance is the power of the design averaged over a prior distribution of
+the uncertain parameters rather than evaluated at a point estimate
+(O'Hagan, Stevens & Campbell, 2005). A "success" is a significant result in
+the favourable direction: the direction of a one-sided alternative, or for
+two-sided tests the direction of the prior's centre. Unlike power, assurance
+does not tend to 1 as N grows but to the prior probability that the effect
+lies in that direction, reported as ``max_assurance``.
+
+Each prior is replaced by a fixed quadrature rule, so an assurance is one
+vectorized power evaluation over the nodes:
+
+- normal priors: Gauss-Hermite nodes
+- log-normal priors: Gauss-Hermite nodes on the log scale
+- beta priors: Gauss-Legendre nodes on the probability scale, mapped
+  through the beta quantile function
+
+Priors on two parameters (p1 and p2) use the tensor product of their rules.
+The sample size is found by bracketing and Brent's method on continuous N.
+
+Power follows the existing endpoints: the noncentral t of power.t.test /
+pwr.t.test for t-tests, the arcsine approximation of pwr.2p.test /
+pwr.p.test for proportions, and Freedman's formula of ssizeCT for the
+log-rank test (where N is the number of events).
+"""
+
+import math
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy.polynomial.hermite_e import hermegauss
+from numpy.polynomial.legendre import leggauss
+from scipy.optimize import brentq
+from scipy.special import ndtr
+from scipy.stats import beta as beta_distribution
+from scipy.stats import nct, norm
+from scipy.stats import t as t_distribution
+
+ALPHA = 0.05
+
+# Quadrature nodes per uncertain parameter
+QUADRATURE_NODES = 48
+
+# Largest N the search considers (per group, or events for the log-rank test)
+MAX_N = 1e7
+
+
+def prior_rule(prior: Dict[str, Any], nodes: int = QUADRATURE_NODES) -> Tuple[np.ndarray, np.ndarray, float]:
+    """Quadrature values, weights and the centre of a prior"""
+    distribution = prior["distribution"]
+    if distribution in ("normal", "lognormal"):
+        x, w = hermegauss(nodes)
+        w = w / math.sqrt(2 * math.pi)
+        if distribution == "normal":
+            return prior["mean"] + prior["sd"] * x, w, prior["mean"]
+        return np.exp(prior["meanlog"] + prior["sdlog"] * x), w, math.exp(prior["meanlog"])
+    if distribution == "beta":
+        u, w = leggauss(nodes)
+        a, b = prior["a"], prior["b"]
+        return beta_distribution.ppf((u + 1) / 2, a, b), w / 2, a / (a + b)
+    raise ValueError(f"Unknown prior distribution {distribution!r}")
+
+
+def _t_power(n, d: np.ndarray, direction: int, sides: int, one_sample: bool) -> np.ndarray:
+    df = n - 1 if one_sample else 2 * n - 2
+    ncp = d * math.sqrt(n if one_sample else n / 2)
+    return nct.sf(t_distribution.isf(ALPHA / sides, df), df, direction * ncp)
+
+
+def _arcsine(p_a, p_b):
+    return 2 * np.arcsin(np.sqrt(p_a)) - 2 * np.arcsin(np.sqrt(p_b))
+
+
+class Family:
+    """How one test's power depends on N and its parameters"""
+
+    def __init__(self, parameters: Sequence[str], uncertain: Dict[str, Sequence[str]],
+                 effect: Callable[..., Any], power: Callable[..., np.ndarray], minimum_n: float,
+                 directional: bool = True, direction_labels: Tuple[str, str] = ("greater", "less")):
+        """
+        Args:
+            parameters: Parameters the test needs, fixed or with a prior
+            uncertain: Parameter -> prior distributions it may have
+            effect: Signed effect from the parameters; its sign is the favourable direction
+            power: Power in a direction, as power(n, params, direction, sides)
+            minimum_n: Smallest N the power formula accepts
+            directional: Whether "greater" / "less" alternatives are meaningful
+            direction_labels: How a positive and a negative effect are reported
+        """
+        self.parameters = parameters
+        self.uncertain = uncertain
+        self.effect = effect
+        self.power = power
+        self.minimum_n = minimum_n
+        self.directional = directional
+        self.direction_labels = direction_labels
+
+
+def _t_family(one_sample: bool, standardized: bool) -> Family:
+    def d(params):
+        return params["d"] if standardized else params["delta"] / params["sd"]
+    return Family(
+        parameters=("d",) if standardized else ("delta", "sd"),
+        uncertain={"d": ("normal",)} if standardized else {"delta": ("normal",), "sd": ("lognormal",)},
+        effect=d,
+        power=lambda n, params, direction, sides: _t_power(n, d(params), direction, sides, one_sample),
+        minimum_n=2.0,
+    )
+
+
+def _proportions_family(first: str, second: str, group_factor: float) -> Family:
+    def h(params):
+        return _arcsine(params[first], params[second])
+    return Family(
+        parameters=(first, second),
+        uncertain={first: ("beta",), second: ("beta",)},
+        effect=h,
+        power=lambda n, params, direction, sides: ndtr(
+            direction * h(params) * np.sqrt(n * group_factor) - norm.isf(ALPHA / sides)),
+        minimum_n=1e-3,
+    )
+
+
+def _log_rank_power(events, params, direction, sides):
+    k, rr = params["k"], params["RR"]
+    # Freedman: sqrt(k m) (1 - RR) / (k RR + 1) is the expected z statistic after m events
+    return ndtr(direction * np.sqrt(k * events) * (1 - rr) / (k * rr + 1) - norm.isf(ALPHA / sides))
+
+
+FAMILIES = {
+    "two_sample_t_test": _t_family(one_sample=False, standardized=False),
+    "one_mean_T_test": _t_family(one_sample=True, standardized=True),
+    "paired_T_test": _t_family(one_sample=True, standardized=True),
+    "two_proportions_test": _proportions_family("p1", "p2", 0.5),
+    "single_proportion_test": _proportions_family("p1", "p0", 1.0),
+    "log_rank_test": Family(
+        parameters=("k", "pE", "pC", "RR"),
+        uncertain={"RR": ("lognormal",)},
+        effect=lambda params: 1 - params["RR"],
+        power=_log_rank_power,
+        minimum_n=1e-3,
+        directional=False,
+        direction_labels=("RR < 1", "RR > 1"),
+    ),
+}
+
+ASSURANCE_TESTS = tuple(FAMILIES)
+
+
+class AssuranceProblem:
+    """Quadrature grid over the priors of one design, with power and assurance at any N"""
+
+    def __init__(self, test: str, priors: Dict[str, Dict[str, Any]], parameters: Dict[str, float],
+                 alternative: str = "two.sided", nodes: int = QUADRATURE_NODES):
+        if test not in FAMILIES:
+            raise ValueError(f"Assurance is available for: {', '.join(ASSURANCE_TESTS)}")
+        family = self.family = FAMILIES[test]
+        self.test = test
+        for name, prior in priors.items():
+            if name not in family.uncertain:
+                raise ValueError(f"{test} accepts priors on: {', '.join(family.uncertain)}")
+            if prior["distribution"] not in family.uncertain[name]:
+                raise ValueError(f"The prior on {name} must be {' or '.join(family.uncertain[name])}")
+            if name in parameters:
+                raise ValueError(f"{name} has both a fixed value and a prior")
+        missing = [name for name in family.parameters if name not in priors and name not in parameters]
+        if missing:
+            raise ValueError(f"{test} needs values or priors for: {', '.join(missing)}")
+        if not priors:
+            raise ValueError("At least one parameter needs a prior")
+
+        # Tensor-product grid: each uncertain parameter varies along its own axis
+        grids, weights, centre = [], [], dict(parameters)
+        for name, prior in priors.items():
+            values, w, centre[name] = prior_rule(prior, nodes)
+            grids.append(values)
+            weights.append(w)
+        mesh = np.meshgrid(*grids, indexing="ij")
+        self.params = dict(parameters)
+        self.params.update({name: values.ravel() for name, values in zip(priors, mesh)})
+        self.weights = np.prod(np.meshgrid(*weights, indexing="ij"), axis=0).ravel()
+        self.centre = centre
+
+        self.sides = 2 if alternative == "two.sided" else 1
+        if alternative in ("greater", "less"):
+            if not family.directional:
+                raise ValueError(f"{test} takes 'two.sided' or 'one.sided'; the favourable direction "
+                                 "comes from the prior")
+            self.direction = 1 if alternative == "greater" else -1
+        else:
+            centre_effect = float(family.effect(centre))
+            if centre_effect == 0:
+                raise ValueError("The prior is centred on no effect; choose 'greater' or 'less'")
+            self.direction = 1 if centre_effect > 0 else -1
+        self.alternative = alternative
+
+        effect = np.broadcast_to(family.effect(self.params), self.weights.shape)
+        self.max_assurance = float(self.weights[self.direction * effect > 0].sum())
+
+    def assurance(self, n: float) -> float:
+        return float(np.dot(self.weights, self.family.power(n, self.params, self.direction, self.sides)))
+
+    def power_at_centre(self, n: float) -> float:
+        return float(self.family.power(n, self.centre, self.direction, self.sides))
+
+    def sample_size(self, target: float) -> float:
+        """Smallest continuous N whose assurance reaches ``target``"""
+        if target >= self.max_assurance:
+            raise ValueError(f"Assurance cannot exceed {self.max_assurance:.4f}, the prior probability of an "
+                             "effect in the favourable direction; lower the target or sharpen the prior")
+        lo = self.family.minimum_n
+        if self.assurance(lo) >= target:
+            return lo
+        hi = max(2 * lo, 8.0)
+        while self.assurance(hi) < target:
+            lo, hi = hi, hi * 4
+            if hi > MAX_N:
+                raise ValueError(f"Target assurance is not reached for N up to {MAX_N:.0f}")
+        return brentq(lambda n: self.assurance(n) - target, lo, hi, xtol=1e-6, rtol=1e-10)
+
+
+def _report(problem: AssuranceProblem, n: float) -> Dict[str, Any]:
+    report = {
+        "assurance": problem.assurance(n),
+        "max_assurance": problem.max_assurance,
+        "power_at_prior_centre": problem.power_at_centre(n),
+        "alternative": problem.alternative,
+        "direction": problem.family.direction_labels[0 if problem.direction > 0 else 1],
+        "quadrature_nodes": int(problem.weights.size),
+    }
+    if problem.test == "log_rank_test":
+        # Events to subjects as ssizeCT does: nC (k pE + pC) = m and nE = k nC
+        k, p_e, p_c = problem.centre["k"], problem.centre["pE"], problem.centre["pC"]
+        n_c = n / (k * p_e + p_c)
+        report["events"] = n
+        report["result"] = [float(math.ceil(k * n_c)), float(math.ceil(n_c))]
+    else:
+        report["result"] = n
+    return report
+
+
+def assurance_design(test: str, priors: Dict[str, Dict[str, Any]], parameters: Dict[str, float],
+                     target: float = 0.8, alternative: str = "two.sided",
+                     n: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Sample size reaching a target assurance, or the assurance of a given N
+
+    Args:
+        test: One of ASSURANCE_TESTS
+        priors: Parameter -> prior, e.g. {"d": {"distribution": "normal", "mean": 0.5, "sd": 0.2}}
+        parameters: Values of the parameters without a prior
+        target: Assurance to reach when ``n`` is omitted
+        alternative: "two.sided", "one.sided", "greater" or "less"
+        n: Evaluate this N (per group; events for the log-rank test) instead of solving for one
+    """
+    problem = AssuranceProblem(test, priors, parameters, alternative)
+    if n is None:
+        n = problem.sample_size(target)
+        return {"test": test, "target_assurance": target, **_report(problem, n)}
+    return {"test": test, **_report(problem, n)}
@@ -0,0 +1,188 @@
+"""
+PowerGPT Response Encoding
+==========================
+Fast JSON by default, plus content negotiation for array results.
+
+``DefaultJSONResponse`` is orjson-backed when orjson is installed. Handlers
+decorated with ``@negotiated`` additionally honour the Accept header:
+
+- ``application/msgpack``                MessagePack of the whole payload
+- ``application/vnd.apache.arrow.stream`` Arrow IPC stream of the tabular part
+- ``application/x-ndjson``               one JSON object per row, streamed and
+                                         gzip-compressed when the client accepts gzip
+
+Handlers keep returning plain dicts, so direct Python callers (such as the
+AI pipeline) are unaffected. msgpack and pyarrow are optional; an encoding
+whose library is missing is simply not offered.
+"""
+
+import functools
+import inspect
+import json
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as DefaultJSONResponse
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+    DefaultJSONResponse = JSONResponse
+
+MSGPACK = "application/msgpack"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+NDJSON = "application/x-ndjson"
+JSON = "application/json"
+
+# Media types accepted as aliases of the canonical ones above
+MEDIA_ALIASES = {"application/x-msgpack": MSGPACK, "application/vnd.apache.arrow.file": ARROW_STREAM}
+
+# Rows per NDJSON chunk handed to the compressor
+NDJSON_CHUNK_ROWS = 1000
+
+
+def _available_encodings() -> List[str]:
+    available = [JSON, NDJSON]
+    try:
+        import msgpack  # noqa: F401
+        available.append(MSGPACK)
+    except ImportError:
+        pass
+    try:
+        import pyarrow  # noqa: F401
+        available.append(ARROW_STREAM)
+    except ImportError:
+        pass
+    return available
+
+
+def parse_accept(header: Optional[str]) -> List[Tuple[str, float]]:
+    """Media types from an Accept header ordered by preference"""
+    ranges = []
+    for position, part in enumerate((header or "").split(",")):
+        fields = part.strip().split(";")
+        media = fields[0].strip().lower()
+        if not media:
+            continue
+        q = 1.0
+        for param in fields[1:]:
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        ranges.append((MEDIA_ALIASES.get(media, media), q, position))
+    ranges.sort(key=lambda item: (-item[1], item[2]))
+    return [(media, q) for media, q, _ in ranges if q > 0]
+
+
+def choose_media_type(header: Optional[str]) -> str:
+    """Best supported media type for an Accept header; JSON when nothing specific matches"""
+    available = _available_encodings()
+    for media, _ in parse_accept(header):
+        if media in available:
+            return media
+        if media in ("*/*", "application/*"):
+            return JSON
+    return JSON
+
+
+def tabular_columns(payload: Dict[str, Any]) -> Tuple[Dict[str, list], Dict[str, Any]]:
+    """
+    Split a payload into columns and scalar metadata
+
+    The first value that is a list of scalars, a list of row dicts or a dict
+    of equal-length lists becomes the table; everything else is metadata.
+    """
+    for key, value in payload.items():
+        metadata = {k: v for k, v in payload.items() if k != key}
+        if isinstance(value, list):
+            if value and all(isinstance(row, dict) for row in value):
+                names = list(dict.fromkeys(name for row in value for name in row))
+                return {name: [row.get(name) for row in value] for name in names}, metadata
+            return {key: value}, metadata
+        if isinstance(value, dict) and value and all(isinstance(column, list) for column in value.values()):
+            if len({len(column) for column in value.values()}) == 1:
+                return dict(value), metadata
+    return {}, payload
+
+
+def _dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def _ndjson_rows(columns: Dict[str, list]) -> Iterator[bytes]:
+    names = list(columns)
+    length = len(next(iter(columns.values()))) if columns else 0
+    for start in range(0, length, NDJSON_CHUNK_ROWS):
+        stop = min(start + NDJSON_CHUNK_ROWS, length)
+        yield b"".join(
+            _dumps({name: columns[name][i] for name in names}) + b"\n" for i in range(start, stop)
+        )
+
+
+def _gzip_stream(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def encode_response(request: Request, payload: Dict[str, Any]) -> Response:
+    """Encode a handler payload in the representation the client asked for"""
+    media_type = choose_media_type(request.headers.get("accept"))
+    headers = {"Vary": "Accept, Accept-Encoding"}
+
+    if media_type == MSGPACK:
+        import msgpack
+        return Response(msgpack.packb(payload, use_bin_type=True), media_type=MSGPACK, headers=headers)
+
+    if media_type == ARROW_STREAM:
+        import pyarrow as pa
+        columns, metadata = tabular_columns(payload)
+        table = pa.table(columns).replace_schema_metadata({"powergpt": json.dumps(metadata, default=str)})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return Response(sink.getvalue().to_pybytes(), media_type=ARROW_STREAM, headers=headers)
+
+    if media_type == NDJSON:
+        columns, _ = tabular_columns(payload)
+        body = _ndjson_rows(columns)
+        if "gzip" in (request.headers.get("accept-encoding") or "").lower():
+            headers["Content-Encoding"] = "gzip"
+            body = _gzip_stream(body)
+        return StreamingResponse(body, media_type=NDJSON, headers=headers)
+
+    return DefaultJSONResponse(payload, headers=headers)
+
+
+def negotiated(handler):
+    """
+    Decorator adding Accept-based encoding to a handler that returns a dict
+
+    FastAPI passes the incoming request; direct Python calls without one
+    still receive the plain dict.
+    """
+    signature = inspect.signature(handler)
+    request_parameter = inspect.Parameter(
+        "request", inspect.Parameter.KEYWORD_ONLY, default=None, annotation=Request
+    )
+
+    @functools.wraps(handler)
+    def wrapper(*args, request: Optional[Request] = None, **kwargs):
+        payload = handler(*args, **kwargs)
+        if request is None:
+            return payload
+        return encode_response(request, payload)
+
+    wrapper.__signature__ = signature.replace(parameters=[*signature.parameters.values(), request_parameter])
+    return wrapper
@@ -0,0 +1,277 @@
+"""
+PowerGPT Equivalence and Non-Inferiority
+========================================
+Sample sizes for equivalence (TOST) and non-inferiority designs on means
+and proportions.
+
+Equivalence is shown by two one-sided tests (TOST): H0 theta <= lower and
+H0 theta >= upper are both rejected at level alpha. For means the exact
+power of the two t-tests is a difference of two bivariate noncentral t
+probabilities, Owen's Q function (Owen, 1965; as in PowerTOST's
+``method = "exact"``):
+
+    Q_df(t, delta; 0, R) = integral_0^R Phi(t x / sqrt(df) - delta) chi_df(x) dx
+
+where chi_df is the density of the chi distribution. ``owens_q`` evaluates
+it for whole arrays of (t, delta, R) at once with a composite
+Gauss-Legendre rule over the bulk of the chi density (absolute error below
+1e-10). The nodes and chi-density weights depend only on df, so they are
+cached per df and shared by every evaluation with that df: both terms of
+a power, the steps of a sample-size search, a power curve over theta, and
+later requests. Only the panel that R cuts is re-integrated.
+
+Non-inferiority of means is a single one-sided t-test whose power is the
+noncentral t directly. Proportions use the normal approximation with
+unpooled variances (Chow, Shao & Wang, 2008).
+
+Margins are on the difference scale: theta = mean difference (or mean
+minus reference value), or p1 - p2 (p1 - p0). A non-inferiority margin is
+signed: a negative margin tests H0 theta <= margin (higher is better), a
+positive one H0 theta >= margin (lower is better).
+"""
+
+import math
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+from numpy.polynomial.legendre import leggauss
+from scipy.optimize import brentq
+from scipy.special import ndtr
+from scipy.stats import chi, nct, norm
+from scipy.stats import t as t_distribution
+
+ALPHA = 0.05
+
+HYPOTHESES = ("equivalence", "non_inferiority")
+MEAN_DESIGNS = ("two_sample", "one_sample", "paired")
+PROPORTION_DESIGNS = ("two_sample", "one_sample")
+
+# Composite Gauss-Legendre rule for Owen's Q: panels over the chi density's bulk, nodes per panel,
+# and the probability left out in each tail of the chi distribution
+PANELS = 16
+PANEL_NODES = 16
+CHI_TAIL = 1e-14
+
+# Largest sample size the searches consider
+MAX_N = 10_000_000
+
+_GL_NODES, _GL_WEIGHTS = leggauss(PANEL_NODES)
+
+
+@lru_cache(maxsize=2048)
+def chi_rule(df: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Panel edges, nodes and chi-density weights of the Owen's Q rule for ``df``"""
+    edges = np.linspace(chi.ppf(CHI_TAIL, df), chi.isf(CHI_TAIL, df), PANELS + 1)
+    half = (edges[1:] - edges[:-1])[:, None] / 2
+    nodes = edges[:-1, None] + half * (_GL_NODES + 1)
+    weights = half * _GL_WEIGHTS * chi.pdf(nodes, df)
+    return edges, nodes, weights
+
+
+def owens_q(df: float, t, delta, upper) -> np.ndarray:
+    """
+    Owen's Q_df(t, delta; 0, upper), broadcast over arrays of t, delta and upper
+
+    Args:
+        df: Degrees of freedom (shared by all evaluations)
+        t: Critical values
+        delta: Noncentrality parameters
+        upper: Upper integration limits (R)
+    """
+    edges, nodes, weights = chi_rule(float(df))
+    t, delta, upper = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (t, delta, upper)))
+    scale = 1 / math.sqrt(df)
+    slope, shift = (t * scale)[..., None, None], delta[..., None, None]
+
+    # Panels that lie entirely below the limit use the cached nodes and weights
+    cut = np.clip(np.searchsorted(edges, upper, side="right") - 1, 0, PANELS)
+    whole = np.arange(PANELS) < cut[..., None]
+    total = (ndtr(slope * nodes - shift) * weights * whole[..., None]).sum(axis=(-1, -2))
+
+    # The panel containing the limit is integrated from its left edge up to the limit
+    partial = (cut < PANELS) & (upper > edges[0])
+    left = edges[np.minimum(cut, PANELS - 1)]
+    half = np.where(partial, upper - left, 0.0)[..., None] / 2
+    x = left[..., None] + half * (_GL_NODES + 1)
+    density = chi.pdf(x, df)
+    total += (ndtr(slope[..., 0] * x - shift[..., 0]) * density * half * _GL_WEIGHTS).sum(axis=-1)
+    return total
+
+
+def check_margins(hypothesis: str, theta: float, lower: Optional[float] = None, upper: Optional[float] = None,
+                  margin: Optional[float] = None):
+    """The margins a hypothesis needs, with the true difference on the alternative's side of them"""
+    if hypothesis == "equivalence":
+        if lower is None or upper is None:
+            raise ValueError("equivalence needs the lower and upper margins")
+        if not lower < upper:
+            raise ValueError("lower margin must be below the upper margin")
+        if not lower < theta < upper:
+            raise ValueError("the true difference must lie strictly between the equivalence margins")
+    elif hypothesis == "non_inferiority":
+        if margin is None:
+            raise ValueError("non_inferiority needs a margin")
+        if margin == 0:
+            raise ValueError("the non-inferiority margin must be non-zero")
+        if (margin < 0 and theta <= margin) or (margin > 0 and theta >= margin):
+            raise ValueError("the true difference must lie on the non-inferior side of the margin")
+    else:
+        raise ValueError(f"hypothesis must be one of {', '.join(HYPOTHESES)}")
+
+
+def _mean_df_se(n, sd: float, design: str):
+    """Degrees of freedom and standard error of the difference with n per group (or n pairs)"""
+    if design == "two_sample":
+        return 2 * n - 2, sd * np.sqrt(2 / n)
+    return n - 1, sd / np.sqrt(n)
+
+
+def tost_power(n: int, theta, sd: float, lower: float, upper: float, design: str = "two_sample") -> np.ndarray:
+    """Exact TOST power for means; ``theta`` may be an array (a power curve)"""
+    df, se = _mean_df_se(n, sd, design)
+    critical = t_distribution.isf(ALPHA, df)
+    theta = np.asarray(theta, dtype=float)
+    delta_lower = (theta - lower) / se
+    delta_upper = (theta - upper) / se
+    limit = (delta_lower - delta_upper) * math.sqrt(df) / (2 * critical)
+    q = owens_q(df, np.array([-critical, critical]).reshape((2,) + (1,) * theta.ndim),
+                np.stack([delta_upper, delta_lower]), limit)
+    return np.maximum(q[0] - q[1], 0.0)
+
+
+def _direction(margin: float) -> int:
+    # A negative margin means higher is better: H0 theta <= margin
+    return 1 if margin < 0 else -1
+
+
+def non_inferiority_power(n: int, theta, sd: float, margin: float, design: str = "two_sample") -> np.ndarray:
+    """Exact non-inferiority power for means (one-sided noncentral t)"""
+    df, se = _mean_df_se(n, sd, design)
+    ncp = _direction(margin) * (np.asarray(theta, dtype=float) - margin) / se
+    return nct.sf(t_distribution.isf(ALPHA, df), df, ncp)
+
+
+def _normal_power(se, theta: float, hypothesis: str, lower=None, upper=None, margin=None):
+    """Large-sample power of either hypothesis for a difference with standard error ``se``"""
+    z = norm.isf(ALPHA)
+    if hypothesis == "equivalence":
+        return np.maximum(ndtr((upper - theta) / se - z) + ndtr((theta - lower) / se - z) - 1, 0.0)
+    return ndtr(_direction(margin) * (theta - margin) / se - z)
+
+
+def _continuous_n(power: Callable[[float], float], target: float) -> float:
+    """Continuous N reaching ``target`` under a power function increasing in N"""
+    lo, hi = 1e-6, 2.0
+    while power(hi) < target:
+        lo, hi = hi, hi * 4
+        if hi > MAX_N:
+            raise ValueError(f"Target power is not reached for N up to {MAX_N}")
+    return brentq(lambda n: power(n) - target, lo, hi, xtol=1e-8)
+
+
+def _smallest_n(power: Callable[[int], float], start: int, minimum: int, target: float) -> int:
+    """Smallest integer N from ``minimum`` whose power reaches ``target``, searching from ``start``"""
+    n = max(minimum, start)
+    if power(n) >= target:
+        while n > minimum and power(n - 1) >= target:
+            n -= 1
+        return n
+    # Gallop upwards, then bisect between the last failure and the first success
+    failed, step = n, 1
+    while power(n) < target:
+        failed, n, step = n, n + step, step * 2
+        if n > MAX_N:
+            raise ValueError(f"Target power is not reached for N up to {MAX_N}")
+    while n - failed > 1:
+        middle = (failed + n) // 2
+        if power(middle) >= target:
+            n = middle
+        else:
+            failed = middle
+    return n
+
+
+def means_sample_size(hypothesis: str, theta: float, sd: float, power: float, design: str = "two_sample",
+                      lower: Optional[float] = None, upper: Optional[float] = None,
+                      margin: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Smallest n per group (or number of pairs / subjects) with exact power of at least ``power``
+
+    Args:
+        hypothesis: "equivalence" (TOST) or "non_inferiority"
+        theta: Expected true difference of the means (or of the mean from its reference value)
+        sd: Standard deviation (of the differences for a paired design)
+        power: Target power
+        design: "two_sample", "one_sample" or "paired"
+        lower, upper: Equivalence margins
+        margin: Signed non-inferiority margin
+    """
+    check_margins(hypothesis, theta, lower, upper, margin)
+    if design not in MEAN_DESIGNS:
+        raise ValueError(f"design must be one of {', '.join(MEAN_DESIGNS)}")
+    groups = 2 if design == "two_sample" else 1
+
+    if hypothesis == "equivalence":
+        def exact(n):
+            return float(tost_power(n, theta, sd, lower, upper, design))
+    else:
+        def exact(n):
+            return float(non_inferiority_power(n, theta, sd, margin, design))
+
+    # The large-sample N is within a few subjects of the exact one, so the exact search starts there
+    approximate = _continuous_n(
+        lambda n: float(_normal_power(sd * math.sqrt(groups / n), theta, hypothesis, lower, upper, margin)), power)
+    evaluated: Dict[int, float] = {}
+
+    def cached(n):
+        if n not in evaluated:
+            evaluated[n] = exact(n)
+        return evaluated[n]
+
+    n = _smallest_n(cached, math.ceil(approximate), 2, power)
+    return {
+        "result": float(n),
+        "power": evaluated[n],
+        "hypothesis": hypothesis,
+        "design": design,
+        "method": "exact",
+        "normal_approximation": approximate,
+        "power_evaluations": len(evaluated),
+    }
+
+
+def proportions_sample_size(hypothesis: str, p1: float, reference: float, power: float,
+                            design: str = "two_sample", lower: Optional[float] = None,
+                            upper: Optional[float] = None, margin: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Sample size per group (or in the single group) for a difference of proportions
+
+    Args:
+        hypothesis: "equivalence" (TOST) or "non_inferiority"
+        p1: Expected proportion in the test group
+        reference: Expected proportion in the reference group (two_sample) or the known p0 (one_sample)
+        power: Target power
+        design: "two_sample" or "one_sample"
+        lower, upper: Equivalence margins for p1 - reference
+        margin: Signed non-inferiority margin for p1 - reference
+    """
+    theta = p1 - reference
+    check_margins(hypothesis, theta, lower, upper, margin)
+    if design not in PROPORTION_DESIGNS:
+        raise ValueError(f"design must be one of {', '.join(PROPORTION_DESIGNS)}")
+    # Unpooled per-subject variance of the estimated difference
+    variance = p1 * (1 - p1) + (reference * (1 - reference) if design == "two_sample" else 0.0)
+
+    def approximate(n):
+        return float(_normal_power(math.sqrt(variance / n), theta, hypothesis, lower, upper, margin))
+
+    n = _continuous_n(approximate, power)
+    return {
+        "result": float(math.ceil(n - 1e-9)),
+        "power": approximate(math.ceil(n - 1e-9)),
+        "hypothesis": hypothesis,
+        "design": design,
+        "method": "normal",
+        "continuous_n": n,
+    }
@@ -0,0 +1,78 @@
+"""
+PowerGPT Event Loop Monitor
+===========================
+Measures how long the asyncio event loop is blocked.
+
+A background task asks to wake up every ``interval`` seconds and records
+how late it actually woke. Lateness is time during which the loop could
+not run any other coroutine, i.e. synchronous work done on the loop
+thread. Stalls longer than ``threshold`` are counted and summed, so a load
+test can compare blocking before and after a change.
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+
+class EventLoopMonitor:
+    """Background task recording event-loop wake-up lag"""
+
+    def __init__(self, interval: float = 0.05, threshold: float = 0.02):
+        """
+        Args:
+            interval: Seconds between wake-ups
+            threshold: Lag above which a wake-up counts as a stall
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self._task: Optional[asyncio.Task] = None
+        self.reset()
+
+    def reset(self):
+        self.samples = 0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        self.stalls = 0
+        self.stalled_time = 0.0
+        self.since = time.time()
+
+    def record(self, lag: float):
+        self.samples += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        if lag > self.threshold:
+            self.stalls += 1
+            self.stalled_time += lag
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, time.perf_counter() - expected))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "window_s": round(time.time() - self.since, 3),
+            "samples": self.samples,
+            "mean_lag_ms": round(self.total_lag / self.samples * 1000, 3) if self.samples else 0.0,
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+            "stalls": self.stalls,
+            "stalled_ms": round(self.stalled_time * 1000, 3),
+        }
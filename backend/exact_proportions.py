@@ -0,0 +1,266 @@
+"""
+PowerGPT Exact Proportion Tests
+===============================
+Sample sizes for the exact binomial test (one proportion) and Fisher's
+exact test (two proportions, equal group sizes).
+
+The arcsine approximation used by pwr.p.test / pwr.2p.test is poor for
+rare events, but exact power is not monotone in N: because the test
+statistic is discrete, power drops every time the critical value steps up
+(the "sawtooth"). Both the smallest N reaching the target power and the
+smallest *stable* N, from which every larger N (checked over a lookahead
+window at least one sawtooth period long) also reaches it, are reported.
+
+- One proportion: power is evaluated for a whole range of N at once with
+  vectorized binomial tail functions. The two-sided test orders outcomes by
+  their null likelihood, as R's binom.test and Fisher's test do, rather
+  than splitting alpha equally between the tails.
+- Two proportions: for each N the conditional (hypergeometric) null
+  distribution is tabulated only over the totals and cell counts that carry
+  probability under the alternative, and group PMFs are carried from N to
+  N + 1 with the binomial recurrence while scanning.
+
+The search starts from the normal approximation, brackets the crossing,
+narrows it by bisection and then scans the sawtooth region exhaustively.
+"""
+
+import math
+from typing import Any, Callable, Dict, Tuple
+
+import numpy as np
+from scipy.special import gammaln
+from scipy.stats import binom, norm
+
+# Largest sample size (per group) the search will consider
+MAX_N = 200_000
+
+# Probability mass ignored in each tail when truncating distributions
+TAIL_EPSILON = 1e-12
+
+
+def resolve_alternative(alternative: str, effect: float) -> str:
+    """Map "one.sided" to the direction of the effect and validate it, as the R scripts do"""
+    if effect == 0:
+        raise ValueError("Ensure that the effect size is non-zero!")
+    if alternative == "one.sided":
+        return "greater" if effect > 0 else "less"
+    if alternative not in ("two.sided", "greater", "less"):
+        raise ValueError("alternative must be 'two.sided', 'greater', 'less' or 'one.sided'")
+    if (alternative == "greater" and effect < 0) or (alternative == "less" and effect > 0):
+        raise ValueError(f"alternative '{alternative}' contradicts the direction of the effect")
+    return alternative
+
+
+def _normal_guess(h: float, power: float, alpha: float, sides: int) -> int:
+    return max(2, math.ceil(((norm.isf(alpha / sides) + norm.isf(1 - power)) / abs(h)) ** 2))
+
+
+def _arcsine_effect(p_a: float, p_b: float) -> float:
+    return 2 * math.asin(math.sqrt(p_a)) - 2 * math.asin(math.sqrt(p_b))
+
+
+def _sawtooth_window(p: float) -> int:
+    """Lookahead long enough to contain a few sawtooth periods (about 1/p)"""
+    return int(min(5000, max(20, math.ceil(3 / min(p, 1 - p)))))
+
+
+class BinomialPower:
+    """Exact one-sample binomial test power, vectorized over N"""
+
+    def __init__(self, p0: float, p1: float, alternative: str, alpha: float = 0.05):
+        self.p0, self.p1, self.alpha = p0, p1, alpha
+        self.alternative = resolve_alternative(alternative, p1 - p0)
+
+    def power_range(self, start: int, stop: int) -> np.ndarray:
+        """Power for every N in [start, stop)"""
+        n = np.arange(start, stop)
+        if self.alternative == "greater":
+            # Reject when X > c, the smallest c with P0(X > c) <= alpha
+            return binom.sf(binom.isf(self.alpha, n, self.p0), n, self.p1)
+        if self.alternative == "less":
+            # Reject when X <= c, the largest c with P0(X <= c) <= alpha
+            lower = binom.ppf(self.alpha, n, self.p0)
+            lower = np.where(binom.cdf(lower, n, self.p0) <= self.alpha * (1 + 1e-12), lower, lower - 1)
+            return binom.cdf(lower, n, self.p1)
+        # Two-sided, as binom.test: reject when the outcomes no more likely than X sum to at most alpha.
+        # Outside [lo, hi] the null carries no mass that matters, so those outcomes are always rejected
+        # and power is one minus the alternative's mass on the acceptance region inside it.
+        lo = binom.ppf(TAIL_EPSILON, n, self.p0).astype(int)
+        hi = binom.isf(TAIL_EPSILON, n, self.p0).astype(int)
+        width = int((hi - lo).max()) + 1
+        power = np.empty(len(n))
+        block = max(1, 2_000_000 // width)
+        for first in range(0, len(n), block):
+            rows = slice(first, first + block)
+            x = lo[rows, None] + np.arange(width)
+            valid = x <= hi[rows, None]
+            pmf = np.where(valid, binom.pmf(x, n[rows, None], self.p0), 0.0)
+            # Offsetting each row by 2 * row makes the row-wise sorted values globally sorted
+            ordered = np.sort(pmf, axis=1)
+            cumulative = np.cumsum(ordered, axis=1)
+            offset = 2.0 * np.arange(pmf.shape[0])[:, None]
+            position = np.searchsorted((ordered + offset).ravel(), (pmf * (1 + 1e-7) + offset).ravel(),
+                                       side="right")
+            p_value = cumulative.ravel()[position - 1].reshape(pmf.shape)
+            accept = valid & (p_value > self.alpha * (1 + 1e-9))
+            power[rows] = 1 - np.where(accept, binom.pmf(x, n[rows, None], self.p1), 0.0).sum(axis=1)
+        return np.maximum(power, 0.0)
+
+    def power(self, n: int) -> float:
+        return float(self.power_range(n, n + 1)[0])
+
+
+def _support(pmf: np.ndarray) -> Tuple[int, int]:
+    """Index range holding all but TAIL_EPSILON of the mass in each tail"""
+    lower = np.cumsum(pmf)
+    upper = np.cumsum(pmf[::-1])[::-1]
+    lo = int(np.argmax(lower > TAIL_EPSILON))
+    hi = len(pmf) - 1 - int(np.argmax(upper[::-1] > TAIL_EPSILON))
+    return lo, max(lo, hi)
+
+
+class FisherPower:
+    """Exact power of Fisher's exact test with N subjects in each group"""
+
+    def __init__(self, p1: float, p2: float, alternative: str, alpha: float = 0.05):
+        self.p1, self.p2, self.alpha = p1, p2, alpha
+        self.alternative = resolve_alternative(alternative, p1 - p2)
+
+    def _rejection(self, n: int, totals: np.ndarray, cells: np.ndarray) -> np.ndarray:
+        """Rejection indicator over (total successes, successes in group 1)"""
+        log_choose = gammaln(n + 1) - gammaln(np.arange(n + 1) + 1) - gammaln(n - np.arange(n + 1) + 1)
+        log_choose_total = gammaln(2 * n + 1) - gammaln(totals + 1) - gammaln(2 * n - totals + 1)
+        other = totals[:, None] - cells[None, :]
+        valid = (other >= 0) & (other <= n)
+        log_h = log_choose[cells][None, :] + log_choose[np.clip(other, 0, n)] - log_choose_total[:, None]
+        h = np.exp(np.where(valid, log_h, -np.inf))
+
+        if self.alternative == "greater":
+            p_value = np.cumsum(h[:, ::-1], axis=1)[:, ::-1]
+        elif self.alternative == "less":
+            p_value = np.cumsum(h, axis=1)
+        else:
+            # Two-sided: sum of all tables no more likely than the observed one. Offsetting each
+            # row by 2 * row makes the row-wise sorted values globally sorted for one searchsorted.
+            ordered = np.sort(h, axis=1)
+            cumulative = np.cumsum(ordered, axis=1)
+            offset = 2.0 * np.arange(h.shape[0])[:, None]
+            position = np.searchsorted((ordered + offset).ravel(), (h * (1 + 1e-7) + offset).ravel(), side="right")
+            p_value = cumulative.ravel()[position - 1].reshape(h.shape)
+        return p_value <= self.alpha * (1 + 1e-9)
+
+    def _power_from_pmfs(self, n: int, pmf1: np.ndarray, pmf2: np.ndarray) -> float:
+        lo1, hi1 = _support(pmf1)
+        lo2, hi2 = _support(pmf2)
+        totals = np.arange(lo1 + lo2, hi1 + hi2 + 1)
+        # Cover the alternative range of group 1 and the bulk of every conditional null distribution
+        spread = 12 * math.sqrt(n * n / (4 * max(1, 2 * n - 1)))
+        first = max(0, min(lo1, int(math.floor(totals[0] / 2 - spread))))
+        last = min(n, max(hi1, int(math.ceil(totals[-1] / 2 + spread))))
+        cells = np.arange(first, last + 1)
+        reject = self._rejection(n, totals, cells)
+
+        x1 = np.arange(lo1, hi1 + 1)
+        x2 = np.arange(lo2, hi2 + 1)
+        rows = x1[:, None] + x2[None, :] - totals[0]
+        columns = np.broadcast_to((x1 - first)[:, None], rows.shape)
+        weights = pmf1[lo1:hi1 + 1][:, None] * pmf2[lo2:hi2 + 1][None, :]
+        return float((weights * reject[rows, columns]).sum())
+
+    def power(self, n: int) -> float:
+        k = np.arange(n + 1)
+        return self._power_from_pmfs(n, binom.pmf(k, n, self.p1), binom.pmf(k, n, self.p2))
+
+    def power_range(self, start: int, stop: int) -> np.ndarray:
+        """Power for every N in [start, stop), stepping the group PMFs by recurrence"""
+        k = np.arange(start + 1)
+        pmf1, pmf2 = binom.pmf(k, start, self.p1), binom.pmf(k, start, self.p2)
+        powers = []
+        for n in range(start, stop):
+            powers.append(self._power_from_pmfs(n, pmf1, pmf2))
+            # P_{n+1}(k) = (1 - p) P_n(k) + p P_n(k - 1)
+            pmf1 = np.append(pmf1 * (1 - self.p1), 0.0) + np.insert(pmf1 * self.p1, 0, 0.0)
+            pmf2 = np.append(pmf2 * (1 - self.p2), 0.0) + np.insert(pmf2 * self.p2, 0, 0.0)
+        return np.array(powers)
+
+
+def sawtooth_search(power: Callable[[int], float], power_range: Callable[[int, int], np.ndarray],
+                    target: float, guess: int, window: int) -> Dict[str, Any]:
+    """
+    Smallest N and smallest stable N whose power reaches ``target``
+
+    Args:
+        power: Power at one N
+        power_range: Powers for every N in [start, stop)
+        target: Target power
+        guess: Starting point, usually the normal approximation
+        window: Consecutive passing N required after the last failure to call it stable
+    """
+    hi = max(1, guess)
+    while power(hi) < target:
+        if hi >= MAX_N:
+            raise ValueError(f"Target power is not reached for N up to {MAX_N}")
+        hi = min(MAX_N, int(hi * 1.25) + 1)
+    lo = hi
+    while lo > 1 and power(lo) >= target:
+        lo = max(1, int(lo / 1.25))
+    # Narrow down to one crossing; the exhaustive scan below handles the sawtooth around it
+    while hi - lo > window:
+        mid = (lo + hi) // 2
+        if power(mid) >= target:
+            hi = mid
+        else:
+            lo = mid
+
+    start = max(1, lo - window)
+    stop = hi + window + 1
+    powers = power_range(start, stop)
+    while True:
+        failing = np.nonzero(powers < target)[0]
+        last_failure = int(failing[-1]) if len(failing) else -1
+        if len(powers) - 1 - last_failure >= window:
+            break
+        if start + len(powers) > MAX_N:
+            raise ValueError(f"No stable sample size found for N up to {MAX_N}")
+        extension = power_range(start + len(powers), start + len(powers) + window)
+        powers = np.concatenate([powers, extension])
+
+    passing = np.nonzero(powers >= target)[0]
+    smallest = start + int(passing[0])
+    stable = start + last_failure + 1
+    return {
+        "smallest_n": smallest,
+        "power_at_smallest_n": float(powers[smallest - start]),
+        "stable_n": stable,
+        "power_at_stable_n": float(powers[stable - start]),
+        "stable_checked_through": start + len(powers) - 1,
+        "power_curve": {"n": list(range(start, start + len(powers))), "power": powers.tolist()},
+    }
+
+
+def single_proportion_sample_size(p0: float, p1: float, power: float, alternative: str,
+                                  alpha: float = 0.05) -> Dict[str, Any]:
+    """Exact binomial test sample size for H0: p = p0 against the proportion p1"""
+    engine = BinomialPower(p0, p1, alternative, alpha)
+    sides = 2 if engine.alternative == "two.sided" else 1
+    guess = _normal_guess(_arcsine_effect(p1, p0), power, alpha, sides)
+    return {
+        "test": "exact binomial",
+        "alternative": engine.alternative,
+        **sawtooth_search(engine.power, engine.power_range, power, guess, _sawtooth_window(p0)),
+    }
+
+
+def two_proportions_sample_size(p1: float, p2: float, power: float, alternative: str,
+                                alpha: float = 0.05) -> Dict[str, Any]:
+    """Fisher's exact test sample size per group for proportions p1 and p2"""
+    engine = FisherPower(p1, p2, alternative, alpha)
+    # Conditioning on the total mixes many critical values, so the sawtooth follows the less rare group
+    sides = 2 if engine.alternative == "two.sided" else 1
+    guess = _normal_guess(_arcsine_effect(p1, p2), power, alpha, sides)
+    return {
+        "test": "Fisher exact",
+        "alternative": engine.alternative,
+        **sawtooth_search(engine.power, engine.power_range, power, guess,
+                          _sawtooth_window(max(min(p1, 1 - p1), min(p2, 1 - p2)))),
+    }
@@ -0,0 +1,159 @@
+"""
+PowerGPT Health Probes
+======================
+Liveness and readiness for load balancers and orchestrators.
+
+- ``GET /health/live`` answers as long as the worker's event loop runs.
+- ``GET /health/ready`` returns 200 only once R is initialized and every
+  statistical function has answered its warm-up call, and while a trivial
+  R call still succeeds; otherwise 503. Rolling restarts therefore only
+  route traffic to warm workers.
+- ``GET /health`` reports every subsystem: R (warm-up timings, the last
+  probe and deadline overruns), the result cache, and the OpenAI circuit
+  breaker.
+
+Probing R queues a call on the R thread, so probe results are cached for
+``POWERGPT_HEALTH_CACHE_S`` seconds and at most one probe runs at a time.
+When R is busy with a computation for longer than
+``POWERGPT_HEALTH_PROBE_TIMEOUT_S``, the probe reports ``busy`` and
+readiness is unchanged: a busy worker is warm, and admission control
+handles overload. An open OpenAI breaker or disabled AI marks the worker
+``degraded`` but keeps it ready, since the statistical API still works.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+import r_session
+from openai_transport import CircuitBreaker
+
+
+def utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class HealthMonitor:
+    """Cached R probe plus the readiness decision built on it"""
+
+    def __init__(self, cache_ttl: float = 2.0, probe_timeout: float = 0.5):
+        """
+        Args:
+            cache_ttl: Seconds a probe result is reused
+            probe_timeout: Seconds to wait for the R thread before reporting R as busy
+        """
+        self.cache_ttl = cache_ttl
+        self.probe_timeout = probe_timeout
+        self._probe_lock = threading.Lock()
+        self._last_probe: Optional[Dict[str, Any]] = None
+        self._probed_at = 0.0
+        self.probes = 0
+
+    @classmethod
+    def from_env(cls) -> "HealthMonitor":
+        return cls(
+            cache_ttl=float(os.getenv("POWERGPT_HEALTH_CACHE_S", "2")),
+            probe_timeout=float(os.getenv("POWERGPT_HEALTH_PROBE_TIMEOUT_S", "0.5")),
+        )
+
+    def _probe(self) -> Dict[str, Any]:
+        self.probes += 1
+        try:
+            seconds = r_session.probe(self.probe_timeout)
+        except Exception as e:
+            return {"status": "failed", "error": str(e), "at": utc_now()}
+        if seconds is None:
+            return {"status": "busy", "at": utc_now()}
+        return {"status": "ok", "latency_ms": round(seconds * 1000, 3), "at": utc_now()}
+
+    def r_probe(self) -> Dict[str, Any]:
+        """The latest R probe result, refreshed when older than the cache TTL"""
+        if self._last_probe is None or time.monotonic() - self._probed_at >= self.cache_ttl:
+            # Concurrent callers reuse the previous result instead of queueing on the R thread
+            if self._probe_lock.acquire(blocking=self._last_probe is None):
+                try:
+                    self._last_probe = self._probe()
+                    self._probed_at = time.monotonic()
+                finally:
+                    self._probe_lock.release()
+        return {**self._last_probe, "age_s": round(time.monotonic() - self._probed_at, 3)}
+
+    def r_status(self) -> Dict[str, Any]:
+        warm = r_session.warm_status()
+        initialized = r_session.is_initialized()
+        status = {
+            "initialized": initialized,
+            "warm": r_session.is_warm(),
+            "warmed_functions": sum(1 for result in warm.values() if result["ok"]),
+            "total_functions": len(r_session.WARMUP_CALLS),
+            "failed_functions": sorted(name for name, result in warm.items() if not result["ok"]),
+            "last_warm_at": datetime.fromtimestamp(max(r["at"] for r in warm.values()), timezone.utc).isoformat()
+            if warm else None,
+            "warm_ms": {name: result["ms"] for name, result in warm.items()},
+            "executor": r_session.executor.status(),
+        }
+        status["probe"] = self.r_probe() if initialized else None
+        return status
+
+    def readiness(self) -> Dict[str, Any]:
+        r = self.r_status()
+        ready = r["warm"] and r["probe"] is not None and r["probe"]["status"] != "failed"
+        return {"ready": ready, "r": r}
+
+
+health_monitor = HealthMonitor.from_env()
+
+
+def ai_status() -> Dict[str, Any]:
+    """OpenAI breaker state and result cache counters of the AI coordinator"""
+    from ai_endpoints import get_ai_coordinator
+
+    coordinator = get_ai_coordinator()
+    if not coordinator.is_ai_enabled():
+        openai = {"status": "disabled"}
+    else:
+        breaker = coordinator.transport.breaker.snapshot()
+        openai = {"status": "ok" if breaker["state"] == CircuitBreaker.CLOSED else "degraded", "breaker": breaker}
+    return {"openai": openai, "cache": {"status": "ok", **coordinator.result_cache.stats()}}
+
+
+health_router = APIRouter(prefix="/health", tags=["Health"])
+
+
+@health_router.get("/live")
+async def liveness():
+    """Liveness: the worker is running and its event loop responds"""
+    return {"status": "alive", "pid": os.getpid(), "timestamp": utc_now()}
+
+
+@health_router.get("/ready")
+def readiness():
+    """Readiness: 200 once R is warm and answering, 503 otherwise"""
+    report = health_monitor.readiness()
+    report["timestamp"] = utc_now()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+
+@health_router.get("")
+def health():
+    """Per-subsystem status: R warm state and probe, result cache, OpenAI breaker"""
+    readiness_report = health_monitor.readiness()
+    subsystems = {"r": readiness_report["r"], **ai_status()}
+    if not readiness_report["ready"]:
+        status = "unready"
+    elif subsystems["openai"]["status"] != "ok":
+        status = "degraded"
+    else:
+        status = "ok"
+    return {
+        "status": status,
+        "ready": readiness_report["ready"],
+        "subsystems": subsystems,
+        "startup": r_session.startup_timer.report(),
+        "timestamp": utc_now(),
+    }
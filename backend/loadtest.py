@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+PowerGPT AI-Path Load Test
+==========================
+Drives /ai/query with concurrent clients and reports throughput, latency
+percentiles, status codes and event-loop blocking.
+
+Usage:
+    python loadtest.py [--url http://localhost:5001] [--concurrency 16] [--requests 500]
+                       [--queries queries.txt] [--follow-ups 0.3] [--json]
+
+Run it against a server started with ``POWERGPT_OPENAI_MOCK=1`` (synthetic
+answers with simulated latency and errors) or ``POWERGPT_OPENAI_REPLAY``
+(recorded answers) to measure the AI path without network access or API
+cost. Event-loop figures come from ``/api/v1/event_loop``, which is reset
+before the run; with several workers they cover only the worker that
+answers that request, so measure loop blocking with a single worker.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+DEFAULT_QUERIES = [
+    "I need a sample size for comparing two groups with a mean difference of 0.5 and SD of 1",
+    "How many participants for a paired t-test, effect size 0.4, 90% power?",
+    "Sample size for a one-way ANOVA with 3 groups and effect size 0.25",
+    "Compare proportions of 60% and 45% between two arms with 80% power",
+    "How many subjects to detect a correlation of 0.3?",
+    "Survival study comparing two treatments with a hazard ratio of 0.6",
+    "Chi-squared test with effect size 0.3 and 1 degree of freedom",
+]
+
+DEFAULT_FOLLOW_UPS = ["what about 90%?", "and with 95% power?", "what if power is 85%?"]
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class LoadTest:
+    """Closed-loop load generator: each worker sends its next request as soon as the last one returns"""
+
+    def __init__(self, url: str, concurrency: int, requests: int, queries: List[str],
+                 follow_up_rate: float = 0.0, timeout: float = 120.0, seed: Optional[int] = None):
+        self.url = url.rstrip("/")
+        self.concurrency = concurrency
+        self.requests = requests
+        self.queries = queries
+        self.follow_up_rate = follow_up_rate
+        self.timeout = timeout
+        self._random = random.Random(seed)
+        self._issued = 0
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.errors: Counter = Counter()
+
+    def _next_body(self, session_id: Optional[str]) -> Dict[str, Any]:
+        if session_id and self._random.random() < self.follow_up_rate:
+            return {"query": self._random.choice(DEFAULT_FOLLOW_UPS), "session_id": session_id}
+        return {"query": self._random.choice(self.queries)}
+
+    async def _worker(self, client: httpx.AsyncClient):
+        session_id = None
+        while self._issued < self.requests:
+            self._issued += 1
+            body = self._next_body(session_id)
+            started = time.perf_counter()
+            try:
+                response = await client.post(f"{self.url}/ai/query", json=body)
+            except httpx.HTTPError as e:
+                self.errors[type(e).__name__] += 1
+                continue
+            self.latencies.append(time.perf_counter() - started)
+            self.statuses[response.status_code] += 1
+            if response.status_code == 200:
+                session_id = response.json().get("session_id") or session_id
+
+    async def run(self) -> Dict[str, Any]:
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits) as client:
+            await client.get(f"{self.url}/api/v1/event_loop", params={"reset": "true"})
+            started = time.perf_counter()
+            await asyncio.gather(*(self._worker(client) for _ in range(self.concurrency)))
+            elapsed = time.perf_counter() - started
+            loop = (await client.get(f"{self.url}/api/v1/event_loop")).json()
+            usage = (await client.get(f"{self.url}/ai/usage")).json()
+        return self.report(elapsed, loop, usage)
+
+    def report(self, elapsed: float, loop: Dict[str, Any], usage: Dict[str, Any]) -> Dict[str, Any]:
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 1) if value is not None else None
+
+        completed = len(self.latencies)
+        return {
+            "requests": self.requests,
+            "completed": completed,
+            "concurrency": self.concurrency,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(completed / elapsed, 2) if elapsed else None,
+            "latency_ms": {
+                "p50": ms(percentile(self.latencies, 50)),
+                "p95": ms(percentile(self.latencies, 95)),
+                "p99": ms(percentile(self.latencies, 99)),
+                "max": ms(max(self.latencies) if self.latencies else None),
+            },
+            "status_codes": {str(code): count for code, count in sorted(self.statuses.items())},
+            "client_errors": dict(self.errors),
+            "event_loop": loop,
+            "mock_openai": usage.get("mock_openai"),
+        }
+
+
+def print_report(report: Dict[str, Any]):
+    latency = report["latency_ms"]
+    loop = report["event_loop"]
+    print(f"{report['completed']}/{report['requests']} requests in {report['elapsed_s']} s "
+          f"at concurrency {report['concurrency']}: {report['throughput_rps']} req/s")
+    print(f"latency ms  p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    print(f"status      {report['status_codes']}" + (f"  errors {report['client_errors']}"
+                                                       if report["client_errors"] else ""))
+    print(f"event loop  max lag {loop['max_lag_ms']} ms, mean {loop['mean_lag_ms']} ms, "
+          f"{loop['stalls']} stalls > {loop['threshold_ms']} ms totalling {loop['stalled_ms']} ms")
+    if report["mock_openai"]:
+        print(f"mock openai {report['mock_openai']}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load-test the PowerGPT /ai/query endpoint")
+    parser.add_argument("--url", default="http://localhost:5001")
+    parser.add_argument("--concurrency", type=int, default=16, help="Simultaneous clients")
+    parser.add_argument("--requests", type=int, default=500, help="Total requests to send")
+    parser.add_argument("--queries", help="File with one query per line (default: built-in mix)")
+    parser.add_argument("--follow-ups", type=float, default=0.0,
+                        help="Fraction of requests sent as follow-ups in the client's session")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request client timeout in seconds")
+    parser.add_argument("--seed", type=int, help="Seed for the query mix")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as lines:
+            queries = [line.strip() for line in lines if line.strip()]
+    load_test = LoadTest(args.url, args.concurrency, args.requests, queries,
+                         follow_up_rate=args.follow_ups, timeout=args.timeout, seed=args.seed)
+    report = asyncio.run(load_test.run())
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
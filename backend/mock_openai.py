@@ -0,0 +1,310 @@
+"""
+PowerGPT OpenAI Stand-in
+========================
+Offline replacement for the OpenAI client, for load tests and development.
+
+``MockOpenAIClient`` has the part of the ``openai.OpenAI`` interface that
+the transport uses (``with_options(...).chat.completions.create(...)``)
+and can be passed to ``OpenAITransport(client=...)``. Each call:
+
+- waits for a latency drawn from a log-normal distribution, and raises
+  ``openai.APITimeoutError`` when that exceeds the call's timeout
+- fails with configurable probabilities as a 5xx, a 429 or a timeout,
+  using the real openai exception types so retries and the circuit
+  breaker behave as they do in production
+- answers from a recording when one is loaded, otherwise with a synthetic
+  but well-formed extraction or explanation
+
+``RecordingClient`` wraps a real client and appends every exchange to a
+JSONL file, which ``MockOpenAIClient(replay_path=...)`` can serve back.
+
+The server picks a client from the environment (see ``mock_from_env``):
+``POWERGPT_OPENAI_MOCK=1`` for synthetic answers, ``POWERGPT_OPENAI_REPLAY``
+for a recording, ``POWERGPT_OPENAI_RECORD`` to record real traffic, and
+``POWERGPT_MOCK_LATENCY_MS``, ``POWERGPT_MOCK_LATENCY_SIGMA``,
+``POWERGPT_MOCK_ERROR_RATE``, ``POWERGPT_MOCK_RATE_LIMIT_RATE`` and
+``POWERGPT_MOCK_TIMEOUT_RATE`` for the distributions.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def exchange_key(model: str, messages: List[Dict[str, str]]) -> str:
+    """Stable key of a request for record/replay"""
+    payload = json.dumps({"model": model, "messages": messages}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _completion(content: str, model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0):
+    """Object shaped like openai's ChatCompletion, as far as the pipeline reads it"""
+    return SimpleNamespace(
+        model=model,
+        choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=content), finish_reason="stop")],
+        usage=SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens),
+        ),
+    )
+
+
+# Keyword -> (test, default parameters) used by synthetic extractions
+SYNTHETIC_TESTS = [
+    (r"anova|groups", "one_way_ANOVA", {"k": 3, "f": 0.25, "power": 0.8}),
+    (r"correlat", "correlation", {"r": 0.3, "power": 0.8}),
+    (r"proportion|rate|percent of", "two_proportions_test",
+     {"p1": 0.6, "p2": 0.4, "power": 0.8, "alternative": "two.sided"}),
+    (r"survival|log[\s-]*rank|hazard", "log_rank_test", {"power": 0.8, "k": 1.0, "pE": 0.3, "pC": 0.5, "RR": 0.6}),
+    (r"chi", "chi_squared_test", {"w": 0.3, "df": 1, "power": 0.8}),
+    (r"paired|before.*after", "paired_T_test", {"d": 0.5, "power": 0.8, "alternative": "two.sided"}),
+]
+
+
+def synthetic_extraction(query: str) -> Dict[str, Any]:
+    """A plausible extraction: test chosen by keyword, power and effect taken from the text when present"""
+    test_type, parameters = "two_sample_t_test", {"delta": 0.5, "sd": 1.0, "power": 0.8}
+    for pattern, test, defaults in SYNTHETIC_TESTS:
+        if re.search(pattern, query, re.IGNORECASE):
+            test_type, parameters = test, dict(defaults)
+            break
+    percent = re.search(r"(\d+(?:\.\d+)?)\s*%\s*power|power\D{0,10}(\d+(?:\.\d+)?)\s*%", query, re.IGNORECASE)
+    if percent:
+        parameters["power"] = float(percent.group(1) or percent.group(2)) / 100
+    effect = re.search(r"\b(?:d|delta|difference|effect size)\s*(?:=|of|is)?\s*(\d*\.\d+|\d+)", query, re.IGNORECASE)
+    if effect:
+        for name in ("delta", "d", "f", "w", "r"):
+            if name in parameters:
+                parameters[name] = float(effect.group(1))
+                break
+    return {"test_type": test_type, "parameters": parameters, "confidence": 0.9,
+            "explanation": "Synthetic extraction from the offline OpenAI stand-in."}
+
+
+def synthetic_explanation(user_content: str) -> Dict[str, Any]:
+    sample_size = None
+    try:
+        sample_size = json.loads(user_content).get("result", {}).get("result")
+    except (ValueError, AttributeError):
+        pass
+    return {
+        "sample_size": sample_size if isinstance(sample_size, (int, float)) else None,
+        "interpretation": "Synthetic interpretation from the offline OpenAI stand-in.",
+        "assumptions": ["Synthetic assumption"],
+        "recommendations": ["Synthetic recommendation"],
+        "educational_context": "Synthetic educational context.",
+    }
+
+
+class _Completions:
+    def __init__(self, client: "MockOpenAIClient", timeout: Optional[float]):
+        self._client = client
+        self._timeout = timeout
+
+    def create(self, **kwargs):
+        return self._client._create(self._timeout, kwargs)
+
+
+class MockOpenAIClient:
+    """Drop-in for the openai client with simulated latency, failures and replayed answers"""
+
+    def __init__(
+        self,
+        latency_ms: float = 400.0,
+        latency_sigma: float = 0.5,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        replay_path: Optional[str] = None,
+        replay_latency: bool = False,
+        seed: Optional[int] = None
+    ):
+        """
+        Args:
+            latency_ms: Median simulated latency
+            latency_sigma: Log-normal shape; 0 gives a constant latency
+            error_rate: Probability of a 500 response
+            rate_limit_rate: Probability of a 429 response
+            timeout_rate: Probability that the call hangs until its timeout
+            replay_path: JSONL file written by RecordingClient to answer from
+            replay_latency: Use recorded latencies instead of the distribution
+            seed: Seed for reproducible runs
+        """
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.timeout_rate = timeout_rate
+        self.replay_latency = replay_latency
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._timeout: Optional[float] = None
+        self.recordings: Dict[str, Dict[str, Any]] = {}
+        self.counters = {"calls": 0, "errors": 0, "rate_limited": 0, "timeouts": 0, "replayed": 0, "synthetic": 0}
+        if replay_path:
+            self.load(replay_path)
+
+    def load(self, path: str):
+        with open(path, encoding="utf-8") as recording:
+            for line in recording:
+                if line.strip():
+                    exchange = json.loads(line)
+                    self.recordings[exchange["key"]] = exchange
+        logger.info(f"Loaded {len(self.recordings)} recorded OpenAI exchanges from {path}")
+
+    def with_options(self, timeout: Optional[float] = None, **_):
+        scoped = SimpleNamespace(chat=SimpleNamespace(completions=_Completions(self, timeout)))
+        return scoped
+
+    @property
+    def chat(self):
+        return SimpleNamespace(completions=_Completions(self, None))
+
+    def _draw(self):
+        with self._lock:
+            latency = self.latency_ms / 1000 * math.exp(self.latency_sigma * self._random.gauss(0.0, 1.0))
+            outcome = self._random.random()
+        return latency, outcome
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _create(self, timeout: Optional[float], kwargs: Dict[str, Any]):
+        import httpx
+        import openai
+
+        self._count("calls")
+        model = kwargs.get("model", "gpt-4o-mini")
+        messages = kwargs.get("messages", [])
+        key = exchange_key(model, messages)
+        recorded = self.recordings.get(key)
+        latency, outcome = self._draw()
+        if recorded is not None and self.replay_latency:
+            latency = recorded.get("latency_ms", latency * 1000) / 1000
+
+        request = httpx.Request("POST", "https://mock.openai.local/v1/chat/completions")
+        if outcome < self.timeout_rate or (timeout is not None and latency > timeout):
+            time.sleep(timeout if timeout is not None else latency)
+            self._count("timeouts")
+            raise openai.APITimeoutError(request=request)
+        time.sleep(latency)
+        if outcome < self.timeout_rate + self.rate_limit_rate:
+            self._count("rate_limited")
+            raise openai.RateLimitError("Simulated rate limit", response=httpx.Response(429, request=request), body=None)
+        if outcome < self.timeout_rate + self.rate_limit_rate + self.error_rate:
+            self._count("errors")
+            raise openai.InternalServerError("Simulated server error", response=httpx.Response(500, request=request),
+                                             body=None)
+
+        if recorded is not None:
+            self._count("replayed")
+            usage = recorded.get("usage", {})
+            return _completion(recorded["content"], model, usage.get("prompt_tokens", 0),
+                               usage.get("completion_tokens", 0), usage.get("cached_prompt_tokens", 0))
+
+        self._count("synthetic")
+        system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+        user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        if '"test_type"' in system:
+            # Follow-ups carry the previous extraction first; only the question itself names the test
+            follow_up = re.search(r"^Follow-up[^:]*:\s*(.*)$", user, re.MULTILINE | re.DOTALL)
+            content = json.dumps(synthetic_extraction(follow_up.group(1) if follow_up else user))
+        else:
+            content = json.dumps(synthetic_explanation(user))
+        prompt_tokens = sum(_estimate_tokens(m.get("content", "")) for m in messages)
+        return _completion(content, model, prompt_tokens, _estimate_tokens(content),
+                           cached_tokens=_estimate_tokens(system) if len(system) > 4096 else 0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "latency_ms": self.latency_ms,
+                "latency_sigma": self.latency_sigma,
+                "error_rate": self.error_rate,
+                "rate_limit_rate": self.rate_limit_rate,
+                "timeout_rate": self.timeout_rate,
+                "recordings": len(self.recordings),
+                **self.counters,
+            }
+
+
+class _RecordingCompletions:
+    def __init__(self, recorder: "RecordingClient", completions):
+        self._recorder = recorder
+        self._completions = completions
+
+    def create(self, **kwargs):
+        started = time.monotonic()
+        response = self._completions.create(**kwargs)
+        self._recorder.record(kwargs, response, time.monotonic() - started)
+        return response
+
+
+class RecordingClient:
+    """Wraps a real OpenAI client and appends each successful exchange to a JSONL file"""
+
+    def __init__(self, client, path: str):
+        self._client = client
+        self.path = path
+        self._lock = threading.Lock()
+
+    def with_options(self, **options):
+        scoped = self._client.with_options(**options)
+        return SimpleNamespace(chat=SimpleNamespace(completions=_RecordingCompletions(self, scoped.chat.completions)))
+
+    @property
+    def chat(self):
+        return SimpleNamespace(completions=_RecordingCompletions(self, self._client.chat.completions))
+
+    def record(self, kwargs: Dict[str, Any], response, latency: float):
+        usage = getattr(response, "usage", None)
+        details = getattr(usage, "prompt_tokens_details", None)
+        exchange = {
+            "key": exchange_key(kwargs.get("model", ""), kwargs.get("messages", [])),
+            "model": kwargs.get("model"),
+            "messages": kwargs.get("messages"),
+            "content": response.choices[0].message.content,
+            "latency_ms": round(latency * 1000, 1),
+            "usage": {
+                "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+                "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+                "cached_prompt_tokens": getattr(details, "cached_tokens", 0) or 0,
+            },
+        }
+        with self._lock, open(self.path, "a", encoding="utf-8") as recording:
+            recording.write(json.dumps(exchange) + "\n")
+
+
+def mock_from_env() -> Optional[MockOpenAIClient]:
+    """A MockOpenAIClient when POWERGPT_OPENAI_MOCK or POWERGPT_OPENAI_REPLAY is set, else None"""
+    replay = os.getenv("POWERGPT_OPENAI_REPLAY")
+    if not replay and os.getenv("POWERGPT_OPENAI_MOCK", "").lower() not in ("1", "true", "yes"):
+        return None
+    seed = os.getenv("POWERGPT_MOCK_SEED")
+    return MockOpenAIClient(
+        latency_ms=float(os.getenv("POWERGPT_MOCK_LATENCY_MS", "400")),
+        latency_sigma=float(os.getenv("POWERGPT_MOCK_LATENCY_SIGMA", "0.5")),
+        error_rate=float(os.getenv("POWERGPT_MOCK_ERROR_RATE", "0")),
+        rate_limit_rate=float(os.getenv("POWERGPT_MOCK_RATE_LIMIT_RATE", "0")),
+        timeout_rate=float(os.getenv("POWERGPT_MOCK_TIMEOUT_RATE", "0")),
+        replay_path=replay,
+        replay_latency=os.getenv("POWERGPT_MOCK_REPLAY_LATENCY", "").lower() in ("1", "true", "yes"),
+        seed=int(seed) if seed else None,
+    )
@@ -0,0 +1,276 @@
+"""
+PowerGPT Model Router
+=====================
+Chooses the OpenAI model for each stage of the AI pipeline and tracks
+tokens, latency and cost for every call.
+
+Each stage (``extraction``, ``explanation``) has a primary model and an
+optional fallback. By default the primary model serves the stage. Once a
+model has ``min_samples`` recorded outcomes, models whose measured accuracy
+falls below ``min_accuracy`` are skipped, and among the remaining models
+the one with the lowest median latency is chosen. Accuracy is whatever the
+caller reports through ``record_outcome`` (for extraction: whether the
+extracted parameters produced a valid statistical result).
+
+Stage settings come from environment variables, e.g.
+``POWERGPT_EXTRACTION_MODEL``, ``POWERGPT_EXTRACTION_FALLBACK_MODEL``,
+``POWERGPT_EXPLANATION_MODEL``. Prices (USD per million tokens) can be
+overridden with ``POWERGPT_MODEL_PRICES`` as JSON:
+``{"gpt-4o-mini": [0.15, 0.60]}``.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# USD per million (prompt, completion) tokens
+DEFAULT_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+
+# Models that do not accept response_format={"type": "json_object"}
+NO_JSON_MODE_MODELS = {"gpt-4", "gpt-4-0613", "gpt-4-0314"}
+
+
+def _load_prices() -> Dict[str, Tuple[float, float]]:
+    prices = dict(DEFAULT_PRICES)
+    override = os.getenv("POWERGPT_MODEL_PRICES")
+    if override:
+        prices.update({model: tuple(price) for model, price in json.loads(override).items()})
+    return prices
+
+
+class StageRoute:
+    """Model choice and generation settings for one pipeline stage"""
+
+    def __init__(
+        self,
+        stage: str,
+        model: str,
+        fallback_model: Optional[str] = None,
+        max_tokens: int = 500,
+        temperature: float = 0.1,
+        timeout: Optional[float] = None
+    ):
+        self.stage = stage
+        self.model = model
+        self.fallback_model = fallback_model if fallback_model != model else None
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls, stage: str, model: str, fallback_model: Optional[str], max_tokens: int,
+                 temperature: float) -> "StageRoute":
+        prefix = f"POWERGPT_{stage.upper()}_"
+        timeout = os.getenv(prefix + "TIMEOUT")
+        return cls(
+            stage,
+            model=os.getenv(prefix + "MODEL", model),
+            fallback_model=os.getenv(prefix + "FALLBACK_MODEL", fallback_model or "") or None,
+            max_tokens=int(os.getenv(prefix + "MAX_TOKENS", str(max_tokens))),
+            temperature=float(os.getenv(prefix + "TEMPERATURE", str(temperature))),
+            timeout=float(timeout) if timeout else None,
+        )
+
+    @property
+    def candidates(self) -> List[str]:
+        return [self.model] + ([self.fallback_model] if self.fallback_model else [])
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "fallback_model": self.fallback_model,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "timeout_s": self.timeout,
+        }
+
+
+class ModelStats:
+    """Rolling latency and outcome record for one (stage, model) pair"""
+
+    def __init__(self, window: int = 200):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost_usd = 0.0
+
+    def median_latency(self) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[len(ordered) // 2]
+
+    def accuracy(self) -> Optional[float]:
+        if not self.outcomes:
+            return None
+        return sum(self.outcomes) / len(self.outcomes)
+
+    def describe(self) -> Dict[str, Any]:
+        median = self.median_latency()
+        accuracy = self.accuracy()
+        return {
+            "calls": self.calls,
+            "median_latency_ms": round(median * 1000, 1) if median is not None else None,
+            "accuracy": round(accuracy, 3) if accuracy is not None else None,
+            "outcomes": len(self.outcomes),
+            "prompt_tokens": self.prompt_tokens,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+        }
+
+
+class CompletionResult:
+    """Text of a routed completion plus its accounting"""
+
+    def __init__(self, content: str, stage: str, model: str, latency: float, usage: Dict[str, int], cost: float):
+        self.content = content
+        self.stage = stage
+        self.model = model
+        self.latency = latency
+        self.usage = usage
+        self.cost = cost
+
+
+class ModelRouter:
+    """Routes pipeline stages to models and records per-call usage"""
+
+    def __init__(self, transport, routes: Optional[Dict[str, StageRoute]] = None,
+                 min_samples: int = 20, min_accuracy: float = 0.9, history: int = 200):
+        self.transport = transport
+        self.routes = routes or {
+            "extraction": StageRoute.from_env("extraction", "gpt-4o-mini", "gpt-4o", 300, 0.0),
+            "explanation": StageRoute.from_env("explanation", "gpt-4o-mini", None, 800, 0.7),
+        }
+        self.min_samples = int(os.getenv("POWERGPT_ROUTER_MIN_SAMPLES", str(min_samples)))
+        self.min_accuracy = float(os.getenv("POWERGPT_ROUTER_MIN_ACCURACY", str(min_accuracy)))
+        self.prices = _load_prices()
+        self.calls = deque(maxlen=history)
+        self._stats: Dict[Tuple[str, str], ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def _model_stats(self, stage: str, model: str) -> ModelStats:
+        key = (stage, model)
+        if key not in self._stats:
+            self._stats[key] = ModelStats()
+        return self._stats[key]
+
+    def choose_model(self, stage: str) -> str:
+        """Pick the model for a stage from measured accuracy and latency"""
+        route = self.routes[stage]
+        with self._lock:
+            measured = []
+            for model in route.candidates:
+                stats = self._model_stats(stage, model)
+                if len(stats.outcomes) < self.min_samples or stats.median_latency() is None:
+                    continue
+                if stats.accuracy() >= self.min_accuracy:
+                    measured.append((stats.median_latency(), model))
+            if measured:
+                return min(measured)[1]
+            # Not enough evidence yet: keep the primary unless it is known to be inaccurate
+            primary = self._model_stats(stage, route.model)
+            if route.fallback_model and len(primary.outcomes) >= self.min_samples \
+                    and primary.accuracy() < self.min_accuracy:
+                return route.fallback_model
+            return route.model
+
+    def escalation_model(self, stage: str, used_model: str) -> Optional[str]:
+        """Another candidate to retry a stage with after a poor result, if any"""
+        for model in self.routes[stage].candidates:
+            if model != used_model:
+                return model
+        return None
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        prompt_price, completion_price = self.prices.get(model, (0.0, 0.0))
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+    def complete(self, stage: str, messages: List[Dict[str, str]], model: Optional[str] = None) -> CompletionResult:
+        """Run one chat completion for a stage and record its usage"""
+        route = self.routes[stage]
+        model = model or self.choose_model(stage)
+        kwargs: Dict[str, Any] = {
+            "model": model,
+            "messages": messages,
+            "temperature": route.temperature,
+            "max_tokens": route.max_tokens,
+        }
+        if model not in NO_JSON_MODE_MODELS:
+            kwargs["response_format"] = {"type": "json_object"}
+
+        started = time.monotonic()
+        response = self.transport.chat_completion(timeout=route.timeout, **kwargs)
+        latency = time.monotonic() - started
+
+        usage = getattr(response, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", 0) or 0
+        cost = self.cost(model, prompt_tokens, completion_tokens)
+
+        with self._lock:
+            stats = self._model_stats(stage, model)
+            stats.calls += 1
+            stats.latencies.append(latency)
+            stats.prompt_tokens += prompt_tokens
+            stats.cached_prompt_tokens += cached_tokens
+            stats.completion_tokens += completion_tokens
+            stats.cost_usd += cost
+            self.calls.append({
+                "stage": stage,
+                "model": model,
+                "latency_ms": round(latency * 1000, 1),
+                "prompt_tokens": prompt_tokens,
+                "cached_prompt_tokens": cached_tokens,
+                "completion_tokens": completion_tokens,
+                "cost_usd": round(cost, 6),
+            })
+
+        return CompletionResult(
+            content=response.choices[0].message.content,
+            stage=stage,
+            model=model,
+            latency=latency,
+            usage={"prompt_tokens": prompt_tokens, "cached_prompt_tokens": cached_tokens,
+                   "completion_tokens": completion_tokens},
+            cost=cost,
+        )
+
+    def record_outcome(self, stage: str, model: str, success: bool):
+        """Feed back whether a stage's output was usable; drives accuracy-based routing"""
+        with self._lock:
+            self._model_stats(stage, model).outcomes.append(1 if success else 0)
+
+    def usage(self) -> Dict[str, Any]:
+        """Routing configuration, per-model aggregates and the most recent calls"""
+        with self._lock:
+            models = {f"{stage}:{model}": stats.describe() for (stage, model), stats in self._stats.items()}
+            total_cost = sum(stats.cost_usd for stats in self._stats.values())
+            recent = list(self.calls)
+        return {
+            "routes": {stage: route.describe() for stage, route in self.routes.items()},
+            "current_choice": {stage: self.choose_model(stage) for stage in self.routes},
+            "rules": {"min_samples": self.min_samples, "min_accuracy": self.min_accuracy},
+            "models": models,
+            "total_cost_usd": round(total_cost, 6),
+            "recent_calls": recent,
+        }
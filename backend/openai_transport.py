@@ -0,0 +1,334 @@
+"""
+PowerGPT OpenAI Transport
+=========================
+Resilient transport for OpenAI chat completions.
+
+Wraps the OpenAI client with:
+- a pooled, keep-alive httpx client with explicit connect/read timeouts
+- a per-call deadline covering every attempt, backoff and queueing
+- retries with full-jitter exponential backoff for transient errors
+- a semaphore bounding concurrent in-flight calls
+- a circuit breaker that fails calls instantly while OpenAI is unhealthy
+
+Breaker state and call latency are available from ``status()``.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TransportError(Exception):
+    """Base class for failures raised by the transport itself"""
+
+
+class CircuitOpenError(TransportError):
+    """Raised without calling OpenAI while the circuit breaker is open"""
+
+
+class TransportBusyError(TransportError):
+    """Raised when no concurrency slot frees up before the deadline"""
+
+
+class DeadlineExceededError(TransportError):
+    """Raised when the per-call deadline expires before a response arrives"""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+
+    Closed: calls flow normally. After ``failure_threshold`` consecutive
+    failures it opens and rejects calls for ``reset_timeout`` seconds, then
+    half-opens and lets a single probe call through; the probe's outcome
+    closes or re-opens the breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._times_opened = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def is_open(self) -> bool:
+        """Whether calls would currently be rejected"""
+        with self._lock:
+            state = self._current_state()
+            return state == self.OPEN or (state == self.HALF_OPEN and self._probe_in_flight)
+
+    def allow(self) -> bool:
+        """Reserve permission for one call"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """Give back a half-open probe reservation that was never used"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._times_opened += 1
+                    logger.warning(f"OpenAI circuit breaker opened after {self._failures} consecutive failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state()
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at)) if state == self.OPEN else 0.0
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout_s": self.reset_timeout,
+                "retry_in_s": round(retry_in, 2),
+                "times_opened": self._times_opened,
+            }
+
+
+class LatencyTracker:
+    """Rolling window of call latencies and outcome counters"""
+
+    def __init__(self, window: int = 500):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "successes": 0, "failures": 0, "retries": 0, "rejected": 0}
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = sorted(self._samples)
+            counters = dict(self.counters)
+        latency = {}
+        if samples:
+            for label, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+                latency[f"{label}_ms"] = round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 1)
+            latency["max_ms"] = round(samples[-1] * 1000, 1)
+        return {**counters, "latency": latency, "window": len(samples)}
+
+
+def _is_retryable(error: Exception) -> bool:
+    import openai
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500 or error.status_code in (408, 409)
+    return False
+
+
+class OpenAITransport:
+    """Deadline-bounded, retrying, rate-limited access to OpenAI chat completions"""
+
+    def __init__(
+        self,
+        api_key: str,
+        timeout: float = 30.0,
+        connect_timeout: float = 5.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        max_concurrency: int = 8,
+        pool_size: int = 16,
+        breaker: Optional[CircuitBreaker] = None,
+        client=None,
+        client_wrapper: Optional[Callable[[Any], Any]] = None
+    ):
+        """
+        Args:
+            api_key: OpenAI API key
+            timeout: Default deadline in seconds for one logical call, across all attempts
+            connect_timeout: TCP/TLS connect timeout for each attempt
+            max_retries: Retries after the first attempt for transient errors
+            backoff_base: Initial backoff ceiling in seconds (doubles per attempt, full jitter)
+            backoff_max: Upper bound on any single backoff
+            max_concurrency: Maximum simultaneous in-flight calls
+            pool_size: Keep-alive connections held in the HTTP pool
+            breaker: Circuit breaker (a default one is created when omitted)
+            client: Pre-built OpenAI-compatible client; skips building the pooled client
+            client_wrapper: Applied to the pooled client once built (e.g. to record exchanges)
+        """
+        self.api_key = api_key
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = LatencyTracker()
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._client = client
+        self._client_wrapper = client_wrapper
+        self._client_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, api_key: str, client=None,
+                 client_wrapper: Optional[Callable[[Any], Any]] = None) -> "OpenAITransport":
+        """Build a transport configured from OPENAI_* environment variables"""
+        return cls(
+            api_key=api_key,
+            timeout=float(os.getenv("OPENAI_TIMEOUT", "30")),
+            connect_timeout=float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5")),
+            max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+            max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", "8")),
+            pool_size=int(os.getenv("OPENAI_POOL_SIZE", "16")),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("OPENAI_BREAKER_THRESHOLD", "5")),
+                reset_timeout=float(os.getenv("OPENAI_BREAKER_RESET", "30")),
+            ),
+            client=client,
+            client_wrapper=client_wrapper,
+        )
+
+    @property
+    def client(self):
+        """OpenAI client over a pooled httpx client, built on first use"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import httpx
+                    import openai
+                    http_client = httpx.Client(
+                        limits=httpx.Limits(
+                            max_connections=self.pool_size,
+                            max_keepalive_connections=self.pool_size,
+                            keepalive_expiry=60.0,
+                        ),
+                        timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                    )
+                    # Retries are handled here so they share the per-call deadline
+                    client = openai.OpenAI(api_key=self.api_key, http_client=http_client, max_retries=0)
+                    self._client = self._client_wrapper(client) if self._client_wrapper else client
+        return self._client
+
+    def chat_completion(self, timeout: Optional[float] = None, **kwargs):
+        """
+        Create a chat completion within a deadline
+
+        Args:
+            timeout: Deadline in seconds for this call (defaults to the transport timeout)
+            **kwargs: Arguments for ``chat.completions.create``
+
+        Raises:
+            CircuitOpenError: The breaker is open; OpenAI was not contacted
+            TransportBusyError: No concurrency slot freed up before the deadline
+            DeadlineExceededError: The deadline expired across attempts
+            TransportError: Every attempt failed with a retryable (server-side) error
+        """
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+        if not self.breaker.allow():
+            self.stats.count("rejected")
+            raise CircuitOpenError("OpenAI circuit breaker is open")
+
+        if not self._semaphore.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            self.stats.count("rejected")
+            self.breaker.release_probe()
+            raise TransportBusyError(f"All {self.max_concurrency} OpenAI call slots are busy")
+
+        try:
+            return self._call_with_retries(deadline, kwargs)
+        finally:
+            self._semaphore.release()
+
+    def _call_with_retries(self, deadline: float, kwargs: Dict[str, Any]):
+        self.stats.count("calls")
+        started = time.monotonic()
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                response = self.client.with_options(timeout=remaining).chat.completions.create(**kwargs)
+            except Exception as error:
+                if not _is_retryable(error):
+                    # Caller errors (bad request, auth) say nothing about OpenAI's health
+                    self.stats.count("failures")
+                    self.breaker.release_probe()
+                    raise
+                last_error = error
+                logger.warning(f"OpenAI call attempt {attempt + 1} failed: {error}")
+                if attempt == self.max_retries:
+                    break
+                backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                if time.monotonic() + backoff >= deadline:
+                    break
+                self.stats.count("retries")
+                time.sleep(backoff)
+                continue
+            self.stats.record(time.monotonic() - started)
+            self.stats.count("successes")
+            self.breaker.record_success()
+            return response
+
+        self.stats.record(time.monotonic() - started)
+        self.stats.count("failures")
+        self.breaker.record_failure()
+        if last_error is None or time.monotonic() >= deadline:
+            raise DeadlineExceededError("OpenAI call exceeded its deadline") from last_error
+        raise TransportError(f"OpenAI call failed after {attempt + 1} attempts: {last_error}") from last_error
+
+    def status(self) -> Dict[str, Any]:
+        """Breaker state, latency percentiles, counters and configuration"""
+        return {
+            "breaker": self.breaker.snapshot(),
+            "calls": self.stats.snapshot(),
+            "in_flight": self.max_concurrency - self._semaphore._value,
+            "config": {
+                "timeout_s": self.timeout,
+                "connect_timeout_s": self.connect_timeout,
+                "max_retries": self.max_retries,
+                "max_concurrency": self.max_concurrency,
+                "pool_size": self.pool_size,
+            },
+        }
@@ -0,0 +1,95 @@
+"""
+PowerGPT Parameter Domains
+==========================
+Declarative domain constraints for the statistical request models.
+
+Inputs outside a test's domain (power of 1.5, a negative proportion, a zero
+standard deviation, an unknown alternative) used to reach R, fail there
+and come back as slow 500s. These annotated types and cross-field checks
+let Pydantic reject them while parsing the request, with a 422 that names
+the offending field, before any R time is spent.
+
+Power must lie strictly between the 5% significance level every test uses
+and 1; below the significance level no sample size reaches it.
+"""
+
+import math
+from typing import Annotated, Any, Dict, Literal, Optional, Sequence, Type
+
+from fastapi.exceptions import RequestValidationError
+from pydantic import AfterValidator, BaseModel, Field, ValidationError
+
+SIGNIFICANCE_LEVEL = 0.05
+
+
+def _non_zero(value: float) -> float:
+    if value == 0:
+        raise ValueError("must be non-zero")
+    return value
+
+
+def _not_one(value: float) -> float:
+    if value == 1:
+        raise ValueError("must differ from 1 (no effect)")
+    return value
+
+
+def _whole(value: float) -> float:
+    if not float(value).is_integer():
+        raise ValueError("must be a whole number")
+    return value
+
+
+Power = Annotated[float, Field(gt=SIGNIFICANCE_LEVEL, lt=1, description="Target power, between 0.05 and 1")]
+Probability = Annotated[float, Field(ge=0, le=1, description="Proportion between 0 and 1")]
+OpenProbability = Annotated[float, Field(gt=0, lt=1, description="Proportion strictly between 0 and 1")]
+Positive = Annotated[float, Field(gt=0)]
+EffectSize = Annotated[float, AfterValidator(_non_zero)]
+HazardRatio = Annotated[float, Field(gt=0), AfterValidator(_not_one)]
+CorrelationCoefficient = Annotated[float, Field(gt=-1, lt=1), AfterValidator(_non_zero)]
+DegreesOfFreedom = Annotated[float, Field(ge=1), AfterValidator(_whole)]
+Groups = Annotated[int, Field(ge=2, description="Number of groups")]
+
+Alternative = Literal["two.sided", "greater", "less"]
+# The proportion scripts also accept "one.sided" and take the direction from the effect
+ProportionAlternative = Literal["two.sided", "greater", "less", "one.sided"]
+ProportionMethod = Literal["normal", "exact"]
+
+
+def check_direction(effect: float, alternative: str, effect_name: str = "effect size"):
+    """A one-sided alternative must point the same way as the effect"""
+    if alternative == "greater" and effect < 0:
+        raise ValueError(f"alternative 'greater' requires a positive {effect_name}")
+    if alternative == "less" and effect > 0:
+        raise ValueError(f"alternative 'less' requires a negative {effect_name}")
+
+
+def check_arcsine_effect(p_a: float, p_b: float, alternative: str):
+    """
+    The rules two_proportions_test.R and single_proportion_test.R enforce on
+    h = 2 asin(sqrt(p_a)) - 2 asin(sqrt(p_b)): non-zero, and in the direction
+    of a one-sided alternative
+    """
+    h = 2 * math.asin(math.sqrt(p_a)) - 2 * math.asin(math.sqrt(p_b))
+    if h == 0:
+        raise ValueError("the proportions must differ (effect size h is zero)")
+    check_direction(h, alternative, "effect size h")
+
+
+def validate_parameters(model_class: Type[BaseModel], parameters: Dict[str, Any],
+                        loc: Optional[Sequence[Any]] = ("body", "parameters")) -> BaseModel:
+    """
+    Build a request model from a nested parameter dict, reporting errors as a 422
+
+    Used where a test's parameters arrive inside another body (group-sequential
+    designs, the profiler) or from the AI pipeline, so they fail like a direct request.
+    """
+    try:
+        return model_class(**parameters)
+    except ValidationError as e:
+        errors = e.errors(include_url=False)
+        for error in errors:
+            error["loc"] = (*loc, *error["loc"])
+            # Exception objects in the context are not JSON serializable
+            error.pop("ctx", None)
+        raise RequestValidationError(errors)
@@ -0,0 +1,615 @@
+"""
+PowerGPT Pilot Data
+===================
+Effect sizes for the statistical endpoints, computed from uploaded pilot
+data in a single streaming pass.
+
+Pilot files are parsed in chunks: CSV incrementally as the request body
+arrives, Parquet one record batch at a time (pyarrow is loaded on first
+use). Every chunk is reduced to sufficient statistics and merged into
+accumulators with the pairwise update of Chan, Golub and LeVeque, the
+chunked form of Welford's algorithm:
+
+- ``Moments``: count, mean and centred sum of squares, per group
+- ``CoMoments``: means and the centred cross-product matrix of several
+  columns (correlation and regression)
+- ``Contingency``: cell counts of two categorical columns
+
+Memory is therefore bounded by the chunk size and the number of groups,
+however large the file. The effect sizes are the ones the R scripts
+document: Cohen's d, f = sqrt(eta^2 / (1 - eta^2)) (one_way_ANOVA.R),
+w = sqrt(X^2 / (n df)) (chi_squared_test.R), r, and f2 = R^2 / (1 - R^2)
+from the adjusted R^2 (simple_linear_regression.R).
+
+Time-to-event data is reduced to ``EventTable`` counts of events and
+subjects per distinct time and arm, compacted by sorting as chunks
+arrive. Kaplan-Meier curves and numbers at risk are cumulative sums over
+the sorted table (O(n log n) overall), and the Cox hazard ratio of two
+groups (Breslow ties) is found by Newton's method, each step one pass
+over the distinct times.
+"""
+
+import codecs
+import csv
+import io
+import math
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Rows per parsed chunk
+CHUNK_ROWS = 65_536
+
+# Distinct groups / categories kept per column; more means the column is not categorical
+MAX_LEVELS = 1_000
+
+MISSING = ("", "NA", "N/A", "NaN", "nan", "null", "NULL", "None", ".")
+
+
+class Moments:
+    """Streaming count, mean and centred sum of squares of one variable"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.binary = True  # every value so far is 0 or 1
+
+    def merge(self, count: int, mean: float, m2: float):
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.mean += delta * count / total
+        self.count = total
+
+    def update(self, values: np.ndarray):
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+        self.binary = self.binary and bool(np.all((values == 0) | (values == 1)))
+        mean = float(values.mean())
+        self.merge(values.size, mean, float(((values - mean) ** 2).sum()))
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    def summary(self) -> Dict[str, Any]:
+        return {"n": self.count, "mean": self.mean, "sd": math.sqrt(self.variance) if self.count > 1 else None}
+
+
+class GroupedMoments:
+    """``Moments`` per level of a grouping column"""
+
+    def __init__(self):
+        self.groups: Dict[str, Moments] = {}
+
+    def update(self, labels: np.ndarray, values: np.ndarray):
+        keep = ~np.isnan(values) & ~np.isin(labels, MISSING)
+        labels, values = labels[keep], values[keep]
+        levels, codes = np.unique(labels, return_inverse=True)
+        counts = np.bincount(codes)
+        means = np.bincount(codes, weights=values) / counts
+        m2 = np.bincount(codes, weights=(values - means[codes]) ** 2)
+        non_binary = np.bincount(codes, weights=(values != 0) & (values != 1), minlength=levels.size)
+        for i, level in enumerate(levels):
+            group = self.groups.get(level)
+            if group is None:
+                if len(self.groups) >= MAX_LEVELS:
+                    raise ValueError(f"More than {MAX_LEVELS} groups; is the group column categorical?")
+                group = self.groups[level] = Moments()
+            group.binary = group.binary and non_binary[i] == 0
+            group.merge(int(counts[i]), float(means[i]), float(m2[i]))
+
+
+class CoMoments:
+    """Streaming means and centred cross-products of several columns (complete rows only)"""
+
+    def __init__(self, width: int):
+        self.count = 0
+        self.mean = np.zeros(width)
+        self.cross = np.zeros((width, width))
+
+    def update(self, matrix: np.ndarray):
+        matrix = matrix[~np.isnan(matrix).any(axis=1)]
+        count = matrix.shape[0]
+        if count == 0:
+            return
+        mean = matrix.mean(axis=0)
+        centred = matrix - mean
+        total = self.count + count
+        delta = mean - self.mean
+        self.cross += centred.T @ centred + np.outer(delta, delta) * self.count * count / total
+        self.mean += delta * count / total
+        self.count = total
+
+
+class Contingency:
+    """Cell counts of two categorical columns"""
+
+    def __init__(self):
+        self.cells: Dict[Tuple[str, str], int] = {}
+
+    def update(self, rows: np.ndarray, columns: np.ndarray):
+        keep = ~np.isin(rows, MISSING) & ~np.isin(columns, MISSING)
+        pairs, counts = np.unique(np.stack([rows[keep], columns[keep]], axis=1), axis=0, return_counts=True)
+        for (row, column), count in zip(pairs, counts):
+            key = (str(row), str(column))
+            if key not in self.cells and len(self.cells) >= MAX_LEVELS:
+                raise ValueError(f"More than {MAX_LEVELS} contingency cells; are the columns categorical?")
+            self.cells[key] = self.cells.get(key, 0) + int(count)
+
+    def statistic(self) -> Tuple[float, int, int]:
+        """Pearson's X^2, its degrees of freedom and n"""
+        rows = sorted({row for row, _ in self.cells})
+        columns = sorted({column for _, column in self.cells})
+        table = np.array([[self.cells.get((row, column), 0) for column in columns] for row in rows], dtype=float)
+        n = table.sum()
+        expected = np.outer(table.sum(axis=1), table.sum(axis=0)) / n
+        return float(((table - expected) ** 2 / expected).sum()), (len(rows) - 1) * (len(columns) - 1), int(n)
+
+
+def numeric(values: np.ndarray, column: str) -> np.ndarray:
+    """Strings of a chunk as floats, with the usual missing-value markers as NaN"""
+    if values.dtype.kind in "biuf":
+        return values.astype(float)
+    values = np.char.strip(values.astype(str))
+    try:
+        return np.where(np.isin(values, MISSING), "nan", values).astype(float)
+    except ValueError:
+        raise ValueError(f"Column {column!r} is not numeric")
+
+
+class PilotSpec:
+    """Which columns play which role"""
+
+    def __init__(self, outcome: Optional[str] = None, group: Optional[str] = None,
+                 paired_with: Optional[str] = None, predictors: Sequence[str] = (),
+                 category: Optional[str] = None, reference: Optional[str] = None,
+                 mu0: float = 0.0, p0: float = 0.5):
+        """
+        Args:
+            outcome: Numeric (or 0/1) outcome column
+            group: Grouping column: two levels for the two-group tests, more for ANOVA
+            paired_with: Second measurement of the outcome on the same subject
+            predictors: Numeric predictors of the outcome (correlation and regression)
+            category: Categorical column crossed with ``group`` for the chi-squared test
+            reference: Level of ``group`` used as the control (second) group
+            mu0: Reference mean of the one-mean tests
+            p0: Reference proportion of single_proportion_test
+        """
+        if outcome is None and not (group and category):
+            raise ValueError("Name an outcome column, or group and category columns")
+        if (paired_with or predictors) and outcome is None:
+            raise ValueError("paired_with and predictors need an outcome column")
+        self.outcome = outcome
+        self.group = group
+        self.paired_with = paired_with
+        self.predictors = list(predictors)
+        self.category = category
+        self.reference = reference
+        self.mu0 = mu0
+        self.p0 = p0
+
+    @property
+    def columns(self) -> List[str]:
+        names = [self.outcome, self.group, self.paired_with, *self.predictors, self.category]
+        return list(dict.fromkeys(name for name in names if name))
+
+
+class PilotSummary:
+    """All accumulators a specification needs, fed one chunk at a time"""
+
+    def __init__(self, spec: PilotSpec):
+        self.spec = spec
+        self.rows = 0
+        self.outcome = Moments() if spec.outcome else None
+        self.groups = GroupedMoments() if spec.outcome and spec.group else None
+        self.differences = Moments() if spec.paired_with else None
+        self.regression = CoMoments(len(spec.predictors) + 1) if spec.predictors else None
+        self.table = Contingency() if spec.group and spec.category else None
+
+    def update(self, chunk: Dict[str, np.ndarray]):
+        """Add a chunk given as column name -> array of strings (CSV) or values (Parquet)"""
+        spec = self.spec
+        self.rows += len(next(iter(chunk.values())))
+        outcome = numeric(chunk[spec.outcome], spec.outcome) if spec.outcome else None
+        if self.outcome is not None:
+            self.outcome.update(outcome)
+        if self.groups is not None:
+            self.groups.update(chunk[spec.group].astype(str), outcome)
+        if self.differences is not None:
+            self.differences.update(outcome - numeric(chunk[spec.paired_with], spec.paired_with))
+        if self.regression is not None:
+            self.regression.update(np.column_stack(
+                [numeric(chunk[name], name) for name in spec.predictors] + [outcome]))
+        if self.table is not None:
+            self.table.update(chunk[spec.group].astype(str), chunk[spec.category].astype(str))
+
+    def _two_groups(self) -> Optional[Tuple[str, Moments, str, Moments]]:
+        levels = sorted(self.groups.groups)
+        if len(levels) != 2:
+            return None
+        if self.spec.reference is not None:
+            if self.spec.reference not in levels:
+                raise ValueError(f"Reference level {self.spec.reference!r} is not in column {self.spec.group!r}")
+            levels.remove(self.spec.reference)
+            levels.append(self.spec.reference)
+        first, second = levels
+        return first, self.groups.groups[first], second, self.groups.groups[second]
+
+    def parameter_sets(self, power: float) -> Dict[str, Dict[str, Any]]:
+        """Request bodies for every test the data supports, keyed by test name"""
+        sets: Dict[str, Dict[str, Any]] = {}
+        spec = self.spec
+
+        if self.outcome is not None and self.outcome.count > 1 and not self.groups and not self.differences:
+            d = (self.outcome.mean - spec.mu0) / math.sqrt(self.outcome.variance)
+            sets["one_mean_T_test"] = {"d": d, "power": power, "alternative": "two.sided"}
+            sets["one_mean_wilcoxon"] = {"d": d, "power": power, "alternative": "two.sided"}
+            if self.outcome.binary:
+                sets["single_proportion_test"] = {"p1": self.outcome.mean, "p0": spec.p0, "power": power,
+                                                  "alternative": "two.sided"}
+
+        if self.differences is not None and self.differences.count > 1:
+            d = self.differences.mean / math.sqrt(self.differences.variance)
+            sets["paired_T_test"] = {"d": d, "power": power, "alternative": "two.sided"}
+            sets["paired_wilcoxon_test"] = {"d": d, "power": power, "alternative": "two.sided"}
+
+        if self.groups is not None and len(self.groups.groups) >= 2:
+            groups = list(self.groups.groups.values())
+            n = sum(group.count for group in groups)
+            grand = sum(group.count * group.mean for group in groups) / n
+            between = sum(group.count * (group.mean - grand) ** 2 for group in groups)
+            within = sum(group.m2 for group in groups)
+            eta2 = between / (between + within) if between + within > 0 else 0.0
+            if eta2 < 1:
+                f = math.sqrt(eta2 / (1 - eta2))
+                sets["one_way_ANOVA"] = {"k": len(groups), "f": f, "power": power}
+                sets["kruskal-wallace"] = {"k": len(groups), "f": f, "power": power}
+
+            two = self._two_groups()
+            if two is not None:
+                _, first, _, second = two
+                if first.count > 1 and second.count > 1:
+                    pooled = math.sqrt(within / (first.count + second.count - 2))
+                    delta = first.mean - second.mean
+                    sets["two_sample_t_test"] = {"delta": delta, "sd": pooled, "power": power}
+                    sets["mann_whitney_test"] = {"d": delta / pooled if pooled > 0 else 0.0, "power": power}
+                if first.binary and second.binary:
+                    sets["two_proportions_test"] = {"p1": first.mean, "p2": second.mean, "power": power,
+                                                    "alternative": "two.sided"}
+
+        if self.table is not None and self.table.cells:
+            statistic, df, n = self.table.statistic()
+            if df > 0:
+                sets["chi_squared_test"] = {"w": math.sqrt(statistic / (n * df)), "df": df, "power": power}
+
+        if self.regression is not None and self.regression.count > len(spec.predictors) + 1:
+            cross = self.regression.cross
+            sxx, sxy, syy = cross[:-1, :-1], cross[:-1, -1], cross[-1, -1]
+            p, n = len(spec.predictors), self.regression.count
+            r2 = float(sxy @ np.linalg.solve(sxx, sxy) / syy) if syy > 0 else 0.0
+            adjusted = 1 - (1 - r2) * (n - 1) / (n - p - 1)
+            if p == 1:
+                sets["correlation"] = {"r": float(sxy[0] / math.sqrt(sxx[0, 0] * syy)), "power": power}
+            if 0 < adjusted < 1:
+                f2 = adjusted / (1 - adjusted)
+                name = "simple_linear_regression" if p == 1 else "multiple_linear_regression"
+                sets[name] = {"u": p, "f2": f2, "power": power}
+        return sets
+
+    def summary(self) -> Dict[str, Any]:
+        summary: Dict[str, Any] = {"rows": self.rows}
+        if self.outcome is not None:
+            summary["outcome"] = self.outcome.summary()
+        if self.groups is not None:
+            summary["groups"] = {level: group.summary() for level, group in sorted(self.groups.groups.items())}
+        if self.differences is not None:
+            summary["paired_differences"] = self.differences.summary()
+        if self.regression is not None:
+            summary["complete_regression_rows"] = self.regression.count
+        if self.table is not None:
+            summary["contingency_cells"] = len(self.table.cells)
+        return summary
+
+
+class EventTable:
+    """
+    Streaming time-to-event data as counts per (time, stratum): events and subjects
+
+    Chunks are buffered and compacted by sorting, so memory grows with the number of distinct times rather
+    than of rows; the compacted table is sorted by time, as the Kaplan-Meier and Cox estimators need.
+    """
+
+    def __init__(self, compact_rows: int = 4 * CHUNK_ROWS):
+        self.labels: Dict[str, int] = {}
+        self.compact_rows = compact_rows
+        self._buffer: List[np.ndarray] = []
+        self._buffered = 0
+        self.table = np.empty((0, 4))  # columns: time, stratum, events, subjects
+
+    def update(self, times: np.ndarray, events: np.ndarray, strata: np.ndarray):
+        keep = ~np.isnan(times) & ~np.isnan(events) & ~np.isin(strata, MISSING)
+        times, events, strata = times[keep], events[keep], strata[keep]
+        if np.any(times < 0):
+            raise ValueError("Survival times must be non-negative")
+        if not np.all((events == 0) | (events == 1)):
+            raise ValueError("The status column must be 0 (censored) or 1 (event)")
+        levels, codes = np.unique(strata, return_inverse=True)
+        for level in levels:
+            if level not in self.labels:
+                if len(self.labels) >= MAX_LEVELS:
+                    raise ValueError(f"More than {MAX_LEVELS} groups; is the group column categorical?")
+                self.labels[level] = len(self.labels)
+        codes = np.array([self.labels[level] for level in levels])[codes]
+        self._buffer.append(np.column_stack([times, codes, events, np.ones_like(times)]))
+        self._buffered += times.size
+        if self._buffered >= self.compact_rows:
+            self.compact()
+
+    def compact(self) -> np.ndarray:
+        """Merge the buffered rows into the table, one row per distinct (time, stratum)"""
+        if self._buffer:
+            rows = np.concatenate([self.table, *self._buffer])
+            rows = rows[np.lexsort((rows[:, 1], rows[:, 0]))]
+            starts = np.flatnonzero(np.r_[True, np.any(np.diff(rows[:, :2], axis=0) != 0, axis=1)])
+            self.table = np.column_stack([
+                rows[starts, :2], np.add.reduceat(rows[:, 2], starts), np.add.reduceat(rows[:, 3], starts)
+            ])
+            self._buffer, self._buffered = [], 0
+        return self.table
+
+    def risk_sets(self, strata: Iterable[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Distinct times with their events and numbers at risk, pooled over ``strata``"""
+        table = self.compact()
+        rows = table[np.isin(table[:, 1], [self.labels[label] for label in strata])]
+        if rows.size == 0:
+            return np.empty(0), np.empty(0), np.empty(0)
+        starts = np.flatnonzero(np.r_[True, np.diff(rows[:, 0]) != 0])
+        events = np.add.reduceat(rows[:, 2], starts)
+        subjects = np.add.reduceat(rows[:, 3], starts)
+        return rows[starts, 0], events, subjects[::-1].cumsum()[::-1]
+
+    def aligned(self, strata: Iterable[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Events and numbers at risk of ``strata`` at every distinct time of the whole table"""
+        table = self.compact()
+        times, inverse = np.unique(table[:, 0], return_inverse=True)
+        selected = np.isin(table[:, 1], [self.labels[label] for label in strata])
+        events = np.bincount(inverse, weights=table[:, 2] * selected, minlength=times.size)
+        subjects = np.bincount(inverse, weights=table[:, 3] * selected, minlength=times.size)
+        return times, events, subjects[::-1].cumsum()[::-1]
+
+
+def kaplan_meier(times: np.ndarray, events: np.ndarray, at_risk: np.ndarray, horizon: float) -> Dict[str, Any]:
+    """Kaplan-Meier event probability by ``horizon`` and median survival from sorted risk sets"""
+    survival = np.cumprod(1 - events / at_risk)
+    before = np.searchsorted(times, horizon, side="right")
+    below = np.flatnonzero(survival <= 0.5)
+    return {
+        "event_probability": float(1 - survival[before - 1]) if before > 0 else 0.0,
+        "median_survival": float(times[below[0]]) if below.size else None,
+    }
+
+
+def cox_two_groups(events_1: np.ndarray, at_risk_1: np.ndarray, events: np.ndarray,
+                   at_risk: np.ndarray) -> Dict[str, Any]:
+    """
+    Cox partial-likelihood hazard ratio of group 1 against the rest (Breslow ties) and the log-rank test
+
+    The arguments are aligned per distinct time, so each Newton step is a single pass over the times.
+    """
+    has_events = events > 0
+    events_1, at_risk_1 = events_1[has_events], at_risk_1[has_events]
+    events, at_risk = events[has_events], at_risk[has_events]
+    at_risk_0 = at_risk - at_risk_1
+    observed = events_1.sum()
+    if observed == 0 or observed == events.sum():
+        raise ValueError("Every event is in one group, so the hazard ratio cannot be estimated")
+
+    def score_information(beta):
+        share = at_risk_1 * math.exp(beta) / (at_risk_0 + at_risk_1 * math.exp(beta))
+        return observed - (events * share).sum(), (events * share * (1 - share)).sum()
+
+    score, information = score_information(0.0)
+    log_rank = score ** 2 / information
+    # Newton's method from the one-step (Peto) estimate; the log-likelihood is concave in beta
+    beta = score / information
+    for _ in range(100):
+        score, information = score_information(beta)
+        step = score / information
+        beta += step
+        if abs(step) < 1e-10:
+            break
+    else:
+        raise ValueError("The hazard ratio estimate did not converge")
+    se = math.sqrt(1 / score_information(beta)[1])
+    return {
+        "hazard_ratio": math.exp(beta),
+        "log_hazard_ratio_se": se,
+        "ci95": [math.exp(beta - 1.959963984540054 * se), math.exp(beta + 1.959963984540054 * se)],
+        "log_rank_chisq": float(log_rank),
+        "log_rank_p": float(math.erfc(math.sqrt(log_rank / 2))),
+    }
+
+
+class SurvivalSpec:
+    """Which columns of time-to-event data play which role"""
+
+    def __init__(self, time: str, status: str, group: Optional[str] = None, covariate: Optional[str] = None,
+                 reference: Optional[str] = None, horizon: Optional[float] = None):
+        """
+        Args:
+            time: Follow-up time (event or censoring)
+            status: 1 for an event, 0 for censoring
+            group: Treatment arm; two levels give log_rank_test
+            covariate: 0/1 covariate of interest for cox_ph; the group indicator when omitted
+            reference: Level of ``group`` used as the control arm
+            horizon: Study horizon for the event probabilities; by default the last time observed in every arm
+        """
+        if horizon is not None and horizon <= 0:
+            raise ValueError("horizon must be positive")
+        self.time = time
+        self.status = status
+        self.group = group
+        self.covariate = covariate
+        self.reference = reference
+        self.horizon = horizon
+
+    @property
+    def columns(self) -> List[str]:
+        return list(dict.fromkeys(name for name in (self.time, self.status, self.group, self.covariate) if name))
+
+
+class SurvivalSummary:
+    """Event tables of time-to-event data, fed one chunk at a time"""
+
+    def __init__(self, spec: SurvivalSpec):
+        self.spec = spec
+        self.rows = 0
+        self.groups = EventTable()
+        self.covariate = EventTable() if spec.covariate else None
+
+    def update(self, chunk: Dict[str, np.ndarray]):
+        spec = self.spec
+        self.rows += len(chunk[spec.time])
+        times = numeric(chunk[spec.time], spec.time)
+        events = numeric(chunk[spec.status], spec.status)
+        groups = chunk[spec.group].astype(str) if spec.group else np.full(times.size, "all")
+        self.groups.update(times, events, groups)
+        if self.covariate is not None:
+            values = numeric(chunk[spec.covariate], spec.covariate)
+            if not np.all(np.isnan(values) | (values == 0) | (values == 1)):
+                raise ValueError(f"The covariate {spec.covariate!r} must be 0 or 1")
+            self.covariate.update(times, events, np.where(np.isnan(values), "", values.astype(int).astype(str)))
+
+    def _arms(self) -> Optional[Tuple[str, str]]:
+        """(experimental, control) levels of a two-arm group column"""
+        levels = sorted(self.groups.labels)
+        if not self.spec.group or len(levels) != 2:
+            return None
+        if self.spec.reference is not None:
+            if self.spec.reference not in levels:
+                raise ValueError(f"Reference level {self.spec.reference!r} is not in column {self.spec.group!r}")
+            levels.remove(self.spec.reference)
+            levels.append(self.spec.reference)
+        return levels[0], levels[1]
+
+    def estimate(self, power: float) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+        """The estimates, and request bodies for log_rank_test and cox_ph where the data support them"""
+        everyone = list(self.groups.labels)
+        times, events, at_risk = self.groups.risk_sets(everyone)
+        if events.sum() == 0:
+            raise ValueError("The data contain no events")
+        arms = self._arms()
+        horizon = self.spec.horizon
+        if horizon is None:
+            horizon = min(self.groups.risk_sets([arm])[0][-1] for arm in arms) if arms else float(times[-1])
+
+        summary: Dict[str, Any] = {
+            "rows": self.rows, "subjects": int(at_risk[0]), "events": int(events.sum()), "horizon": horizon,
+            **{f"pooled_{key}": value for key, value in kaplan_meier(times, events, at_risk, horizon).items()},
+        }
+        sets: Dict[str, Dict[str, Any]] = {}
+        psi = summary["pooled_event_probability"]
+        cox = None
+        if arms is not None:
+            experimental, control = arms
+            summary["groups"] = {}
+            for arm in arms:
+                arm_times, arm_events, arm_at_risk = self.groups.risk_sets([arm])
+                summary["groups"][arm] = {
+                    "role": "experimental" if arm == experimental else "control",
+                    "subjects": int(arm_at_risk[0]), "events": int(arm_events.sum()),
+                    **kaplan_meier(arm_times, arm_events, arm_at_risk, horizon),
+                }
+            _, events_e, at_risk_e = self.groups.aligned([experimental])
+            summary["hazard_ratio"] = cox = cox_two_groups(events_e, at_risk_e, *self.groups.aligned(everyone)[1:])
+            n_e, n_c = (summary["groups"][arm]["subjects"] for arm in arms)
+            sets["log_rank_test"] = {
+                "power": power, "k": n_e / n_c, "RR": cox["hazard_ratio"],
+                "pE": summary["groups"][experimental]["event_probability"],
+                "pC": summary["groups"][control]["event_probability"],
+            }
+            p = n_e / (n_e + n_c)
+        if self.covariate is not None:
+            if len(self.covariate.labels) != 2:
+                raise ValueError(f"The covariate {self.spec.covariate!r} must take both values 0 and 1")
+            _, events_1, at_risk_1 = self.covariate.aligned(["1"])
+            _, events, at_risk = self.covariate.aligned(["0", "1"])
+            summary["covariate_hazard_ratio"] = cox = cox_two_groups(events_1, at_risk_1, events, at_risk)
+            p = at_risk_1[0] / at_risk[0]
+        if cox is not None:
+            sets["cox_ph"] = {"power": power, "theta": cox["hazard_ratio"], "p": float(p), "psi": psi}
+        return summary, sets
+
+
+class CSVChunker:
+    """Incremental CSV parser: feed bytes as they arrive, get column chunks of at most CHUNK_ROWS rows"""
+
+    def __init__(self, columns: Sequence[str], delimiter: str = ",", chunk_rows: int = CHUNK_ROWS):
+        self.columns = list(columns)
+        self.delimiter = delimiter
+        self.chunk_rows = chunk_rows
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._pending = ""
+        self._rows: List[List[str]] = []
+        self._indices: Optional[List[int]] = None
+        self.header: Optional[List[str]] = None
+
+    def _chunk(self) -> Dict[str, np.ndarray]:
+        table = np.array(self._rows, dtype=object).reshape(len(self._rows), len(self.columns))
+        self._rows = []
+        return {name: table[:, i] for i, name in enumerate(self.columns)}
+
+    def _parse(self, text: str) -> Iterator[Dict[str, np.ndarray]]:
+        for row in csv.reader(io.StringIO(text), delimiter=self.delimiter):
+            if not row:
+                continue
+            if self._indices is None:
+                self.header = [name.strip() for name in row]
+                missing = [name for name in self.columns if name not in self.header]
+                if missing:
+                    raise ValueError(f"Columns not in the file: {', '.join(missing)}")
+                self._indices = [self.header.index(name) for name in self.columns]
+                continue
+            self._rows.append([row[i] if i < len(row) else "" for i in self._indices])
+            if len(self._rows) >= self.chunk_rows:
+                yield self._chunk()
+
+    def feed(self, data: bytes) -> Iterator[Dict[str, np.ndarray]]:
+        # Only complete lines are parsed; the tail waits for the next piece
+        text = self._pending + self._decoder.decode(data)
+        cut = text.rfind("\n") + 1
+        self._pending = text[cut:]
+        return self._parse(text[:cut])
+
+    def close(self) -> Iterator[Dict[str, np.ndarray]]:
+        text = self._pending + self._decoder.decode(b"", final=True)
+        self._pending = ""
+        yield from self._parse(text)
+        if self._indices is None:
+            raise ValueError("The file is empty")
+        if self._rows:
+            yield self._chunk()
+
+
+def parquet_chunks(path: str, columns: Sequence[str], chunk_rows: int = CHUNK_ROWS) -> Iterable[Dict[str, np.ndarray]]:
+    """Record batches of a Parquet file as column chunks"""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet uploads need pyarrow (pip install pyarrow); CSV works without it")
+    parquet = pq.ParquetFile(path)
+    missing = [name for name in columns if name not in parquet.schema_arrow.names]
+    if missing:
+        raise ValueError(f"Columns not in the file: {', '.join(missing)}")
+    for batch in parquet.iter_batches(batch_size=chunk_rows, columns=list(columns)):
+        chunk = {}
+        for name in columns:
+            values = batch.column(name).to_numpy(zero_copy_only=False)
+            # Numbers pass through as floats (nulls become NaN); everything else as strings
+            chunk[name] = values.astype(float) if values.dtype.kind in "iufb" else values.astype(str)
+        yield chunk
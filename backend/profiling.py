@@ -0,0 +1,360 @@
+"""
+PowerGPT Profiling
+==================
+On-demand profiling of the Python and R hot paths.
+
+Python time is measured by a sampling thread that walks the stacks of the
+profiled threads at a fixed interval. R time is measured with ``Rprof``,
+switched on around each R call made through ``r_session`` on the R
+thread. Both are reported as collapsed stacks (``frame;frame;frame weight``,
+the input format of flamegraph.pl and speedscope), and merged into one
+profile in which R stacks hang below the Python frame that called into
+rpy2. Weights are microseconds.
+
+Profiling is admin-only: the endpoints require the ``X-Admin-Token`` header
+to match ``POWERGPT_ADMIN_TOKEN`` and are disabled when it is unset.
+``ProfilingMiddleware`` additionally profiles a random
+``POWERGPT_PROFILE_SAMPLE_RATE`` fraction of statistical and AI requests
+and keeps the most recent profiles in memory. The sampler sees every
+thread, so a request is only profiled when no other request is in flight,
+and its profile is discarded if another request is admitted before it
+finishes; under sustained concurrency few profiles are collected.
+"""
+
+import hmac
+import inspect
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query
+
+import r_session
+from parameter_domains import validate_parameters
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = str(Path(__file__).resolve().parent)
+
+# Prefix of R frames in merged stacks
+R_FRAME_PREFIX = "[R] "
+
+
+def _frame_label(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+def _is_rpy2_frame(label: str) -> bool:
+    return label.startswith("rpy2.") or label.startswith("rpy2:")
+
+
+class StackSampler:
+    """Samples Python stacks of selected threads from a background thread"""
+
+    def __init__(self, interval: float = 0.001, thread_ids: Optional[Iterable[int]] = None,
+                 frame_filter: Optional[Callable[[Any], bool]] = None):
+        """
+        Args:
+            interval: Seconds between samples
+            thread_ids: Threads to sample; all other threads are ignored when given
+            frame_filter: Keep a stack only if this accepts at least one of its frames
+        """
+        self.interval = interval
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.frame_filter = frame_filter
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self):
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(frame)
+                frame = frame.f_back
+            if self.frame_filter is not None and not any(self.frame_filter(f) for f in frames):
+                continue
+            self.stacks[";".join(_frame_label(f) for f in reversed(frames))] += 1
+            self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def parse_rprof(text: str, interval: float = 0.02) -> Tuple[Counter, float]:
+    """Collapsed stacks and the sampling interval (seconds) from an Rprof output file"""
+    stacks: Counter = Counter()
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if "sample.interval=" in line:
+            for field in line.split(":"):
+                if field.startswith("sample.interval="):
+                    interval = int(field.split("=", 1)[1]) / 1_000_000
+            continue
+        # Each line lists the call stack innermost first as quoted names
+        frames = [name for name in line.split('"')[1::2] if name]
+        if frames:
+            stacks[";".join(R_FRAME_PREFIX + name for name in reversed(frames))] += 1
+    return stacks, interval
+
+
+class RProfCollector:
+    """``r_session`` call observer that runs each R call under Rprof"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.sampled_interval = interval
+        self.calls: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def observe(self, name: str):
+        handle, path = tempfile.mkstemp(prefix="powergpt-rprof-", suffix=".out")
+        os.close(handle)
+        r_path = path.replace("\\", "/")
+        started = time.perf_counter()
+        r_session.evaluate(f'Rprof("{r_path}", interval = {self.interval})')
+        try:
+            yield
+        finally:
+            r_session.evaluate("Rprof(NULL)")
+            self.calls.append({"function": name, "ms": round((time.perf_counter() - started) * 1000, 2)})
+            try:
+                stacks, self.sampled_interval = parse_rprof(Path(path).read_text(), self.interval)
+                self.stacks.update(stacks)
+            finally:
+                os.unlink(path)
+
+
+def merge_profiles(python_stacks: Counter, python_interval: float,
+                   r_stacks: Counter, r_interval: float) -> Dict[str, int]:
+    """
+    Merge Python and R samples into one set of collapsed stacks
+
+    Python stacks that end inside rpy2 are time spent in R; they are replaced
+    by the R stacks, attached below each such Python call site in proportion
+    to the Python samples seen there. Weights are microseconds.
+    """
+    merged: Counter = Counter()
+    call_sites: Counter = Counter()
+    for stack, count in python_stacks.items():
+        frames = stack.split(";")
+        cut = next((i for i, label in enumerate(frames) if _is_rpy2_frame(label)), None)
+        if cut is not None and r_stacks:
+            call_sites[";".join(frames[:cut])] += count
+        else:
+            merged[stack] += count * python_interval * 1_000_000
+
+    total_sites = sum(call_sites.values())
+    for r_stack, count in r_stacks.items():
+        weight = count * r_interval * 1_000_000
+        if not total_sites:
+            merged[r_stack] += weight
+            continue
+        for site, site_count in call_sites.items():
+            merged[f"{site};{r_stack}" if site else r_stack] += weight * site_count / total_sites
+    return {stack: int(round(weight)) for stack, weight in merged.items() if weight >= 0.5}
+
+
+class Profile:
+    """Python and R samples collected for one profiled unit of work"""
+
+    def __init__(self, python_interval: float, r_interval: float):
+        self.python_interval = python_interval
+        self.r_interval = r_interval
+        self.sampler: Optional[StackSampler] = None
+        self.r_collector = RProfCollector(r_interval)
+        self.duration = 0.0
+
+    def report(self, **extra) -> Dict[str, Any]:
+        python_stacks = self.sampler.stacks if self.sampler else Counter()
+        merged = merge_profiles(python_stacks, self.python_interval,
+                                self.r_collector.stacks, self.r_collector.sampled_interval)
+        return {
+            **extra,
+            "duration_ms": round(self.duration * 1000, 2),
+            "python": {"interval_ms": self.python_interval * 1000, "samples": sum(python_stacks.values())},
+            "r": {
+                "interval_ms": self.r_collector.sampled_interval * 1000,
+                "samples": sum(self.r_collector.stacks.values()),
+                "calls": self.r_collector.calls,
+            },
+            "collapsed": [f"{stack} {weight}" for stack, weight in
+                          sorted(merged.items(), key=lambda item: item[1], reverse=True)],
+        }
+
+
+@contextmanager
+def profiled(python_interval: float = 0.001, r_interval: float = 0.005,
+             thread_ids: Optional[Iterable[int]] = None,
+             frame_filter: Optional[Callable[[Any], bool]] = None):
+    """Profile the enclosed block; yields a ``Profile`` that is complete on exit"""
+    profile = Profile(python_interval, r_interval)
+    profile.sampler = StackSampler(python_interval, thread_ids, frame_filter)
+    token = r_session.r_call_observer.set(profile.r_collector)
+    started = time.perf_counter()
+    profile.sampler.start()
+    try:
+        yield profile
+    finally:
+        profile.sampler.stop()
+        profile.duration = time.perf_counter() - started
+        r_session.r_call_observer.reset(token)
+
+
+def _in_backend_code(frame) -> bool:
+    filename = frame.f_code.co_filename
+    return filename.startswith(BACKEND_DIR) and not filename.endswith("profiling.py")
+
+
+class RecentProfiles:
+    """Ring buffer of profiles taken from sampled traffic"""
+
+    def __init__(self, size: int = 50):
+        self._profiles = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, profile: Dict[str, Any]):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._profiles)
+
+
+recent_profiles = RecentProfiles(int(os.getenv("POWERGPT_PROFILE_HISTORY", "50")))
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling a random fraction of requests under the given path prefixes"""
+
+    def __init__(self, app, prefixes: Tuple[str, ...] = ("/api/v1/", "/ai/query"),
+                 sample_rate: Optional[float] = None):
+        self.app = app
+        self.prefixes = prefixes
+        self.sample_rate = sample_rate if sample_rate is not None else \
+            float(os.getenv("POWERGPT_PROFILE_SAMPLE_RATE", "0"))
+        # Requests past admission, and the requests admitted while a profile is being taken.
+        # Both are only touched on the event loop.
+        self.in_flight = 0
+        self._overlapping: Optional[List[int]] = None
+        self.discarded = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        self.in_flight += 1
+        try:
+            if self._overlapping is not None:
+                self._overlapping[0] += 1
+            if self.sample_rate <= 0 or random.random() >= self.sample_rate or self.in_flight > 1 \
+                    or self._overlapping is not None or not scope.get("path", "").startswith(self.prefixes):
+                await self.app(scope, receive, send)
+                return
+            await self._profile(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+
+    async def _profile(self, scope, receive, send):
+        # The handler runs on a pool thread and R on its own thread, so every thread inside backend code
+        # is sampled; that is only this request's work while nothing else runs
+        status = {}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        overlapping = self._overlapping = [0]
+        try:
+            with profiled(frame_filter=_in_backend_code) as profile:
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            self._overlapping = None
+        if overlapping[0]:
+            self.discarded += 1
+            return
+        recent_profiles.add(profile.report(
+            path=scope["path"], method=scope.get("method"), status=status.get("code"), at=time.time()
+        ))
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Dependency guarding admin endpoints with POWERGPT_ADMIN_TOKEN"""
+    expected = os.getenv("POWERGPT_ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, expected):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+admin_router = APIRouter(prefix="/admin", tags=["Admin"], dependencies=[Depends(require_admin)])
+
+
+@admin_router.post("/profile/{test_name}")
+def profile_test(
+    test_name: str,
+    parameters: Dict[str, Any] = Body(..., description="Request body the test endpoint would receive"),
+    python_interval_ms: float = Query(1.0, gt=0, description="Python sampling interval"),
+    r_interval_ms: float = Query(5.0, ge=1, description="Rprof sampling interval")
+):
+    """Run one call of a statistical test's real handler under the profilers"""
+    import app
+
+    if test_name not in app.STATISTICAL_TESTS:
+        raise HTTPException(status_code=404, detail=f"Unknown test: {test_name}")
+    handler, model_class = app.STATISTICAL_TESTS[test_name]
+    arguments = validate_parameters(model_class, parameters, loc=("body",))
+    # Bypass request coalescing so the profile always contains the computation itself
+    handler = inspect.unwrap(handler)
+
+    # R calls run on the R thread, so sample it together with this one
+    thread_ids = [threading.get_ident()]
+    if r_session.executor.thread_id is not None:
+        thread_ids.append(r_session.executor.thread_id)
+    with profiled(python_interval_ms / 1000, r_interval_ms / 1000, thread_ids=thread_ids) as profile:
+        result = handler(arguments)
+    return profile.report(test=test_name, parameters=arguments.model_dump(), result=result)
+
+
+@admin_router.get("/profiles")
+def sampled_profiles(merge: bool = Query(False, description="Sum all recent profiles into one")):
+    """Profiles collected from sampled traffic, most recent last"""
+    profiles = recent_profiles.snapshot()
+    if not merge:
+        return {"profiles": profiles}
+    totals: Counter = Counter()
+    for profile in profiles:
+        for line in profile["collapsed"]:
+            stack, _, weight = line.rpartition(" ")
+            totals[stack] += int(weight)
+    return {
+        "count": len(profiles),
+        "collapsed": [f"{stack} {weight}" for stack, weight in totals.most_common()],
+    }
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+PowerGPT R Session Image
+========================
+Builds the prepared R session image restored by ``r_session.initialize()``
+and measures worker time-to-ready with and without it.
+
+Usage:
+    python r_image.py build [--output powergpt_session.RData]
+    python r_image.py measure [--runs 5]
+
+``build`` sources every script, byte-compiles the statistical functions and
+saves them together with the list of packages the scripts attach and a
+hash of the scripts. A worker restores the image instead of parsing and
+sourcing the scripts; an image built from other script versions is
+ignored. ``measure`` starts fresh processes that initialize and warm R,
+alternately with and without the image, and reports the median of each
+startup phase.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import r_session
+
+# Run in a fresh interpreter: start R, warm every function and print the phase timings
+COLD_START = (
+    "import json, r_session\n"
+    "r_session.initialize()\n"
+    "r_session.warm_up()\n"
+    "print(json.dumps(r_session.startup_timer.report()))\n"
+)
+
+
+def cold_start(image: str) -> dict:
+    """Time-to-ready of one fresh process; ``image`` is the image path (a missing path disables it)"""
+    env = dict(os.environ, POWERGPT_R_IMAGE=image)
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", COLD_START], env=env, cwd=str(r_session.SCRIPT_DIR),
+                            check=True, capture_output=True, text=True).stdout
+    wall_ms = (time.perf_counter() - started) * 1000
+    report = json.loads(output.strip().splitlines()[-1])
+    return {"wall_ms": wall_ms, **report}
+
+
+def summarize(runs: list) -> dict:
+    phases = {}
+    for run in runs:
+        for name, ms in run["phases_ms"].items():
+            # Collapse per-script and per-function phases into one figure each
+            group = name.split(":", 1)[0] if name.startswith(("source:", "warm:")) else name
+            phases.setdefault(group, []).append(ms)
+    return {
+        "wall_ms": round(statistics.median(run["wall_ms"] for run in runs), 1),
+        "r_ready_ms": round(statistics.median(run["total_ms"] for run in runs), 1),
+        "phases_ms": {name: round(statistics.median(values), 1) for name, values in phases.items()},
+    }
+
+
+def measure(runs: int, image: Path) -> dict:
+    if not image.is_file():
+        raise SystemExit(f"No image at {image}; run 'python r_image.py build' first")
+    missing = str(image) + ".disabled"
+    with_image, without_image = [], []
+    for _ in range(runs):
+        # Interleave so disk cache and machine load affect both modes alike
+        without_image.append(cold_start(missing))
+        with_image.append(cold_start(str(image)))
+    return {"runs": runs, "sourcing": summarize(without_image), "image": summarize(with_image)}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build or evaluate the prepared R session image")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Write the session image")
+    build.add_argument("--output", type=Path, default=r_session.IMAGE_PATH)
+    timing = commands.add_parser("measure", help="Compare time-to-ready with and without the image")
+    timing.add_argument("--runs", type=int, default=5)
+    timing.add_argument("--image", type=Path, default=r_session.IMAGE_PATH)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == "build":
+        print(json.dumps(r_session.build_image(args.output), indent=2))
+    else:
+        print(json.dumps(measure(args.runs, args.image), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,514 @@
+"""
+PowerGPT R Session
+==================
+Lifecycle management for the embedded R interpreter.
+
+Importing rpy2 starts R, and sourcing a script loads its packages, so both
+are deferred until ``initialize()`` is called from the application's
+lifespan handler. Every script is sourced exactly once per process and the
+resulting R functions are looked up by name with ``get_function()``.
+``warm_up()`` then calls each function once so the first real request
+does not pay for lazy package loading, and records the outcome of every
+call in ``warm_status()``. Each startup phase is timed and available from
+``startup_timer``.
+
+When a session image built by ``r_image.py`` is present and matches the
+current scripts, ``initialize()`` restores the byte-compiled functions from
+it and attaches the recorded packages instead of sourcing every script.
+
+R is single-threaded, so every call made through a function returned by
+``get_function()`` runs on one dedicated R thread. The caller waits at most
+``POWERGPT_R_TIMEOUT`` seconds (or the limit set with ``call_timeout()``),
+including time queued behind other calls, and then gets ``RTimeoutError``.
+Queued calls run in priority order: calls made under
+``call_priority(PRIORITY_AI)`` wait behind the statistical endpoints'.
+A call that is already running is interrupted the way Ctrl-C would
+interrupt R. If R does not return within ``POWERGPT_R_INTERRUPT_GRACE``
+seconds after that, the session is wedged: the worker stops reporting
+ready, later calls fail at once with ``RUnavailableError``, and the worker
+asks to be replaced with SIGTERM. A call observer set in
+``r_call_observer`` (for example the profiler) is notified around each call
+on the R thread.
+"""
+
+import contextvars
+import hashlib
+import itertools
+import logging
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+
+# R function name -> script that defines it
+R_FUNCTIONS = {
+    "add_numbers": "sum.r",
+    "twosamplettest_n": "twoSampleTTest.R",
+    "logranktest_n": "logRankTest.R",
+    "paired_t_test_n": "paired_T_test.R",
+    "two_proportions_test_n": "two_proportions_test.R",
+    "chi_squared_test_n": "chi_squared_test.R",
+    "one_mean_T_test_n": "one_mean_T_test.R",
+    "one_way_ANOVA_n": "one_way_ANOVA.R",
+    "single_proportion_test_n": "single_proportion_test.R",
+    "cox_ph_n": "cox_ph.R",
+    "correlation": "correlation.R",
+    "kruskal_wallace_test": "kruskal_wallace_test.R",
+    "simple_linear_regression": "simple_linear_regression.R",
+    "multiple_linear_regression": "multiple_linear_regression.R",
+    "one_mean_wilcoxon": "one_mean_wilcoxon.R",
+    "mann_whitney_test": "mann_whitney_test.R",
+    "paired_wilcoxon_test": "paired_wilcoxon_test.R",
+}
+
+# Prepared session image (see r_image.py); sourcing is used when it is missing or stale
+IMAGE_PATH = Path(os.getenv("POWERGPT_R_IMAGE", str(SCRIPT_DIR / "powergpt_session.RData")))
+
+# Packages R attaches by default; the image records only the ones the scripts add
+DEFAULT_PACKAGES = ("stats", "graphics", "grDevices", "utils", "datasets", "methods", "base")
+
+# First calls load packages lazily, so warm-up calls get a longer deadline
+WARMUP_TIMEOUT = float(os.getenv("POWERGPT_R_WARMUP_TIMEOUT", "120"))
+
+# Representative inputs used to exercise each function once after sourcing
+WARMUP_CALLS = {
+    "add_numbers": (1, 2),
+    "twosamplettest_n": (0.5, 1.0, 0.8),
+    "logranktest_n": (0.8, 1.0, 0.3, 0.5, 0.6),
+    "paired_t_test_n": (0.8, 0.8, "greater"),
+    "two_proportions_test_n": (0.8, 0.5, 0.8, "two.sided"),
+    "chi_squared_test_n": (0.3, 3, 0.8),
+    "one_mean_T_test_n": (0.5, 0.8, "two.sided"),
+    "one_way_ANOVA_n": (3, 0.25, 0.8),
+    "single_proportion_test_n": (0.7, 0.65, 0.8, "less"),
+    "cox_ph_n": (0.8, 2.0, 0.56, 0.57),
+    "correlation": (0.5, 0.8),
+    "kruskal_wallace_test": (3, 0.25, 0.8),
+    "simple_linear_regression": (1, 0.35, 0.8),
+    "multiple_linear_regression": (3, 0.15, 0.8),
+    "one_mean_wilcoxon": (0.5, 0.8, "greater"),
+    "mann_whitney_test": (0.5, 0.8, "two.sided"),
+    "paired_wilcoxon_test": (0.8, 0.8, "greater"),
+}
+
+
+class StartupTimer:
+    """Records the wall-clock duration of named startup phases"""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = seconds
+        logger.info(f"Startup phase {name}: {seconds * 1000:.1f} ms")
+
+    def report(self) -> Dict[str, Any]:
+        """Per-phase timings in milliseconds plus their total"""
+        phases = {name: round(seconds * 1000, 2) for name, seconds in self.phases.items()}
+        return {"phases_ms": phases, "total_ms": round(sum(phases.values()), 2)}
+
+
+startup_timer = StartupTimer()
+
+_robjects = None
+_functions: Dict[str, "RFunction"] = {}
+_init_lock = threading.Lock()
+
+# R function name -> outcome of its most recent warm-up call
+_warm_results: Dict[str, Dict[str, Any]] = {}
+
+# Object with an ``observe(name)`` context manager wrapped around each R call in this context
+r_call_observer: contextvars.ContextVar[Optional[Any]] = contextvars.ContextVar("r_call_observer", default=None)
+
+
+class RTimeoutError(Exception):
+    """An R call did not finish within its deadline"""
+
+    def __init__(self, function: str, timeout: float, phase: str):
+        """
+        Args:
+            function: R function (or expression) that was called
+            timeout: The deadline in seconds
+            phase: "queued" (never started), "interrupted" (stopped by an interrupt)
+                   or "wedged" (ignored the interrupt; the worker is being replaced)
+        """
+        super().__init__(f"R call {function} exceeded its {timeout:g} s deadline ({phase})")
+        self.function = function
+        self.timeout = timeout
+        self.phase = phase
+
+
+class RUnavailableError(Exception):
+    """R is wedged in an uninterruptible call and the worker is being replaced"""
+
+
+# Seconds each R call may take, queueing included, unless overridden with call_timeout()
+DEFAULT_TIMEOUT = float(os.getenv("POWERGPT_R_TIMEOUT", "10"))
+INTERRUPT_GRACE = float(os.getenv("POWERGPT_R_INTERRUPT_GRACE", "2"))
+
+_call_timeout: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("r_call_timeout", default=None)
+
+
+@contextmanager
+def call_timeout(seconds: float):
+    """Use a different per-call deadline for R calls made inside the block"""
+    token = _call_timeout.set(seconds)
+    try:
+        yield
+    finally:
+        _call_timeout.reset(token)
+
+
+# Queue priority of R calls; lower runs first. Requests to the statistical endpoints go ahead of the
+# R calls of AI queries, so a burst of AI traffic cannot starve them.
+PRIORITY_API = 0
+PRIORITY_AI = 1
+
+_call_priority: contextvars.ContextVar[int] = contextvars.ContextVar("r_call_priority", default=PRIORITY_API)
+
+
+@contextmanager
+def call_priority(priority: int):
+    """Queue R calls made inside the block at ``priority`` (PRIORITY_API or PRIORITY_AI)"""
+    token = _call_priority.set(priority)
+    try:
+        yield
+    finally:
+        _call_priority.reset(token)
+
+
+def _interrupt_r() -> bool:
+    """Ask R to stop at its next interrupt check, as SIGINT would"""
+    try:
+        from rpy2.rinterface_lib import openrlib
+        openrlib.rlib.R_interrupts_pending = 1
+        return True
+    except Exception as e:
+        logger.error(f"Could not interrupt R: {e}")
+        return False
+
+
+def _clear_interrupt():
+    try:
+        from rpy2.rinterface_lib import openrlib
+        openrlib.rlib.R_interrupts_pending = 0
+    except Exception:
+        pass
+
+
+class _RCall:
+    __slots__ = ("name", "function", "context", "future")
+
+    def __init__(self, name: str, function: Callable[[], Any]):
+        self.name = name
+        self.function = function
+        self.context = contextvars.copy_context()
+        self.future: Future = Future()
+
+
+class RExecutor:
+    """The single thread that runs R, with per-call deadlines and interruption"""
+
+    def __init__(self, grace: float = INTERRUPT_GRACE):
+        self.grace = grace
+        self.wedged = False
+        self.timeouts: Dict[str, int] = {"queued": 0, "interrupted": 0, "wedged": 0}
+        # Health-probe overruns, kept apart from the timeouts requests see
+        self.probe_timeouts: Dict[str, int] = {"queued": 0, "interrupted": 0, "wedged": 0}
+        # (priority, arrival, call): first in, first out within a priority
+        self._queue: "queue.PriorityQueue[Tuple[int, int, _RCall]]" = queue.PriorityQueue()
+        self._arrivals = itertools.count()
+        self._current: Optional[_RCall] = None
+        self._interrupted: Optional[_RCall] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def thread_id(self) -> Optional[int]:
+        return self._thread.ident if self._thread is not None else None
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                # Daemon, so a wedged call cannot keep the process from exiting
+                self._thread = threading.Thread(target=self._run, name="r-executor", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            _, _, call = self._queue.get()
+            if not call.future.set_running_or_notify_cancel():
+                continue
+            with self._lock:
+                self._current = call
+            try:
+                result = call.context.run(call.function)
+            except BaseException as e:
+                call.future.set_exception(e)
+            else:
+                call.future.set_result(result)
+            finally:
+                with self._lock:
+                    self._current = None
+                    if self._interrupted is call:
+                        self._interrupted = None
+                        _clear_interrupt()
+
+    def _interrupt(self, call: _RCall) -> bool:
+        with self._lock:
+            if self._current is not call:
+                return False
+            self._interrupted = call
+            return _interrupt_r()
+
+    def _wedge(self, call: _RCall):
+        self.wedged = True
+        logger.critical(f"R call {call.name} ignored an interrupt; replacing worker {os.getpid()}")
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    def call(self, name: str, function: Callable[[], Any], timeout: Optional[float] = None,
+             probe: bool = False):
+        """
+        Run ``function`` on the R thread and wait at most ``timeout`` seconds for it
+
+        A ``probe`` call (a health check) counts its overruns in ``probe_timeouts`` instead of ``timeouts``.
+        """
+        if threading.get_ident() == self.thread_id:
+            return function()  # nested call, e.g. from a call observer
+        if self.wedged:
+            raise RUnavailableError("R is wedged and the worker is being replaced")
+        if timeout is None:
+            timeout = _call_timeout.get() or DEFAULT_TIMEOUT
+        self._ensure_thread()
+        call = _RCall(name, function)
+        self._queue.put((_call_priority.get(), next(self._arrivals), call))
+        try:
+            return call.future.result(timeout)
+        except FutureTimeoutError:
+            pass
+
+        if call.future.cancel():
+            phase = "queued"
+        else:
+            self._interrupt(call)
+            try:
+                # Finished on its own just as the deadline passed
+                return call.future.result(self.grace)
+            except FutureTimeoutError:
+                phase = "wedged"
+                self._wedge(call)
+            except Exception:
+                phase = "interrupted"
+        (self.probe_timeouts if probe else self.timeouts)[phase] += 1
+        logger.warning(f"R call {name} exceeded its {timeout:g} s deadline ({phase})")
+        raise RTimeoutError(name, timeout, phase)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            current = self._current.name if self._current is not None else None
+        return {
+            "wedged": self.wedged,
+            "running": current,
+            "queued": self._queue.qsize(),
+            "timeout_s": DEFAULT_TIMEOUT,
+            "interrupt_grace_s": self.grace,
+            "timeouts": dict(self.timeouts),
+            "probe_timeouts": dict(self.probe_timeouts),
+        }
+
+
+executor = RExecutor()
+
+
+class RFunction:
+    """A sourced R function whose calls are serialized, deadline-bounded and observable"""
+
+    def __init__(self, name: str, function):
+        self.name = name
+        self.function = function
+
+    def _invoke(self, args, kwargs):
+        observer = r_call_observer.get()
+        if observer is None:
+            return self.function(*args, **kwargs)
+        with observer.observe(self.name):
+            return self.function(*args, **kwargs)
+
+    def __call__(self, *args, **kwargs):
+        return executor.call(self.name, lambda: self._invoke(args, kwargs))
+
+    def __repr__(self) -> str:
+        return f"<RFunction {self.name}>"
+
+
+def is_initialized() -> bool:
+    """Whether R has been started and every script sourced"""
+    return _robjects is not None
+
+
+def scripts_digest() -> str:
+    """Hash of every sourced script, stored in the image to detect stale images"""
+    digest = hashlib.sha256()
+    for script in sorted(set(R_FUNCTIONS.values())):
+        digest.update(script.encode())
+        digest.update((SCRIPT_DIR / script).read_bytes())
+    return digest.hexdigest()
+
+
+def _r_string(value: str) -> str:
+    return '"' + value.replace("\\", "/").replace('"', '\\"') + '"'
+
+
+def _source_scripts(robjects):
+    for script in sorted(set(R_FUNCTIONS.values())):
+        with startup_timer.phase(f"source:{script}"):
+            robjects.r.source(str(SCRIPT_DIR / script))
+
+
+def _restore_image(robjects, path: Path) -> bool:
+    """Attach the image's packages and copy its functions into the global environment"""
+    if not path.is_file():
+        return False
+    with startup_timer.phase("image:load"):
+        robjects.r(f".powergpt_image <- new.env(); load({_r_string(str(path))}, envir = .powergpt_image)")
+        recorded = robjects.r('if (exists(".powergpt_digest", envir = .powergpt_image, inherits = FALSE)) '
+                              '.powergpt_image$.powergpt_digest else ""')[0]
+    if recorded != scripts_digest():
+        robjects.r("rm(.powergpt_image)")
+        logger.warning(f"R session image {path} does not match the current scripts; sourcing them instead")
+        return False
+    with startup_timer.phase("image:packages"):
+        robjects.r("local(for (package in .powergpt_image$.powergpt_packages) "
+                   "suppressPackageStartupMessages(library(package, character.only = TRUE)))")
+    with startup_timer.phase("image:functions"):
+        robjects.r("local(for (name in .powergpt_image$.powergpt_functions) "
+                   "assign(name, get(name, envir = .powergpt_image), envir = globalenv())); "
+                   "rm(.powergpt_image)")
+    logger.info(f"Restored R session image {path}")
+    return True
+
+
+def build_image(path: Path = IMAGE_PATH) -> Dict[str, Any]:
+    """
+    Source every script, byte-compile the functions and save them with the attached package list
+
+    Returns the packages and functions written to the image.
+    """
+    import rpy2.robjects as robjects
+
+    _source_scripts(robjects)
+    names = sorted(R_FUNCTIONS)
+    packages: List[str] = [package for package in robjects.r(".packages()") if package not in DEFAULT_PACKAGES]
+    # .packages() lists the most recently attached first; restore in attach order
+    packages.reverse()
+    robjects.globalenv[".powergpt_functions"] = robjects.StrVector(names)
+    robjects.globalenv[".powergpt_packages"] = robjects.StrVector(packages)
+    robjects.globalenv[".powergpt_digest"] = robjects.StrVector([scripts_digest()])
+    robjects.r("local(for (name in .powergpt_functions) "
+               "assign(name, compiler::cmpfun(get(name, envir = globalenv())), envir = globalenv()))")
+    robjects.r(f"save(list = c(.powergpt_functions, '.powergpt_functions', '.powergpt_packages', "
+               f"'.powergpt_digest'), file = {_r_string(str(path))})")
+    return {"path": str(path), "packages": packages, "functions": names}
+
+
+def initialize():
+    """Start R and restore the session image, or source every statistical script once"""
+    global _robjects
+    with _init_lock:
+        if _robjects is not None:
+            return
+
+        with startup_timer.phase("r_init"):
+            import rpy2.robjects as robjects
+
+        if not _restore_image(robjects, IMAGE_PATH):
+            _source_scripts(robjects)
+
+        with startup_timer.phase("r_lookup"):
+            for name in R_FUNCTIONS:
+                _functions[name] = RFunction(name, robjects.globalenv[name])
+
+        _robjects = robjects
+        logger.info(f"R session ready with {len(_functions)} functions")
+
+
+def get_function(name: str):
+    """Return a preloaded R function, initializing R on first use"""
+    if _robjects is None:
+        initialize()
+    return _functions[name]
+
+
+def evaluate(expression: str):
+    """Evaluate an R expression on the R thread"""
+    if _robjects is None:
+        initialize()
+    return executor.call(expression, lambda: _robjects.r(expression))
+
+
+def warm_up() -> Dict[str, float]:
+    """
+    Call every R function once with representative inputs; returns seconds per function
+
+    A function that fails is logged and recorded as not warm instead of
+    aborting startup, so the worker stays up but never reports ready.
+    """
+    timings = {}
+    for name, args in WARMUP_CALLS.items():
+        with startup_timer.phase(f"warm:{name}"), call_timeout(WARMUP_TIMEOUT):
+            started = time.perf_counter()
+            try:
+                get_function(name)(*args)
+                error = None
+            except Exception as e:
+                logger.error(f"Warm-up call of {name} failed: {e}")
+                error = str(e)
+            timings[name] = time.perf_counter() - started
+            _warm_results[name] = {"ok": error is None, "ms": round(timings[name] * 1000, 2),
+                                   "at": time.time(), "error": error}
+    return timings
+
+
+def warm_status() -> Dict[str, Dict[str, Any]]:
+    """Outcome, duration and time of the last warm-up call of each R function"""
+    return {name: dict(result) for name, result in _warm_results.items()}
+
+
+def is_warm() -> bool:
+    """Whether R is initialized, not wedged, and every function answered its last warm-up call"""
+    return is_initialized() and not executor.wedged and all(_warm_results.get(name, {}).get("ok") for name in WARMUP_CALLS)
+
+
+def probe(timeout: float = 0.5) -> Optional[float]:
+    """
+    Seconds taken by one trivial R call, or None when R stays busy for ``timeout`` seconds
+
+    Raises whatever the call raises, so a broken R session is reported as such.
+    """
+    if not is_initialized():
+        raise RuntimeError("R is not initialized")
+    started = time.perf_counter()
+    try:
+        executor.call("probe", lambda: _functions["add_numbers"].function(1, 2), timeout, probe=True)
+    except RTimeoutError as e:
+        if e.phase == "queued":
+            return None
+        raise
+    return time.perf_counter() - started
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+PowerGPT Production Server
+==========================
+Runs the backend API with several worker processes under gunicorn.
+
+Usage:
+    python serve.py [--port 5001] [--workers 4] [--max-requests 1000] [--max-rss-mb 1024]
+
+Every option can also be set through the environment (POWERGPT_PORT,
+POWERGPT_WORKERS, POWERGPT_MAX_REQUESTS, POWERGPT_MAX_RSS_MB,
+POWERGPT_TIMEOUT). The application is imported in each worker after the
+fork (``preload_app`` is off), so every worker starts its own R
+interpreter and sources and warms the R scripts in its lifespan handler;
+R is never initialized in the master process. Workers are recycled after
+``max_requests`` requests (with jitter so they do not all restart at
+once) or when their RSS passes ``max_rss_mb``.
+"""
+
+import argparse
+import multiprocessing
+import os
+
+from gunicorn.app.base import BaseApplication
+
+
+class PowerGPTServer(BaseApplication):
+    """Gunicorn application that serves app:app with uvicorn workers"""
+
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # Imported here so it only happens inside the forked worker
+        from app import app
+        return app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the PowerGPT backend with multiple workers")
+    parser.add_argument("--host", default=os.getenv("POWERGPT_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("POWERGPT_PORT", "5001")))
+    parser.add_argument("--workers", type=int,
+                        default=int(os.getenv("POWERGPT_WORKERS", str(multiprocessing.cpu_count()))))
+    parser.add_argument("--max-requests", type=int, default=int(os.getenv("POWERGPT_MAX_REQUESTS", "1000")),
+                        help="Recycle a worker after this many requests (0 disables)")
+    parser.add_argument("--max-rss-mb", type=float, default=float(os.getenv("POWERGPT_MAX_RSS_MB", "0")),
+                        help="Recycle a worker once its peak RSS exceeds this many MiB (0 disables)")
+    parser.add_argument("--timeout", type=int, default=int(os.getenv("POWERGPT_TIMEOUT", "120")),
+                        help="Seconds a silent worker may take (including R startup) before it is restarted")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # Read by RSSRecycleMiddleware inside each worker
+    os.environ["POWERGPT_MAX_RSS_MB"] = str(args.max_rss_mb)
+    options = {
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": False,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": max(args.max_requests // 10, 0),
+        "timeout": args.timeout,
+        "graceful_timeout": 30,
+    }
+    print(f"Starting PowerGPT backend on {options['bind']} with {args.workers} workers")
+    PowerGPTServer(options).run()
+
+
+if __name__ == "__main__":
+    main()
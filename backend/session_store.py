@@ -0,0 +1,264 @@
+"""
+PowerGPT Session Store
+======================
+Conversation state for /ai/query follow-ups.
+
+A chat session remembers the last extracted test and parameters. A
+follow-up such as "what about 90%?" or "and with d = 0.3?" is resolved
+with rules, as a parameter delta against that extraction, so it needs no
+extraction call to the model. Follow-ups the rules cannot resolve are sent
+to the model together with the previous extraction.
+
+Statistical results are deterministic for a (test, parameters) pair, so
+they are kept in a bounded LRU cache shared by all sessions.
+"""
+
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from single_flight import canonical_key
+
+
+class SessionState:
+    """What a session last asked for and got back"""
+
+    __slots__ = ("session_id", "test_type", "parameters", "result", "turns", "updated_at")
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.test_type: Optional[str] = None
+        self.parameters: Optional[Dict[str, Any]] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.turns = 0
+        self.updated_at = time.monotonic()
+
+
+class SessionStore:
+    """In-memory sessions with an idle TTL and an LRU size bound"""
+
+    def __init__(self, ttl: float = 1800.0, max_sessions: int = 10000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "SessionStore":
+        return cls(
+            ttl=float(os.getenv("POWERGPT_SESSION_TTL", "1800")),
+            max_sessions=int(os.getenv("POWERGPT_SESSION_MAX", "10000")),
+        )
+
+    @staticmethod
+    def new_session_id() -> str:
+        return uuid.uuid4().hex
+
+    def _expire(self, now: float):
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.updated_at < self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+
+    def get(self, session_id: str) -> Optional[SessionState]:
+        """The live state of a session, or None when unknown or expired"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            return self._sessions.get(session_id)
+
+    def update(self, session_id: str, test_type: str, parameters: Dict[str, Any], result: Dict[str, Any]):
+        """Record the latest extraction and result of a session"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._sessions.pop(session_id, None) or SessionState(session_id)
+            state.test_type = test_type
+            state.parameters = dict(parameters)
+            state.result = result
+            state.turns += 1
+            state.updated_at = now
+            self._sessions[session_id] = state
+            self._expire(now)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire(time.monotonic())
+            return {"active_sessions": len(self._sessions), "ttl_s": self.ttl, "max_sessions": self.max_sessions}
+
+
+class ResultCache:
+    """LRU cache of statistical results keyed by (test, parameters)"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(test_type: str, parameters: Dict[str, Any]) -> str:
+        return canonical_key(test_type, parameters)
+
+    def get(self, test_type: str, parameters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        key = self.key(test_type, parameters)
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(result)
+
+    def put(self, test_type: str, parameters: Dict[str, Any], result: Dict[str, Any]):
+        key = self.key(test_type, parameters)
+        with self._lock:
+            self._entries[key] = dict(result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses}
+
+
+# Phrases naming a parameter -> parameter names it can refer to, in order of preference
+PARAMETER_ALIASES = [
+    (r"power", ["power"]),
+    (r"effect\s*size|cohen'?s\s*d|\bes", ["d", "f", "w", "r", "f2", "h"]),
+    (r"standard\s+deviation|\bsd|sigma", ["sd"]),
+    (r"mean\s+difference|difference|delta", ["delta", "d"]),
+    (r"hazard\s+ratio|\bhr", ["theta", "RR"]),
+    (r"risk\s+ratio|relative\s+risk|\brr", ["RR"]),
+    (r"degrees?\s+of\s+freedom|\bdf", ["df"]),
+    (r"groups", ["k"]),
+    (r"allocation\s+ratio|ratio", ["k"]),
+    (r"predictors|numerator\s+df", ["u"]),
+    (r"correlation", ["r"]),
+    (r"event\s+rate", ["psi"]),
+]
+
+# Parameters that are probabilities, so "30%" means 0.3
+PROBABILITY_PARAMETERS = {"power", "p", "p0", "p1", "p2", "pE", "pC", "psi"}
+
+# Only explicit wording changes the alternative: "increase power" or "lower d" modify another parameter
+_DIRECTED = r"\b(?:alternative|one[\s-]*(?:sided|tailed))\W+(?:(?:is|to|of|as|set\s+to)\W+)?"
+ALTERNATIVE_PHRASES = [
+    (r"two[\s-]*(?:sided|tailed)", "two.sided"),
+    (_DIRECTED + r"greater\b|\bgreater\s+than\b|\bupper[\s-]*tailed", "greater"),
+    (_DIRECTED + r"less\b|\bless\s+than\b|\blower[\s-]*tailed", "less"),
+    (r"one[\s-]*(?:sided|tailed)", "one.sided"),
+]
+
+# Tests that accept alternative="one.sided" (they infer the direction from the effect)
+ONE_SIDED_TESTS = {"two_proportions_test", "single_proportion_test"}
+
+# Wording that signals a reply to the previous answer rather than a new question
+FOLLOW_UP_CUE = re.compile(
+    r"^\s*(?:what|how)\s+about\b|^\s*what\s+if\b|^\s*(?:and|now|instead|same|with|try|then|also|but)\b"
+    r"|^\s*(?:make|change|set|use|increase|decrease|lower|raise)\b",
+    re.IGNORECASE,
+)
+
+# Words that name a test; a query mentioning one may be switching tests and goes to the model
+TEST_KEYWORDS = re.compile(
+    r"anova|log[\s-]*rank|survival|proportion|regression|chi[\s-]*squared?|t[\s-]*test|wilcoxon|"
+    r"mann[\s-]*whitney|cox|kruskal",
+    re.IGNORECASE,
+)
+
+# Words a follow-up may contain besides the parameters and values it changes. Anything else left over
+# (another quantity, "dropout", "alternative", "greater", a stray number) is not understood, so the
+# query goes to the model rather than being resolved partially.
+FOLLOW_UP_FILLER = frozenset("""
+    a about also an and as at be becomes but by can change could do does equal equals for go how i if
+    in instead is it its just let lets make maybe me now of ok okay on please raise reduce lower
+    increase decrease rather same say set so test than that the then this to try us use value
+    want was we were what with would you
+""".split())
+
+NUMBER = r"(-?\d+(?:\.\d+)?|-?\.\d+)\s*(%?)"
+CONNECTOR = r"\s*(?:=|:|(?:is|was|were|be|becomes|of|to|at|as|equals?|by)\b)?\s*"
+
+
+def _value(number: str, percent: str, parameter: str) -> Any:
+    value = float(number)
+    if percent or (parameter in PROBABILITY_PARAMETERS and value > 1):
+        value /= 100
+    return value
+
+
+def resolve_follow_up(query: str, test_type: str, parameters: Dict[str, Any],
+                      max_words: int = 8) -> Optional[Dict[str, Any]]:
+    """
+    Parameter changes a follow-up asks for, or None when it is not a resolvable follow-up
+
+    Args:
+        query: The follow-up message
+        test_type: Test of the previous turn
+        parameters: Parameters of the previous turn
+        max_words: Queries this short count as follow-ups even without a cue word
+    """
+    text = query.strip()
+    if not text or TEST_KEYWORDS.search(text):
+        return None
+    if not FOLLOW_UP_CUE.search(text) and len(text.split()) > max_words:
+        return None
+
+    changes: Dict[str, Any] = {}
+    consumed = []
+    aliases: List[tuple] = [(re.escape(name), [name]) for name in sorted(parameters, key=len, reverse=True)]
+    aliases += PARAMETER_ALIASES
+
+    for phrase, candidates in aliases:
+        target = next((c for c in candidates if c in parameters and c not in changes), None)
+        if target is None:
+            continue
+        before = re.search(rf"(?<![\w.])(?:{phrase})(?![\w]){CONNECTOR}{NUMBER}", text, re.IGNORECASE)
+        after = re.search(rf"{NUMBER}\s*(?:{phrase})(?![\w])", text, re.IGNORECASE)
+        match = before or after
+        if match:
+            changes[target] = _value(match.group(1), match.group(2), target)
+            consumed.append(match.span())
+
+    # A bare percentage ("what about 90%?") refers to power, unless another probability could be meant
+    other_probabilities = PROBABILITY_PARAMETERS.intersection(parameters) - {"power"}
+    if "power" in parameters and "power" not in changes and not other_probabilities:
+        for bare in re.finditer(r"(\d+(?:\.\d+)?)\s*%", text):
+            if not any(start <= bare.start() < end for start, end in consumed):
+                changes["power"] = float(bare.group(1)) / 100
+                consumed.append(bare.span())
+                break
+
+    if "alternative" in parameters:
+        for phrase, alternative in ALTERNATIVE_PHRASES:
+            match = re.search(phrase, text, re.IGNORECASE)
+            if match:
+                if alternative == "one.sided" and test_type not in ONE_SIDED_TESTS:
+                    return None  # direction is ambiguous; let the model decide
+                changes["alternative"] = alternative
+                consumed.append(match.span())
+                break
+
+    # Resolve only when every number and content word was accounted for
+    leftover = list(text)
+    for start, end in consumed:
+        leftover[start:end] = " " * (end - start)
+    for token in re.findall(r"[a-z']+|\d", "".join(leftover).lower()):
+        if token.isdigit() or token.replace("'", "") not in FOLLOW_UP_FILLER:
+            return None
+
+    for name, value in list(changes.items()):
+        if isinstance(parameters.get(name), int) and not isinstance(parameters.get(name), bool) \
+                and float(value).is_integer():
+            changes[name] = int(value)
+
+    return changes or None
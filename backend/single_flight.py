@@ -0,0 +1,103 @@
+"""
+PowerGPT Single-Flight
+======================
+Coalescing of identical in-flight computations.
+
+When many identical requests arrive together (a class running the same
+example), only the first caller for a key computes; the others wait for
+that computation and receive a copy of its result or its exception.
+Nothing is cached: once the computation finishes, the next caller for the
+key starts a new one.
+"""
+
+import copy
+import functools
+import json
+import re
+import threading
+from typing import Any, Callable, Dict
+
+from pydantic import BaseModel
+
+
+def canonical_key(*parts: Any) -> str:
+    """Stable string key for arbitrarily nested JSON-like values"""
+    return json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def normalize_query(text: str) -> str:
+    """Case-, whitespace- and trailing-punctuation-insensitive form of a query"""
+    return re.sub(r"\s+", " ", text).strip().rstrip("?.!").strip().lower()
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs at most one computation per key at a time and shares its outcome"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Return ``fn()``, or the result of an identical call already in flight"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = fn()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        # Followers deep-copy this object after the event is set; the leader must not modify it
+        return call.result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_flight = len(self._calls)
+        return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": in_flight}
+
+
+# Shared by all /api/v1 statistical endpoints
+statistical_flights = SingleFlight("statistical")
+
+
+def coalesce_requests(test_name: str, flights: SingleFlight = statistical_flights):
+    """Decorator coalescing concurrent handler calls with identical (test, params)"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            params = [a.model_dump() if isinstance(a, BaseModel) else a for a in args]
+            named = {k: v.model_dump() if isinstance(v, BaseModel) else v for k, v in kwargs.items()}
+            key = canonical_key(test_name, params, named)
+            return flights.do(key, lambda: handler(*args, **kwargs))
+        return wrapper
+    return decorator
@@ -0,0 +1,255 @@
+"""
+PowerGPT Survival Designs
+=========================
+Events and sample size for a log-rank / Cox comparison of two arms, with
+staggered accrual, minimum follow-up, piecewise-exponential hazards and
+dropout (Lachin & Foulkes, 1986).
+
+``log_rank_test`` and ``cox_ph`` take the probability of an event "over
+the study" as an input. Here it is derived: a patient entering at time u of
+an accrual period of length R is followed until the analysis at
+T = R + F (F the minimum follow-up), so is observed for tau = T - u, and has
+an event before dropping out with probability
+
+    D(tau) = integral_0^tau lambda(t) exp(-Lambda(t) - eta t) dt
+
+for event hazard lambda (piecewise constant; the experimental arm's is
+RR times the control's) and dropout hazard eta. D is closed-form on each
+hazard piece. The event probability of an arm, P = E[D(T - u)] over the
+accrual distribution of u, is computed with Gauss-Legendre panels that
+split at the hazard breaks, so it is exact to rounding.
+
+With allocation proportions qE = k / (1 + k) and qC = 1 / (1 + k), the
+total sample size follows Lachin and Foulkes on the log hazard ratio
+scale, with the null variance from the pooled events and the alternative
+variance from each arm's events:
+
+    N = (z_a / sqrt(qE qC P) + z_b sqrt(1 / (qE PE) + 1 / (qC PC)))^2 / log(RR)^2
+
+(``method="schoenfeld"``: events = (z_a + z_b)^2 / (qE qC log(RR)^2) and
+N = events / P.) Every input that varies across scenarios (accrual time or
+rate, follow-up, RR, dropout) is broadcast, so a whole trade-off table is
+a handful of array operations. When an accrual rate is given instead of
+an accrual time, the accrual time where rate * R meets the required N is
+found for all scenarios at once by vectorized bisection.
+"""
+
+import math
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+from numpy.polynomial.legendre import leggauss
+from scipy.stats import norm
+
+ALPHA = 0.05
+
+METHODS = ("lachin_foulkes", "schoenfeld")
+
+# Gauss-Legendre nodes per panel of the accrual integral
+PANEL_NODES = 16
+
+# Largest scenario grid one request may ask for
+MAX_SCENARIOS = 10_000
+
+# Bisection steps when solving for the accrual time at a given accrual rate
+RATE_BISECTIONS = 60
+
+_GL_NODES, _GL_WEIGHTS = leggauss(PANEL_NODES)
+
+Values = Union[float, Sequence[float], np.ndarray]
+
+
+def _pieces(hazards: Sequence[float], breaks: Sequence[float]):
+    hazards = np.asarray(hazards, dtype=float)
+    breaks = np.asarray(breaks, dtype=float)
+    if hazards.ndim != 1 or len(hazards) == 0:
+        raise ValueError("hazards must list at least one control-arm hazard rate")
+    if len(breaks) != len(hazards) - 1:
+        raise ValueError("breaks must have one entry fewer than hazards")
+    if np.any(hazards <= 0):
+        raise ValueError("hazard rates must be positive")
+    if np.any(breaks <= 0) or np.any(np.diff(breaks) <= 0):
+        raise ValueError("breaks must be positive and increasing")
+    starts = np.concatenate([[0.0], breaks])
+    ends = np.concatenate([breaks, [np.inf]])
+    return hazards, starts, ends
+
+
+def _event_by(tau: np.ndarray, hazards, starts, ends, hazard_ratio, dropout) -> np.ndarray:
+    """D(tau): probability of an event before dropout within tau of entry; hazard_ratio / dropout broadcast with tau"""
+    event_rate = hazards * hazard_ratio[..., None]  # (..., pieces)
+    total_rate = event_rate + dropout[..., None]
+    # Cumulative hazard (event plus dropout) at the start of each piece
+    widths = ends - starts
+    exposure = total_rate * np.where(np.isfinite(widths), widths, 0.0)  # the open last piece precedes none
+    at_start = np.cumsum(exposure, axis=-1) - exposure
+    share = event_rate / total_rate
+
+    elapsed = np.clip(tau[..., None] - starts, 0.0, widths)  # (..., nodes, pieces)
+    contribution = (share * np.exp(-at_start))[..., None, :] * -np.expm1(-total_rate[..., None, :] * elapsed)
+    return contribution.sum(axis=-1)
+
+
+def event_probability(hazards: Sequence[float], breaks: Sequence[float], hazard_ratio: Values, dropout: Values,
+                      accrual_time: Values, follow_up: Values, accrual_shape: float = 0.0) -> np.ndarray:
+    """
+    Probability that a patient's event is observed by the analysis, broadcast over the scenario arrays
+
+    Args:
+        hazards: Control-arm event hazard rates, one per piece
+        breaks: Times (since entry) where the hazard changes
+        hazard_ratio: Multiplier of the control hazards (1 for the control arm)
+        dropout: Dropout hazard rate
+        accrual_time: Length of the accrual period R
+        follow_up: Minimum follow-up F after the last patient enters
+        accrual_shape: 0 for uniform accrual; gamma != 0 for an entry density proportional to
+            exp(gamma u / R) (gamma > 0: accrual speeds up over time)
+    """
+    hazards, starts, ends = _pieces(hazards, breaks)
+    hazard_ratio, dropout, accrual_time, follow_up = np.broadcast_arrays(
+        *(np.asarray(v, dtype=float) for v in (hazard_ratio, dropout, accrual_time, follow_up)))
+    analysis = accrual_time + follow_up
+
+    # Follow-up times tau run over [F, T]; panel edges at the hazard breaks keep the integrand smooth
+    edges = np.sort(np.concatenate([
+        follow_up[..., None],
+        np.clip(starts[1:], follow_up[..., None], analysis[..., None]),
+        analysis[..., None],
+    ], axis=-1), axis=-1)
+    half = (edges[..., 1:] - edges[..., :-1])[..., None] / 2  # (..., panels, 1)
+    tau = (edges[..., :-1, None] + half * (_GL_NODES + 1)).reshape(*analysis.shape, -1)
+    weights = (half * _GL_WEIGHTS).reshape(*analysis.shape, -1)
+
+    # Entry density at u = T - tau
+    position = ((analysis[..., None] - tau) / accrual_time[..., None])
+    if accrual_shape == 0:
+        density = 1 / accrual_time[..., None] * np.ones_like(position)
+    else:
+        density = accrual_shape / accrual_time[..., None] * np.exp(accrual_shape * position) / math.expm1(accrual_shape)
+
+    events = _event_by(tau, hazards, starts, ends, hazard_ratio, dropout)
+    return (weights * density * events).sum(axis=-1)
+
+
+def _total_n(p_e, p_c, hazard_ratio, k: float, power: float, method: str):
+    q_e, q_c = k / (1 + k), 1 / (1 + k)
+    z_a, z_b = norm.isf(ALPHA / 2), norm.isf(1 - power)
+    pooled = q_e * p_e + q_c * p_c
+    log_hr2 = np.log(hazard_ratio) ** 2
+    if method == "schoenfeld":
+        events = (z_a + z_b) ** 2 / (q_e * q_c * log_hr2)
+        return events / pooled, pooled
+    root_n = z_a / np.sqrt(q_e * q_c * pooled) + z_b * np.sqrt(1 / (q_e * p_e) + 1 / (q_c * p_c))
+    return root_n ** 2 / log_hr2, pooled
+
+
+def _required(hazards, breaks, hazard_ratio, dropout, accrual_time, follow_up, accrual_shape, k, power, method):
+    p_c = event_probability(hazards, breaks, 1.0, dropout, accrual_time, follow_up, accrual_shape)
+    p_e = event_probability(hazards, breaks, hazard_ratio, dropout, accrual_time, follow_up, accrual_shape)
+    n, pooled = _total_n(p_e, p_c, hazard_ratio, k, power, method)
+    return n, p_e, p_c, pooled
+
+
+def _solve_accrual_time(rate, hazards, breaks, hazard_ratio, dropout, follow_up, accrual_shape, k, power, method):
+    """Accrual time R with rate * R = N(R), for every scenario at once"""
+    # N(R) falls as R grows (longer follow-up), so rate * R - N(R) is increasing in R
+    def gap(accrual_time):
+        return rate * accrual_time - _required(hazards, breaks, hazard_ratio, dropout, accrual_time, follow_up,
+                                               accrual_shape, k, power, method)[0]
+
+    low = np.zeros_like(rate)
+    high = np.ones_like(rate)
+    for _ in range(64):
+        short = gap(high) < 0
+        if not short.any():
+            break
+        low = np.where(short, high, low)
+        high = np.where(short, high * 2, high)
+    else:
+        raise ValueError("The accrual rate is too low to reach the required sample size")
+    for _ in range(RATE_BISECTIONS):
+        middle = (low + high) / 2
+        short = gap(middle) < 0
+        low = np.where(short, middle, low)
+        high = np.where(short, high, middle)
+    return high
+
+
+def survival_design(power: float, RR: Values, hazards: Sequence[float], breaks: Sequence[float] = (),
+                    k: float = 1.0, dropout: Values = 0.0, accrual_time: Optional[Values] = None,
+                    accrual_rate: Optional[Values] = None, follow_up: Values = 0.0, accrual_shape: float = 0.0,
+                    method: str = "lachin_foulkes") -> Dict[str, Any]:
+    """
+    Required events and sample size, for one scenario or the grid of all listed values
+
+    Args:
+        power: Target power (two-sided 5% level)
+        RR: Hazard ratio, experimental over control
+        hazards: Control-arm hazard rates, one per piece
+        breaks: Times since entry where the hazard changes
+        k: Allocation ratio, experimental to control (as in log_rank_test)
+        dropout: Dropout hazard rate, the same in both arms
+        accrual_time: Length of the accrual period
+        accrual_rate: Patients enrolled per time unit (instead of accrual_time)
+        follow_up: Minimum follow-up after the last patient enters
+        accrual_shape: Shape of the entry distribution (0: uniform)
+        method: "lachin_foulkes" or "schoenfeld"
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {', '.join(METHODS)}")
+    if (accrual_time is None) == (accrual_rate is None):
+        raise ValueError("Give exactly one of accrual_time and accrual_rate")
+    hazards, starts, _ = _pieces(hazards, breaks)
+    breaks = starts[1:]
+
+    # Every listed input becomes an axis of the scenario grid
+    varying = {"RR": RR, "dropout": dropout, "follow_up": follow_up}
+    varying["accrual_time" if accrual_time is not None else "accrual_rate"] = (
+        accrual_time if accrual_time is not None else accrual_rate)
+    axes = {name: np.atleast_1d(np.asarray(value, dtype=float)) for name, value in varying.items()}
+    if any(values.ndim != 1 or values.size == 0 for values in axes.values()):
+        raise ValueError("Scenario inputs must be numbers or non-empty lists of numbers")
+    size = math.prod(values.size for values in axes.values())
+    if size > MAX_SCENARIOS:
+        raise ValueError(f"At most {MAX_SCENARIOS} scenarios per request; this grid has {size}")
+    grid = dict(zip(axes, (values.ravel() for values in np.meshgrid(*axes.values(), indexing="ij"))))
+
+    if np.any(grid["RR"] <= 0) or np.any(grid["RR"] == 1):
+        raise ValueError("RR must be positive and differ from 1")
+    if np.any(grid["dropout"] < 0) or np.any(grid["follow_up"] < 0):
+        raise ValueError("dropout and follow_up must be non-negative")
+    if accrual_time is None:
+        if np.any(grid["accrual_rate"] <= 0):
+            raise ValueError("accrual_rate must be positive")
+        grid["accrual_time"] = _solve_accrual_time(
+            grid["accrual_rate"], hazards, breaks, grid["RR"], grid["dropout"], grid["follow_up"], accrual_shape,
+            k, power, method)
+    elif np.any(grid["accrual_time"] <= 0):
+        raise ValueError("accrual_time must be positive")
+
+    n, p_e, p_c, pooled = _required(hazards, breaks, grid["RR"], grid["dropout"], grid["accrual_time"],
+                                    grid["follow_up"], accrual_shape, k, power, method)
+    # Per-arm sizes rounded up as log_rank_test does
+    n_c = np.ceil(n / (1 + k))
+    n_e = np.ceil(k * n / (1 + k))
+    columns = {
+        "RR": grid["RR"],
+        "dropout": grid["dropout"],
+        "accrual_time": grid["accrual_time"],
+        "follow_up": grid["follow_up"],
+        "study_duration": grid["accrual_time"] + grid["follow_up"],
+        "pE": p_e,
+        "pC": p_c,
+        "events": np.ceil(n * pooled - 1e-9),
+        "n_total": n_e + n_c,
+        "accrual_rate": grid["accrual_rate"] if accrual_time is None else (n_e + n_c) / grid["accrual_time"],
+        "result": np.stack([n_e, n_c], axis=-1),
+    }
+    rows: List[Dict[str, Any]] = [
+        {name: (values[i].tolist() if name == "result" else float(values[i])) for name, values in columns.items()}
+        for i in range(size)
+    ]
+    report = {"method": method, "k": k, "power": power}
+    if size == 1:
+        return {**report, **rows[0]}
+    return {**report, "scenarios": rows}
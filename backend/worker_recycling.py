@@ -0,0 +1,49 @@
+"""
+PowerGPT Worker Recycling
+=========================
+Memory-based recycling for server workers.
+
+R allocations are rarely returned to the operating system, so a long-lived
+worker's resident set only grows. When ``POWERGPT_MAX_RSS_MB`` is set, the
+middleware checks the worker's peak RSS after each response and, once it
+is over the limit, asks the worker to shut down gracefully with SIGTERM.
+The process manager (gunicorn, see ``serve.py``) then starts a fresh
+worker in its place. Request-count recycling is handled by gunicorn's
+``max_requests`` setting.
+"""
+
+import logging
+import os
+import resource
+import signal
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in KiB elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class RSSRecycleMiddleware:
+    """ASGI middleware that retires the worker once it exceeds an RSS threshold"""
+
+    def __init__(self, app, max_rss_mb: float = None):
+        self.app = app
+        if max_rss_mb is None:
+            max_rss_mb = float(os.getenv("POWERGPT_MAX_RSS_MB", "0"))
+        self.max_rss_mb = max_rss_mb
+        self.recycling = False
+
+    async def __call__(self, scope, receive, send):
+        await self.app(scope, receive, send)
+        if scope["type"] != "http" or self.max_rss_mb <= 0 or self.recycling:
+            return
+        rss = peak_rss_mb()
+        if rss > self.max_rss_mb:
+            self.recycling = True
+            logger.warning(f"Worker {os.getpid()} peak RSS {rss:.0f} MiB exceeds {self.max_rss_mb:.0f} MiB; recycling")
+            os.kill(os.getpid(), signal.SIGTERM)
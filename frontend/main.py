@@ -1,7 +1,6 @@
 from fastapi import FastAPI, Request
 from fastapi import Form, BackgroundTasks
 from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
 import json
@@ -9,150 +8,72 @@ import threading
 from dotenv import load_dotenv
 import os
 import requests
+from page_cache import PageCache
+from static_assets import FingerprintedStaticFiles, StaticManifest
 
 # Load environment variables from .env file
 load_dotenv()
 app = FastAPI()
 file_lock = threading.Lock()  # Create a lock for safe writing
 
-# Mount static files directory
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Fingerprint static assets and mount them with immutable caching
+static_manifest = StaticManifest.build("static")
+app.mount("/static", FingerprintedStaticFiles(manifest=static_manifest), name="static")
 
 # Set up templates directory
 templates = Jinja2Templates(directory="templates")
 
-# Serve the index page
-@app.get("/", response_class=HTMLResponse)
-async def read_index(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
-
-# Route for UPenn
-@app.get("/upenn", response_class=HTMLResponse)
-async def upenn(request: Request):
-    return templates.TemplateResponse("university_page.html", {
-        "request": request,
-        "university_name": "University of Pennsylvania",
-        "university_logo": "/static/assets/upenn_logo.png"
+# Landing pages for partner institutions: route slug, display name and logo
+INSTITUTIONS = [
+    ("upenn", "University of Pennsylvania", "/static/assets/upenn_logo.png"),
+    ("uthealth", "UTHealth", "/static/assets/uthealth_logo.png"),
+    ("yale", "Yale University", "/static/assets/yale_logo.png"),
+    ("iowa", "University of Iowa", "/static/assets/iowa_logo.png"),
+    ("mayo", "Mayo Clinic", "/static/assets/mayo_logo.png"),
+    ("jhu", "Johns Hopkins University", "/static/assets/jhu.jpg"),
+    ("wustl", "Washington University in St. Louis", "/static/assets/WUSTL.png"),
+    ("pennState", "The Pennsylvania State University", "/static/assets/PennState.png"),
+    ("UPitts", "University of Pittsburgh", "/static/assets/UPitts.png"),
+    ("pfizer", "Pfizer", "/static/assets/Pfizer.jpg"),
+    ("UKentucky", "University of Kentucky", "/static/assets/UKentucky.png"),
+    ("Scripps", "Scripps Research", "/static/assets/Scripps.png"),
+    ("Tufts", "Tufts University", "/static/assets/Tufts_University_wordmark.png"),
+    ("utmb", "The University of Texas Medical Branch", "/static/assets/utmb-logo.png"),
+    ("others", "Other Institutions", "/static/assets/institution4.png"),
+]
+
+# Pages are rendered once and served from memory with ETags and precompressed variants
+page_cache = PageCache(templates, postprocess=static_manifest.rewrite)
+page_cache.register("index", "index.html")
+page_cache.register("ai-chat", "ai_chat_interface.html")
+for slug, university_name, university_logo in INSTITUTIONS:
+    page_cache.register(slug, "university_page.html", {
+        "university_name": university_name,
+        "university_logo": university_logo
     })
 
-# Route for UTHealth
-@app.get("/uthealth", response_class=HTMLResponse)
-async def uthealth(request: Request):
-    return templates.TemplateResponse("university_page.html", {
-        "request": request,
-        "university_name": "UTHealth",
-        "university_logo": "/static/assets/uthealth_logo.png"
-    })
+@app.on_event("startup")
+def warm_page_cache():
+    page_cache.warm()
 
-# Route for Yale
-@app.get("/yale", response_class=HTMLResponse)
-async def yale(request: Request):
-    return templates.TemplateResponse("university_page.html", {
-        "request": request,
-        "university_name": "Yale University",
-        "university_logo": "/static/assets/yale_logo.png"
-    })
+def cached_page_route(key):
+    async def serve_page(request: Request):
+        return page_cache.get(key).response(request)
+    return serve_page
 
-# Route for Iowa
-@app.get("/iowa", response_class=HTMLResponse)
-async def iowa(request: Request):
-    return templates.TemplateResponse("university_page.html", {
-        "request": request,
-        "university_name": "University of Iowa",
-        "university_logo": "/static/assets/iowa_logo.png"
-    })
-
-
-# Route for Mayo
-@app.get("/mayo", response_class=HTMLResponse)
-async def mayo(request: Request):
-    return templates.TemplateResponse("university_page.html", {
-        "request": request,
-        "university_name": "Mayo Clinic",
-        "university_logo": "/static/assets/mayo_logo.png"
-    })
-    
-
-@app.get("/jhu", response_class=HTMLResponse)
-async def jhu(request: Request):
-    return templates.TemplateResponse("university_page.html", {
-        "request": request,
-        "university_name": "Johns Hopkins University",
-        "university_logo": "/static/assets/jhu.jpg"
-    })
+# Serve the index page
+@app.get("/", response_class=HTMLResponse)
+async def read_index(request: Request):
+    return page_cache.get("index").response(request)
 
- 
-@app.get("/wustl", response_class=HTMLResponse)
-async def wustl(request: Request):
-    return templates.TemplateResponse("university_page.html", {
-        "request": request,
-        "university_name": "Washington University in St. Louis",
-        "university_logo": "/static/assets/WUSTL.png"
-    })
-@app.get("/pennState", response_class=HTMLResponse)
-async def pennState(request: Request):
-    return templates.TemplateResponse("university_page.html", {
-        "request": request,
-        "university_name": "The Pennsylvania State University",
-        "university_logo": "/static/assets/PennState.png"
-    })   
-  
-
-@app.get("/UPitts", response_class=HTMLResponse)
-async def UPitts(request: Request):
-    return templates.TemplateResponse("university_page.html", {
-        "request": request,
-        "university_name": "University of Pittsburgh",
-        "university_logo": "/static/assets/UPitts.png"
-    }) 
-
-@app.get("/pfizer", response_class=HTMLResponse)
-async def pfizer(request: Request):
-    return templates.TemplateResponse("university_page.html", {
-        "request": request,
-        "university_name": "Pfizer",
-        "university_logo": "/static/assets/pfizer.jpg"
-    }) 
-@app.get("/UKentucky", response_class=HTMLResponse)
-async def UKentucky(request: Request):
-    return templates.TemplateResponse("university_page.html", {
-        "request": request,
-        "university_name": "University of Kentucky",
-        "university_logo": "/static/assets/UKentucky.png"
-    })
-@app.get("/Scripps", response_class=HTMLResponse)
-async def Scripps(request: Request):
-    return templates.TemplateResponse("university_page.html", {
-        "request": request,
-        "university_name": "Scripps Research",
-        "university_logo": "/static/assets/Scripps.png"
-    })
-@app.get("/Tufts", response_class=HTMLResponse)
-async def Tufts(request: Request):
-    return templates.TemplateResponse("university_page.html", {
-        "request": request,
-        "university_name": "Tufts University",
-        "university_logo": "/static/assets/Tufts_University_wordmark.png"
-    })
-@app.get("/utmb", response_class=HTMLResponse)
-async def utmb(request: Request):
-    return templates.TemplateResponse("university_page.html", {
-        "request": request,
-        "university_name": "The University of Texas Medical Branch",
-        "university_logo": "/static/assets/utmb-logo.png"
-    })   
-@app.get("/others", response_class=HTMLResponse)
-async def others(request: Request):
-    return templates.TemplateResponse("university_page.html", {
-        "request": request,
-        "university_name": "Other Institutions",
-        "university_logo": "/static/assets/institution4.png"
-    })
+# Routes for each institution
+for slug, _, _ in INSTITUTIONS:
+    app.add_api_route(f"/{slug}", cached_page_route(slug), methods=["GET"], response_class=HTMLResponse, name=slug)
 
-@app.get("/ai-chat")
-async def ai_chat_interface():
+@app.get("/ai-chat", response_class=HTMLResponse)
+async def ai_chat_interface(request: Request):
     """Serve the AI chat interface"""
-    return templates.TemplateResponse("ai_chat_interface.html", {"request": {}})
+    return page_cache.get("ai-chat").response(request)
 
 # Get real count stats data
 STATS_FILE = "stats.json"
@@ -0,0 +1,147 @@
+"""
+PowerGPT Page Cache
+===================
+In-memory cache for pre-rendered HTML pages.
+
+Each page is rendered through Jinja2 once, hashed into a strong ETag and
+precompressed with gzip (and brotli when the ``brotli`` package is
+installed). Requests are then answered straight from memory, and
+conditional GETs that match the current ETag get an empty 304.
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+PAGE_CACHE_CONTROL = os.getenv("PAGE_CACHE_CONTROL", "public, max-age=600, must-revalidate")
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """Parse an Accept-Encoding header into a {coding: q} mapping"""
+    codings = {}
+    for part in (header or "").split(","):
+        fields = part.strip().split(";")
+        coding = fields[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in fields[1:]:
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def choose_encoding(header: Optional[str], available) -> str:
+    """Pick the best content coding offered by the client, preferring brotli"""
+    codings = parse_accept_encoding(header)
+    for coding in ("br", "gzip"):
+        if coding not in available:
+            continue
+        q = codings.get(coding, codings.get("*", 0.0))
+        if q > 0:
+            return coding
+    return "identity"
+
+
+def etag_matches(header: Optional[str], etags) -> bool:
+    """Weak comparison of an If-None-Match header against a set of ETags"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in etags:
+            return True
+    return False
+
+
+class CachedPage:
+    """A rendered representation held in memory with its compressed variants"""
+
+    def __init__(self, body: bytes, media_type: str, cache_control: str = PAGE_CACHE_CONTROL):
+        self.media_type = media_type
+        self.cache_control = cache_control
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        # Every content coding is a distinct representation, so each gets its own strong ETag
+        self.variants = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(body, quality=11)
+        self.etags = {
+            coding: f'"{digest}"' if coding == "identity" else f'"{digest}-{coding}"'
+            for coding in self.variants
+        }
+
+    def response(self, request: Request) -> Response:
+        """Serve the best variant for the request, or 304 when the client copy is current"""
+        encoding = choose_encoding(request.headers.get("accept-encoding"), self.variants)
+        headers = {
+            "ETag": self.etags[encoding],
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        # Only the negotiated variant counts: a client holding another coding has not got this one
+        if etag_matches(request.headers.get("if-none-match"), {self.etags[encoding]}):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=self.variants[encoding], media_type=self.media_type, headers=headers)
+
+
+class PageCache:
+    """Lazily renders and memoizes pages by key"""
+
+    def __init__(self, templates, postprocess: Optional[Callable[[str], str]] = None):
+        self.templates = templates
+        self.postprocess = postprocess
+        self._renderers: Dict[str, Callable[[], str]] = {}
+        self._pages: Dict[str, CachedPage] = {}
+        self._lock = threading.Lock()
+
+    def register(self, key: str, template_name: str, context: Optional[Dict[str, Any]] = None):
+        """Register a page to be rendered from a template with a fixed context"""
+        context = dict(context or {})
+        self._renderers[key] = lambda: self.templates.get_template(template_name).render(**context)
+        self._pages.pop(key, None)
+
+    def get(self, key: str) -> CachedPage:
+        """Return the cached page, rendering it on first use"""
+        page = self._pages.get(key)
+        if page is None:
+            with self._lock:
+                page = self._pages.get(key)
+                if page is None:
+                    html = self._renderers[key]()
+                    if self.postprocess is not None:
+                        html = self.postprocess(html)
+                    body = html.encode("utf-8")
+                    page = CachedPage(body, "text/html; charset=utf-8")
+                    self._pages[key] = page
+        return page
+
+    def warm(self):
+        """Render every registered page up front"""
+        for key in self._renderers:
+            self.get(key)
+
+    def clear(self):
+        """Drop rendered pages so they are rebuilt on next access"""
+        with self._lock:
+            self._pages.clear()
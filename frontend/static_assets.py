@@ -0,0 +1,119 @@
+"""
+PowerGPT Static Assets
+======================
+Fingerprinted static asset pipeline.
+
+At startup every file under ``static/`` is content-hashed and given a
+fingerprinted name (``style.css`` -> ``style.<hash>.css``). Rendered pages
+have their ``/static/...`` references rewritten to those names, which are
+then served with a one-year ``immutable`` Cache-Control, so repeat visits
+never revalidate. Text assets are precompressed in memory. Requests for
+the original, unfingerprinted names still work but must revalidate.
+"""
+
+import hashlib
+import mimetypes
+import os
+import re
+from pathlib import Path
+from typing import Dict
+
+from fastapi.staticfiles import StaticFiles
+from starlette.requests import Request
+
+from page_cache import CachedPage
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+# Assets worth compressing; images are already compressed
+TEXT_SUFFIXES = {".css", ".js", ".html", ".svg", ".json", ".txt", ".map"}
+
+# Absolute /static/... references inside quotes or url(...)
+STATIC_REFERENCE = re.compile(r"""(?P<open>["'(])/static/(?P<path>[^"'()]+)(?P<close>["')])""")
+
+
+class StaticManifest:
+    """Maps static asset paths to their content-fingerprinted names"""
+
+    def __init__(self, directory: str, url_prefix: str = "/static"):
+        self.directory = Path(directory)
+        self.url_prefix = url_prefix
+        self.fingerprinted: Dict[str, str] = {}  # original relative path -> fingerprinted path
+        self.originals: Dict[str, str] = {}  # fingerprinted relative path -> original path
+        self.text_assets: Dict[str, CachedPage] = {}  # fingerprinted path -> precompressed body
+
+    @classmethod
+    def build(cls, directory: str, url_prefix: str = "/static") -> "StaticManifest":
+        """Hash every file under ``directory`` and precompress text assets"""
+        manifest = cls(directory, url_prefix)
+        bodies = {}
+        for file_path in sorted(manifest.directory.rglob("*")):
+            if file_path.is_file():
+                bodies[file_path.relative_to(manifest.directory).as_posix()] = file_path.read_bytes()
+
+        # Text assets can reference other assets, so hash them after rewriting those references
+        binaries = {p: b for p, b in bodies.items() if Path(p).suffix.lower() not in TEXT_SUFFIXES}
+        texts = {p: b for p, b in bodies.items() if p not in binaries}
+        for path, body in binaries.items():
+            manifest._add(path, body)
+        for path, body in texts.items():
+            body = manifest.rewrite(body.decode("utf-8")).encode("utf-8")
+            fingerprinted = manifest._add(path, body)
+            media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            if media_type.startswith("text/") or media_type.endswith(("javascript", "json", "svg+xml")):
+                media_type += "; charset=utf-8"
+            manifest.text_assets[fingerprinted] = CachedPage(body, media_type, IMMUTABLE_CACHE_CONTROL)
+        return manifest
+
+    def _add(self, path: str, body: bytes) -> str:
+        digest = hashlib.sha256(body).hexdigest()[:12]
+        stem, dot, suffix = path.rpartition(".")
+        if not dot or "/" in suffix:
+            fingerprinted = f"{path}.{digest}"
+        else:
+            fingerprinted = f"{stem}.{digest}.{suffix}"
+        self.fingerprinted[path] = fingerprinted
+        self.originals[fingerprinted] = path
+        return fingerprinted
+
+    def url(self, path: str) -> str:
+        """Return the fingerprinted URL for a static path, or the plain URL if unknown"""
+        path = path.lstrip("/")
+        return f"{self.url_prefix}/{self.fingerprinted.get(path, path)}"
+
+    def rewrite(self, text: str) -> str:
+        """Rewrite ``/static/...`` references in rendered HTML or CSS to fingerprinted URLs"""
+        def replace(match):
+            path = match.group("path")
+            if path not in self.fingerprinted:
+                return match.group(0)
+            return f"{match.group('open')}{self.url(path)}{match.group('close')}"
+        return STATIC_REFERENCE.sub(replace, text)
+
+
+class FingerprintedStaticFiles(StaticFiles):
+    """StaticFiles that serves fingerprinted names with immutable caching"""
+
+    def __init__(self, *, manifest: StaticManifest, **kwargs):
+        super().__init__(directory=str(manifest.directory), **kwargs)
+        self.manifest = manifest
+
+    async def get_response(self, path: str, scope):
+        relative = Path(path).as_posix()
+        text_asset = self.manifest.text_assets.get(relative)
+        if text_asset is not None:
+            return text_asset.response(Request(scope))
+
+        original = self.manifest.originals.get(relative)
+        if original is not None:
+            response = await super().get_response(os.path.normpath(original), scope)
+            if response.status_code in (200, 304):
+                response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+            return response
+
+        # Unfingerprinted URL: the content may change, so make clients revalidate
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+        return response
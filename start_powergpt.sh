@@ -19,7 +19,7 @@ pkill -f uvicorn 2>/dev/null
 # Start backend server
 echo "📊 Starting Backend Server (port 5001)..."
 cd backend
-python -c "import uvicorn; uvicorn.run('app:app', host='0.0.0.0', port=5001, log_level='info')" &
+python serve.py --port 5001 &
 BACKEND_PID=$!
 
 # Wait a moment